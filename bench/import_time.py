@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List
+
+
+# =====================================================
+# 子进程：冷启动 import main 并解析某个子命令用到的生成器
+# （本模块只依赖标准库，不影响被测进程的模块数）
+# =====================================================
+def run_child(command: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    import main
+    from common import providers
+
+    names = list(providers.PROVIDERS) if command == "eager" else main.COMMAND_PROVIDERS[command]
+    for name in names:
+        providers.resolve(name)
+    elapsed = time.perf_counter() - start
+
+    sdks = sorted({m for name in providers.PROVIDERS for m in providers.SDK_MODULES.get(name, ())
+                   if m in sys.modules})
+    return {"import_s": elapsed, "providers": providers.loaded(), "sdks": sdks, "modules": len(sys.modules)}
+
+
+# =====================================================
+# 父进程：每个子命令起 repeat 个全新解释器，取中位数
+# eager 为基线：一次性导入全部生成器（改为按需导入之前 main.py 的行为）
+# =====================================================
+def run_benchmark(commands: List[str], repeat: int = 5) -> List[Dict[str, Any]]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    results = []
+    for command in ["eager"] + [c for c in commands if c != "eager"]:
+        imports, walls, sample = [], [], None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, "-m", "bench.import_time", "--child", command],
+                env=env, check=True, capture_output=True, text=True
+            ).stdout
+            walls.append(time.perf_counter() - start)
+            sample = json.loads(out.strip().splitlines()[-1])
+            imports.append(sample["import_s"])
+        results.append({
+            "command": command,
+            "import_ms": round(statistics.median(imports) * 1000, 1),
+            "import_min_ms": round(min(imports) * 1000, 1),
+            "process_ms": round(statistics.median(walls) * 1000, 1),
+            "providers": sample["providers"],
+            "sdks": sample["sdks"],
+            "modules": sample["modules"]
+        })
+
+    baseline = results[0]["import_ms"]
+    for r in results:
+        r["speedup"] = round(baseline / r["import_ms"], 1) if r["import_ms"] else None
+    return results
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    print(f"{'命令':<8} {'import(ms)':>11} {'min':>8} {'进程(ms)':>9} {'模块数':>7} {'加速':>6}  已加载 SDK")
+    for r in results:
+        print(f"{r['command']:<8} {r['import_ms']:>11} {r['import_min_ms']:>8} {r['process_ms']:>9} "
+              f"{r['modules']:>7} {str(r['speedup']) + 'x':>6}  {', '.join(r['sdks']) or '-'}")
+
+
+def _build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="启动耗时基准：各子命令冷启动时的导入耗时与加载的 SDK")
+    ap.add_argument("--commands", nargs="+", default=["plan", "prompts", "image", "audio", "video", "all"],
+                    help="参与对比的子命令")
+    ap.add_argument("--repeat", type=int, default=5, help="每个子命令启动的解释器次数")
+    ap.add_argument("--out", help="基准报告 JSON 输出路径")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    return ap
+
+
+if __name__ == "__main__":
+
+    args = _build_arg_parser().parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_child(args.child)))
+        sys.exit(0)
+
+    report = run_benchmark(args.commands, args.repeat)
+    print_table(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📝 基准报告已保存至：{args.out}")
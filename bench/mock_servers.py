@@ -0,0 +1,497 @@
+import base64
+import hashlib
+import json
+import random
+import re
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any
+
+from lesson_plan.parser import parse_plan
+
+
+# 模拟教案：包含真实教案的全部标题层级与【课文开始】【课文结束】标记
+MOCK_PLAN = """一、教学目标
+（一）知识目标
+1. 掌握本课生词和句型。
+（二）技能目标
+1. 能够用所学句型进行简单对话。
+（三）情感与文化目标
+1. 了解中国日常生活中的交际习惯。
+
+二、教学内容
+（一）生词（包括拼音、词性、英文释义、例句）
+1. 买 (mǎi) – v. to buy
+　　例句：我买苹果。
+2. 多少钱 (duōshao qián) – phr. how much
+　　例句：苹果多少钱？
+
+（二）课文
+【课文开始】
+（场景：在超市水果区）
+张华：你买什么？
+李明：我买苹果。
+张华：苹果多少钱？
+李明：五块钱一斤。
+【课文结束】
+
+（三）语法（包括：中文解释、英文解释、例句、练习）
+语法点：“多少钱”用于询问价格。
+
+（四）汉字（与主题和生词相关）
+1. 买（mǎi）：上下结构。
+
+（五）文化（与主题相关）
+中国超市常以“斤”为计量单位。
+
+三、教学重点与难点
+（一）教学重点
+1. 询问价格的句型。
+（二）教学难点
+1. “斤”与“公斤”的区别。
+
+四、教学步骤（45分钟）
+1. 导入（5分钟）
+2. 生词教学（10分钟）
+3. 课文操练（15分钟）
+4. 练习与总结（15分钟）
+
+五、教学方法
+- 情景教学法
+- 任务型教学法
+"""
+
+
+def mock_plan_section(heading: str) -> str:
+    """
+    栏目并行模式的模拟响应：核心返回生词 + 课文，其余栏目返回 MOCK_PLAN 中对应栏目的正文
+    """
+    if heading.startswith("二、教学内容"):
+        return MOCK_PLAN[MOCK_PLAN.index("（一）生词"):MOCK_PLAN.index("（三）语法")].strip()
+    key = re.sub(r"^[（(]?[一二三四五六七八九十]+[、）)]", "", heading).split("（")[0]
+    return parse_plan(MOCK_PLAN).section_text(key)
+
+
+class MockProfile:
+    """
+    单个模拟服务的性能画像：基础延迟 + 抖动 + 错误率，
+    duration 为异步任务（文生图 / 文生视频）从提交到完成所需时间
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.0, duration: float = 0.5):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.duration = duration
+
+    def sleep(self) -> None:
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+DEFAULT_PROFILES = {
+    "chat": MockProfile(latency=0.3, jitter=0.1),
+    "wanx": MockProfile(latency=0.05, jitter=0.02, duration=1.0),
+    "ark": MockProfile(latency=0.05, jitter=0.02, duration=2.0),
+    "files": MockProfile(latency=0.02, jitter=0.01),
+    "tts": MockProfile(latency=0.1, jitter=0.05)
+}
+
+
+# =====================================================
+# HTTP 模拟：OpenAI 兼容对话 / WanX 文生图 / Ark 任务 / 文件下载
+# =====================================================
+class _HTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    suite: "MockProviderSuite" = None
+
+    def log_message(self, *args):
+        pass
+
+    # ---------- 工具 ----------
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, obj: Dict[str, Any], status: int = 200, headers: Dict[str, str] = None) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self, profile: MockProfile) -> bool:
+        profile.sleep()
+        if profile.fail():
+            status = random.choice([429, 500, 503])
+            headers = {"Retry-After": "1"} if status == 429 else None
+            self._send_json({"error": {"message": "mock injected error", "code": str(status)}}, status, headers)
+            return True
+        return False
+
+    # ---------- 路由 ----------
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            return self._chat()
+        if path.endswith("/services/aigc/text2image/image-synthesis"):
+            return self._wanx_create()
+        if path.endswith("/contents/generations/tasks"):
+            return self._ark_create()
+        self._send_json({"error": "not found"}, 404)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path.startswith("/files/"):
+            return self._file(path[len("/files/"):])
+        if "/api/v1/tasks/" in path:
+            return self._wanx_task(path.rsplit("/", 1)[-1])
+        if "/contents/generations/tasks/" in path:
+            return self._ark_task(path.rsplit("/", 1)[-1])
+        self._send_json({"error": "not found"}, 404)
+
+    # ---------- OpenAI 兼容对话 ----------
+    def _chat(self):
+        req = self._read_json()
+        if self._maybe_fail(self.suite.profiles["chat"]):
+            return
+        system = req["messages"][0]["content"]
+        section = re.search(r"本次只撰写教案中?的?「(.+?)」", system + req["messages"][-1]["content"])
+        if section:
+            content = mock_plan_section(section.group(1))
+        elif "教案" in system:
+            content = MOCK_PLAN
+        elif "图片提示词开始" in system:
+            content = ("【图片提示词开始】超市水果区，两位学生对话，明亮插画风格，16:9【图片提示词结束】\n"
+                       "【视频提示词开始】超市水果区，两位学生对话，镜头缓慢推进，温暖氛围【视频提示词结束】")
+        else:
+            content = "【提示词开始】超市水果区，两位学生对话，明亮插画风格【提示词结束】"
+
+        prompt_tokens = sum(len(m["content"]) for m in req["messages"])
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content),
+                 "total_tokens": prompt_tokens + len(content)}
+        cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if not req.get("stream"):
+            return self._send_json({
+                "id": cid, "object": "chat.completion", "created": int(time.time()), "model": req["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = max(1, self.suite.stream_chunk_chars)
+        for i in range(0, len(content), step):
+            self._sse({
+                "id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": req["model"],
+                "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]
+            })
+            time.sleep(self.suite.stream_chunk_delay)
+        self._sse({"id": cid, "object": "chat.completion.chunk", "created": int(time.time()),
+                   "model": req["model"], "choices": [], "usage": usage})
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _sse(self, obj: Dict[str, Any]) -> None:
+        self._chunk(f"data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    # ---------- WanX 文生图（异步任务） ----------
+    def _wanx_create(self):
+        req = self._read_json()
+        if self._maybe_fail(self.suite.profiles["wanx"]):
+            return
+        n = int(req.get("parameters", {}).get("n", 1))
+        task_id = self.suite.new_task("wanx", n=n)
+        self._send_json({"request_id": uuid.uuid4().hex,
+                         "output": {"task_id": task_id, "task_status": "PENDING"}})
+
+    def _wanx_task(self, task_id: str):
+        if self._maybe_fail(self.suite.profiles["wanx"]):
+            return
+        task = self.suite.tasks.get(task_id)
+        if task is None:
+            return self._send_json({"code": "NotFound", "message": "task not found"}, 404)
+        output = {"task_id": task_id, "task_status": "RUNNING"}
+        if time.time() >= task["ready_at"]:
+            output["task_status"] = "SUCCEEDED"
+            output["results"] = [{"url": f"{self.suite.http_url}/files/{task_id}_{i}.png"}
+                                 for i in range(task["n"])]
+        self._send_json({"request_id": uuid.uuid4().hex, "output": output,
+                         "usage": {"image_count": task["n"]}})
+
+    # ---------- Ark 文生视频任务 ----------
+    def _ark_create(self):
+        self._read_json()
+        if self._maybe_fail(self.suite.profiles["ark"]):
+            return
+        self._send_json({"id": self.suite.new_task("ark")})
+
+    def _ark_task(self, task_id: str):
+        if self._maybe_fail(self.suite.profiles["ark"]):
+            return
+        task = self.suite.tasks.get(task_id)
+        if task is None:
+            return self._send_json({"error": {"code": "NotFound", "message": "task not found"}}, 404)
+        done = time.time() >= task["ready_at"]
+        body = {
+            "id": task_id,
+            "model": "doubao-seedance-mock",
+            "status": "succeeded" if done else "running",
+            "created_at": int(task["created_at"]),
+            "updated_at": int(time.time())
+        }
+        if done:
+            body["content"] = {"video_url": f"{self.suite.http_url}/files/{task_id}.mp4"}
+        self._send_json(body)
+
+    # ---------- 文件下载 ----------
+    def _file(self, name: str):
+        if self._maybe_fail(self.suite.profiles["files"]):
+            return
+        size = self.suite.video_bytes if name.endswith(".mp4") else self.suite.image_bytes
+        block = (hashlib.sha256(name.encode("utf-8")).digest() * 2048)[:64 * 1024]
+
+        start, end = 0, size - 1
+        rng = self.headers.get("Range")
+        if rng and rng.startswith("bytes="):
+            first, _, last = rng[len("bytes="):].partition("-")
+            start = int(first or 0)
+            end = int(last) if last else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4" if name.endswith(".mp4") else "image/png")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+        pos = start
+        while pos <= end:
+            offset = pos % len(block)
+            n = min(len(block) - offset, end - pos + 1)
+            self.wfile.write(block[offset:offset + n])
+            pos += n
+
+
+# =====================================================
+# 讯飞 TTS WebSocket 协议模拟（最小 RFC 6455 实现，仅 ws://）
+# =====================================================
+class _WSHandler(socketserver.BaseRequestHandler):
+    suite: "MockProviderSuite" = None
+    GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    def handle(self):
+        sock: socket.socket = self.request
+        f = sock.makefile("rb")
+        headers = {}
+        line = f.readline()
+        while True:
+            line = f.readline().decode("latin-1").strip()
+            if not line:
+                break
+            k, _, v = line.partition(":")
+            headers[k.strip().lower()] = v.strip()
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + self.GUID).encode()).digest()).decode()
+        sock.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("ascii"))
+
+        profile = self.suite.profiles["tts"]
+        while True:
+            frame = self._recv_frame(f)
+            if frame is None:
+                return
+            opcode, payload = frame
+            if opcode == 0x8:
+                self._send_frame(sock, 0x8, b"")
+                return
+            if opcode == 0x9:
+                self._send_frame(sock, 0xA, payload)
+                continue
+            if opcode != 0x1:
+                continue
+
+            req = json.loads(payload)
+            text = base64.b64decode(req["payload"]["text"]["text"]).decode("utf-8")
+            profile.sleep()
+            if profile.fail():
+                self._send_json(sock, {"header": {"code": 10163, "message": "mock injected error", "sid": "mock"}})
+                continue
+
+            # 约 3 KB / 字，分多帧返回
+            total = len(text) * self.suite.tts_bytes_per_char
+            frame_size = 8 * 1024
+            seq = 0
+            sent = 0
+            while True:
+                n = min(frame_size, total - sent)
+                sent += n
+                status = 2 if sent >= total else 1
+                audio = base64.b64encode(b"\xff\xf3" + b"\x00" * max(0, n - 2)).decode("ascii")
+                self._send_json(sock, {
+                    "header": {"code": 0, "message": "success", "sid": "mock", "status": status},
+                    "payload": {"audio": {"encoding": "lame", "sample_rate": 24000, "seq": seq,
+                                          "status": status, "audio": audio}}
+                })
+                seq += 1
+                if status == 2:
+                    break
+                time.sleep(self.suite.tts_frame_delay)
+            if not self.suite.tts_keep_alive:
+                # 与讯飞一致：最后一帧之后服务端关闭连接
+                return
+
+    @staticmethod
+    def _recv_frame(f):
+        head = f.read(2)
+        if len(head) < 2:
+            return None
+        opcode = head[0] & 0x0F
+        masked = head[1] & 0x80
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", f.read(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", f.read(8))[0]
+        mask = f.read(4) if masked else b""
+        data = bytearray(f.read(length))
+        if masked:
+            for i in range(length):
+                data[i] ^= mask[i % 4]
+        return opcode, bytes(data)
+
+    @staticmethod
+    def _send_frame(sock, opcode: int, payload: bytes) -> None:
+        head = bytearray([0x80 | opcode])
+        n = len(payload)
+        if n < 126:
+            head.append(n)
+        elif n < 65536:
+            head.append(126)
+            head += struct.pack(">H", n)
+        else:
+            head.append(127)
+            head += struct.pack(">Q", n)
+        sock.sendall(bytes(head) + payload)
+
+    def _send_json(self, sock, obj) -> None:
+        self._send_frame(sock, 0x1, json.dumps(obj).encode("utf-8"))
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockProviderSuite:
+    """
+    本地模拟服务套件：一个 HTTP 服务（对话 / 文生图 / 视频任务 / 文件）+ 一个 WebSocket 服务（TTS）
+    env() 返回指向本地服务的端点环境变量，各模块据此替换真实地址
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        profiles: Dict[str, MockProfile] = None,
+        image_bytes: int = 2 * 1024 * 1024,
+        video_bytes: int = 8 * 1024 * 1024,
+        tts_bytes_per_char: int = 3 * 1024,
+        stream_chunk_chars: int = 8,
+        stream_chunk_delay: float = 0.005,
+        tts_frame_delay: float = 0.005,
+        tts_keep_alive: bool = False
+    ):
+        self.host = host
+        self.profiles = dict(DEFAULT_PROFILES, **(profiles or {}))
+        self.image_bytes = image_bytes
+        self.video_bytes = video_bytes
+        self.tts_bytes_per_char = tts_bytes_per_char
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_delay = stream_chunk_delay
+        self.tts_frame_delay = tts_frame_delay
+        self.tts_keep_alive = tts_keep_alive
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        http_handler = type("BoundHTTPHandler", (_HTTPHandler,), {"suite": self})
+        ws_handler = type("BoundWSHandler", (_WSHandler,), {"suite": self})
+        self._http = ThreadingHTTPServer((host, 0), http_handler)
+        self._http.daemon_threads = True
+        self._ws = _ThreadingTCPServer((host, 0), ws_handler)
+        self._threads = []
+
+    @property
+    def http_url(self) -> str:
+        return f"http://{self.host}:{self._http.server_address[1]}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self._ws.server_address[1]}/v1/private/mock"
+
+    def new_task(self, kind: str, n: int = 1) -> str:
+        task_id = f"{kind}-{uuid.uuid4().hex[:16]}"
+        now = time.time()
+        with self._lock:
+            self.tasks[task_id] = {"created_at": now, "ready_at": now + self.profiles[kind].duration, "n": n}
+        return task_id
+
+    def env(self) -> Dict[str, str]:
+        return {
+            "DASHSCOPE_BASE_URL": f"{self.http_url}/compatible-mode/v1",
+            "DASHSCOPE_HTTP_BASE_URL": f"{self.http_url}/api/v1",
+            "XUNFEI_TTS_URL": self.ws_url,
+            "ARK_BASE_URL": f"{self.http_url}/api/v3"
+        }
+
+    def start(self) -> "MockProviderSuite":
+        for server in (self._http, self._ws):
+            t = threading.Thread(target=server.serve_forever, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self) -> None:
+        for server in (self._http, self._ws):
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+
+    suite = MockProviderSuite().start()
+    print("模拟服务已启动，设置以下环境变量后运行主程序：")
+    for k, v in suite.env().items():
+        print(f"  {k}={v}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        suite.stop()
@@ -0,0 +1,195 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Optional
+
+from bench.mock_servers import MockProviderSuite, MockProfile, DEFAULT_PROFILES
+
+
+MOCK_KEYS = {
+    "QWEN": "mock-qwen-key",
+    "XUNFEI_APPID": "mock-app",
+    "XUNFEI_KEY": "mock-key",
+    "XUNFEI_SECRET": "mock-secret",
+    "ARK_KEY": "mock-ark-key"
+}
+
+STAGES = ("plan", "prompts", "media", "image", "audio", "video", "total")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    最近秩百分位数（q 取 0~100）
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(q / 100.0 * len(ordered))))
+    return round(ordered[rank - 1], 3)
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows 无 resource 模块
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(rss / 1024 / 1024, 1) if sys.platform == "darwin" else round(rss / 1024, 1)
+
+
+# =====================================================
+# 子进程：跑一轮批量任务（每个批量规模独立进程，峰值内存互不影响）
+# =====================================================
+def run_child(lessons: int, limits: Dict[str, int], result_path: str, keep: bool = False) -> None:
+    """
+    工作目录（模拟素材，100 节课约 1 GB）默认跑完即删除，keep=True 时保留以便排查
+    """
+    root = tempfile.mkdtemp(prefix="bench_")
+    try:
+        _run_child(root, lessons, limits, result_path, keep)
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def _run_child(root: str, lessons: int, limits: Dict[str, int], result_path: str, keep: bool) -> None:
+    from pipeline.batch_runner import BatchLessonRunner
+    from db.lesson_index import LessonIndex
+
+    runner = BatchLessonRunner(
+        keys=MOCK_KEYS,
+        lesson_db=os.path.join(root, "teaching_db"),
+        prompt_db=os.path.join(root, "prompt_db"),
+        output_root=os.path.join(root, "output"),
+        limits=limits,
+        lesson_index=LessonIndex(os.path.join(root, "index.db")),
+        video_poll_interval=0.2
+    )
+    rows = [{"level": "二级", "topic": f"买水果 #{i + 1}"} for i in range(lessons)]
+    summary = runner.run(rows, report_path=os.path.join(root, "batch_report.json"))
+
+    samples = {stage: [] for stage in STAGES}
+    for lesson in summary["lessons"]:
+        if lesson is None:
+            continue
+        for stage in ("plan", "prompts", "media", "total"):
+            if stage in lesson["timings"]:
+                samples[stage].append(lesson["timings"][stage])
+        for kind, r in lesson["media"].items():
+            if r["success"]:
+                samples[kind].append(r["elapsed"])
+
+    result = {
+        "lessons": lessons,
+        "succeeded": summary["succeeded"],
+        "failed": summary["failed"],
+        "elapsed": summary["elapsed"],
+        "lessons_per_hour": summary["lessons_per_hour"],
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {
+            stage: {"n": len(v), "p50": percentile(v, 50), "p95": percentile(v, 95)}
+            for stage, v in samples.items()
+        },
+        "spans": summary["stages"],
+        "workdir": root if keep else None
+    }
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+# =====================================================
+# 父进程：启动模拟服务，依次跑各个批量规模并汇总
+# =====================================================
+def run_benchmark(
+    sizes: List[int],
+    limits: Dict[str, int],
+    error_rate: float = 0.0,
+    latency_scale: float = 1.0,
+    verbose: bool = False,
+    keep: bool = False
+) -> List[Dict[str, Any]]:
+    profiles = {
+        name: MockProfile(
+            latency=p.latency * latency_scale,
+            jitter=p.jitter * latency_scale,
+            error_rate=error_rate,
+            duration=p.duration * latency_scale
+        )
+        for name, p in DEFAULT_PROFILES.items()
+    }
+
+    results = []
+    with MockProviderSuite(profiles=profiles) as suite:
+        env = dict(os.environ, **suite.env())
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+        for n in sizes:
+            fd, result_path = tempfile.mkstemp(suffix=".json")
+            os.close(fd)
+            cmd = [sys.executable, "-m", "bench.run_benchmark", "--child", str(n),
+                   "--result", result_path, "--limits", json.dumps(limits)] + (["--keep"] if keep else [])
+            print(f"▶ {n} 节课 ...", flush=True)
+            start = time.time()
+            subprocess.run(
+                cmd, env=env, check=True,
+                stdout=None if verbose else subprocess.DEVNULL,
+                stderr=None if verbose else subprocess.DEVNULL
+            )
+            with open(result_path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            os.remove(result_path)
+            result["process_elapsed"] = round(time.time() - start, 3)
+            results.append(result)
+    return results
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    header = f"{'课程数':>6} {'成功':>5} {'耗时(s)':>9} {'课/小时':>9} {'峰值RSS(MB)':>12}"
+    for stage in STAGES:
+        header += f" {stage + ' p50/p95':>18}"
+    print(header)
+    for r in results:
+        line = (f"{r['lessons']:>6} {r['succeeded']:>5} {r['elapsed']:>9} "
+                f"{r['lessons_per_hour']:>9} {str(r['peak_rss_mb']):>12}")
+        for stage in STAGES:
+            s = r["stages"][stage]
+            line += f" {str(s['p50']) + '/' + str(s['p95']):>18}"
+        print(line)
+
+
+def _build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="离线基准测试：本地模拟 DashScope / 讯飞 / Ark")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100], help="批量规模（课程数）")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="各模拟服务的注入错误率")
+    ap.add_argument("--latency-scale", type=float, default=1.0, help="延迟与任务耗时缩放系数")
+    ap.add_argument("--limits", default="{}", help='阶段并发上限 JSON，如 {"lessons": 8, "llm": 8}')
+    ap.add_argument("--out", help="基准报告 JSON 输出路径")
+    ap.add_argument("--verbose", action="store_true", help="显示子进程的流水线日志")
+    ap.add_argument("--keep", action="store_true", help="保留每轮的临时工作目录（默认跑完即删除）")
+    ap.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--result", help=argparse.SUPPRESS)
+    return ap
+
+
+if __name__ == "__main__":
+
+    args = _build_arg_parser().parse_args()
+    stage_limits = json.loads(args.limits)
+
+    if args.child is not None:
+        run_child(args.child, stage_limits, args.result, args.keep)
+        sys.exit(0)
+
+    report = run_benchmark(args.sizes, stage_limits, args.error_rate, args.latency_scale, args.verbose, args.keep)
+    print()
+    print_table(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📝 基准报告已保存至：{args.out}")
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.governor import get_governor, ProviderError
+
+
+class Downloader:
+    """
+    素材下载器：共享 keep-alive 连接池，按块流式写入 <dest>.part，完成后原子改名
+    - 连接中断时从 .part 已有长度处用 HTTP Range 续传（服务端不支持 Range 时从头下载）
+    - 校验 Content-Length（及可选 sha256），不完整的文件不会出现在目标路径
+    - 内存占用只与 chunk_size 有关，与文件大小无关
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 1024 * 1024,
+        pool_size: int = 16,
+        timeout: Tuple[float, float] = (10, 60),
+        max_resumes: int = 5,
+        workers: int = 8,
+        governor=None
+    ):
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_resumes = max_resumes
+        self.workers = workers
+        self.governor = governor or get_governor("download")
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # =====================================================
+    # 对外接口
+    # =====================================================
+    def download(self, url: str, dest: str, sha256: str = None) -> Dict[str, Any]:
+        """
+        下载到 dest，返回 {"path", "bytes", "resumes", "sha256"}；失败时抛出异常且不留下 dest
+        sha256 给定时校验整文件摘要
+        """
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        part_path = f"{dest}.part"
+        attempts = []
+        # 之前崩溃的进程留下的 .part 内容来源不明，不能续传；续传只发生在本次调用的重试之间
+        self._remove(part_path)
+        try:
+            # 每次重试都从 .part 当前长度续传，退避与限速由 governor 负责
+            total = self.governor.call(self._fetch, url, part_path, attempts, retries=self.max_resumes)
+            digest = self._sha256(part_path) if sha256 else None
+            if sha256 and digest != sha256.lower():
+                raise ProviderError(f"校验失败: sha256 {digest} != {sha256}", retryable=False)
+            with open(part_path, "rb+") as f:
+                os.fsync(f.fileno())
+            os.replace(part_path, dest)
+        except Exception:
+            self._remove(part_path)
+            raise
+        return {"path": dest, "bytes": total, "resumes": max(0, len(attempts) - 1), "sha256": digest}
+
+    def download_many(self, items: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        并发下载多个 (url, dest)，按输入顺序返回结果；单个失败记为 {"path": None, "error": ...}
+        """
+        def run(item: Tuple[str, str]) -> Dict[str, Any]:
+            try:
+                return self.download(*item)
+            except Exception as e:
+                return {"path": None, "bytes": 0, "error": str(e)}
+
+        if len(items) <= 1:
+            return [run(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items)), thread_name_prefix="download") as pool:
+            return list(pool.map(run, items))
+
+    def close(self) -> None:
+        self.session.close()
+
+    # =====================================================
+    # 单次传输
+    # =====================================================
+    def _fetch(self, url: str, part_path: str, attempts: list) -> int:
+        attempts.append(1)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        # 不接受压缩编码，保证 Content-Length / Range 都按原始字节计算
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout, headers=headers) as response:
+                if offset and response.status_code == 416:
+                    # .part 已完整或已失效，丢弃后从头下载
+                    self._remove(part_path)
+                    raise ProviderError("续传范围无效，重新下载", status_code=416, retryable=True)
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    offset = 0  # 服务端忽略了 Range，整文件重新写
+                total = self._total_size(response, offset)
+
+                with open(part_path, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            raise ProviderError(f"下载中断: {e}", retryable=True) from e
+
+        size = os.path.getsize(part_path)
+        if total is not None and size != total:
+            raise ProviderError(f"下载不完整: {size}/{total} 字节", retryable=True)
+        return size
+
+    @staticmethod
+    def _total_size(response, offset: int) -> Optional[int]:
+        content_range = response.headers.get("Content-Range", "")
+        if "/" in content_range and not content_range.endswith("/*"):
+            return int(content_range.rsplit("/", 1)[1])
+        length = response.headers.get("Content-Length")
+        return offset + int(length) if length is not None else None
+
+    def _sha256(self, path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(self.chunk_size), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_downloader: Optional[Downloader] = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader() -> Downloader:
+    """
+    进程级共享下载器，图片与视频下载共用同一连接池
+    """
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader()
+        return _downloader
@@ -0,0 +1,262 @@
+import random
+import threading
+import time
+from typing import Dict, Any, Optional, Callable
+
+from common.tracing import tracer
+
+
+# 各服务商默认策略：qps / burst 为令牌桶速率与容量，concurrency 为同时在途请求上限
+DEFAULT_POLICIES = {
+    "qwen": {"qps": 5.0, "burst": 10, "concurrency": 8},
+    "wanx": {"qps": 2.0, "burst": 2, "concurrency": 2},
+    "xunfei": {"qps": 10.0, "burst": 10, "concurrency": 5},
+    "ark": {"qps": 5.0, "burst": 5, "concurrency": 4},
+    "download": {"qps": 20.0, "burst": 20, "concurrency": 8},
+}
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class ProviderError(RuntimeError):
+    """
+    服务商返回的错误结果（非异常形式的失败，如 DashScope 的 status_code、讯飞帧里的 code）
+    retryable 未指定时按 status_code 判断
+    """
+
+    def __init__(self, message: str, status_code: int = None, retry_after: float = None,
+                 retryable: bool = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    熔断期间直接拒绝请求，不再打到服务商
+    """
+
+
+class TokenBucket:
+    """
+    令牌桶限速：平均速率 rate 次/秒，允许 burst 次突发
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        取一个令牌，不足时阻塞；返回等待的秒数
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后熔断 reset_timeout 秒，
+    之后放行一次试探请求（半开），成功则恢复，失败则重新熔断
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """
+        试探请求既不算成功也不算失败（如参数错误）时交还试探名额，下一次请求重新试探
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> bool:
+        """
+        记一次失败；返回本次是否触发熔断
+        """
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                tripped = self._opened_at is None or self._probing
+                self._opened_at = time.monotonic()
+                self._probing = False
+                return tripped
+            return False
+
+
+class ProviderGovernor:
+    """
+    单个服务商的调用治理：令牌桶限速 + 并发上限 + 指数退避重试（带抖动）+ 熔断
+    429 / 5xx / 超时 / 连接错误会重试，并遵循服务端 Retry-After；其余错误直接抛出
+    """
+
+    def __init__(
+        self,
+        name: str,
+        qps: float = 5.0,
+        burst: int = 5,
+        concurrency: int = 4,
+        retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0
+    ):
+        self.name = name
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(qps, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+
+    def call(self, fn: Callable, *args, retries: int = None, **kwargs):
+        """
+        经限速、限并发与重试执行 fn(*args, **kwargs)
+        retries 可按调用覆盖默认重试次数（如轮询类请求自带重排，可设为 0）
+        """
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} 熔断中，{self.breaker.reset_timeout:.0f} 秒内暂停请求")
+            self.bucket.acquire()
+            try:
+                with self._slots:
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if not retryable:
+                    # 不可重试的错误不计入熔断，但半开试探必须结束，否则熔断器会一直拒绝请求
+                    self.breaker.release_probe()
+                elif self.breaker.record_failure():
+                    print(f"⛔ {self.name} 连续失败，熔断 {self.breaker.reset_timeout:.0f} 秒")
+                if not retryable or attempt >= retries:
+                    raise
+                delay = self.backoff(attempt, retry_after(e))
+                tracer.record(f"retry.{self.name}", time.time(), outcome="error", error=str(e),
+                              retries=1, delay=round(delay, 3))
+                print(f"⚠️ {self.name} 调用失败，{delay:.1f} 秒后重试({attempt + 1}/{retries}): {e}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def backoff(self, attempt: int, hint: float = None) -> float:
+        """
+        full jitter 指数退避；服务端给出 Retry-After 时不早于该时间
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if hint is not None:
+            delay = max(delay, min(hint, self.max_delay))
+        return delay
+
+
+# =====================================================
+# 错误分类
+# =====================================================
+def status_code_of(exc: Exception) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    try:
+        return int(code) if code is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """
+    读取异常携带的 Retry-After（秒）：ProviderError.retry_after 或 HTTP 响应头
+    """
+    value = getattr(exc, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+        value = headers.get("Retry-After") if headers else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, CircuitOpenError):
+        return False
+    if isinstance(exc, ProviderError) and exc.retryable is not None:
+        return exc.retryable
+    code = status_code_of(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS or code >= 500
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    # 各 SDK 的超时 / 连接异常类型不同（openai、requests、websocket-client），按类名识别
+    return any(
+        "Timeout" in cls.__name__ or "Connection" in cls.__name__
+        for cls in type(exc).__mro__
+    )
+
+
+# =====================================================
+# 进程级共享实例：同一服务商的所有调用共用一个限速器与熔断器
+# =====================================================
+_governors: Dict[str, ProviderGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(provider: str) -> ProviderGovernor:
+    with _governors_lock:
+        if provider not in _governors:
+            _governors[provider] = ProviderGovernor(provider, **DEFAULT_POLICIES.get(provider, {}))
+        return _governors[provider]
+
+
+def configure(provider: str, **policy: Any) -> ProviderGovernor:
+    """
+    覆盖某个服务商的策略（qps、burst、concurrency、retries 等），替换共享实例
+    """
+    with _governors_lock:
+        merged = dict(DEFAULT_POLICIES.get(provider, {}), **policy)
+        _governors[provider] = ProviderGovernor(provider, **merged)
+        return _governors[provider]
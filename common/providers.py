@@ -0,0 +1,66 @@
+import importlib
+import sys
+import threading
+from typing import Dict, Any, List, Type
+
+
+# 生成器按名称登记为 "模块:类名"，第一次使用时才 import（连带 openai / dashscope / ark / websocket 等 SDK）
+PROVIDERS: Dict[str, str] = {
+    "plan": "llm.teaching_plan_gen:QwenTeachingPlanGenerator",
+    "prompt": "prompt.prompt_builder:MultimodalPromptBuilder",
+    "image": "multimodal.image_wanx:WanXImageGenerator",
+    "tts": "multimodal.tts_xunfei:XunfeiTTSGenerator",
+    "video": "multimodal.video_seedance:SeedanceVideoGenerator",
+}
+
+# 各生成器背后的第三方 SDK，用于启动耗时基准里核对实际加载了哪些
+SDK_MODULES: Dict[str, tuple] = {
+    "plan": ("openai",),
+    "prompt": ("openai",),
+    "image": ("dashscope", "requests"),
+    "tts": ("websocket",),
+    "video": ("volcenginesdkarkruntime", "requests"),
+}
+
+_resolved: Dict[str, Type] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, target: str) -> None:
+    """
+    登记或替换生成器，target 形如 "package.module:ClassName"
+    """
+    if ":" not in target:
+        raise ValueError(f"生成器路径应为 '模块:类名'，收到: {target}")
+    with _lock:
+        PROVIDERS[name] = target
+        _resolved.pop(name, None)
+
+
+def resolve(name: str) -> Type:
+    """
+    按名称取得生成器类，首次调用时才导入对应模块
+    """
+    with _lock:
+        if name in _resolved:
+            return _resolved[name]
+        if name not in PROVIDERS:
+            raise KeyError(f"未知的生成器: {name}（可选: {', '.join(sorted(PROVIDERS))}）")
+        module_name, class_name = PROVIDERS[name].split(":", 1)
+        cls = getattr(importlib.import_module(module_name), class_name)
+        _resolved[name] = cls
+        return cls
+
+
+def create(name: str, *args: Any, **kwargs: Any):
+    return resolve(name)(*args, **kwargs)
+
+
+def loaded() -> List[str]:
+    """
+    已导入的生成器名称（只看模块是否在 sys.modules，不触发导入）
+    """
+    return [
+        name for name, target in PROVIDERS.items()
+        if target.split(":", 1)[0] in sys.modules
+    ]
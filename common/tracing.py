@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+
+class Span:
+    """
+    一次阶段调用的记录：起止时间、传输字节、token、重试次数、结果
+    """
+
+    __slots__ = ("name", "start", "end", "outcome", "error", "attrs")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.outcome = "ok"
+        self.error: Optional[str] = None
+        self.attrs: Dict[str, Any] = attrs
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attrs) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, key: str, value: float) -> "Span":
+        self.attrs[key] = self.attrs.get(key, 0) + value
+        return self
+
+    def fail(self, error) -> "Span":
+        self.outcome = "error"
+        self.error = str(error)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start": round(self.start, 6),
+            "end": round(self.end, 6) if self.end else None,
+            "duration": round(self.duration, 6),
+            "outcome": self.outcome,
+            "error": self.error,
+            **self.attrs
+        }
+
+
+class Tracer:
+    """
+    轻量级追踪器：收集各阶段 span，导出 JSONL / Prometheus 文本快照，并生成运行汇总
+    常用属性：bytes（传输字节）、prompt_tokens / completion_tokens、retries、run_id、model
+    prices 形如 {"llm.plan:prompt_tokens": 0.0000024}，按「span 名:属性」计价（元/单位）
+    """
+
+    NUMERIC_KEYS = ("bytes", "prompt_tokens", "completion_tokens", "total_tokens", "retries", "units")
+
+    def __init__(self, max_spans: int = 100000, prices: Dict[str, float] = None):
+        self.max_spans = max_spans
+        self.prices = prices or {}
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        with tracer.span("image.download", run_id=...) as sp:
+            ...
+            sp.set(bytes=n)
+        块内抛出异常时记为 error 并继续向上抛出
+        """
+        sp = Span(name, **attrs)
+        try:
+            yield sp
+        except Exception as e:
+            sp.fail(e)
+            raise
+        finally:
+            sp.end = time.time()
+            self._record(sp)
+
+    def record(self, name: str, start: float, end: float = None, outcome: str = "ok",
+               error: str = None, **attrs) -> Span:
+        """
+        记录一段已结束的区间（不便用 with 包裹的场景，如跨线程的视频任务等待）
+        """
+        sp = Span(name, **attrs)
+        sp.start = start
+        sp.end = end or time.time()
+        sp.outcome = outcome
+        sp.error = error
+        self._record(sp)
+        return sp
+
+    def _record(self, sp: Span) -> None:
+        with self._lock:
+            self._spans.append(sp)
+            if len(self._spans) > self.max_spans:
+                del self._spans[:len(self._spans) - self.max_spans]
+
+    def spans(self, since: float = None, run_id: str = None) -> List[Span]:
+        with self._lock:
+            spans = list(self._spans)
+        if since is not None:
+            spans = [s for s in spans if s.start >= since]
+        if run_id is not None:
+            spans = [s for s in spans if s.attrs.get("run_id") == run_id]
+        return spans
+
+    # =====================================================
+    # 汇总与导出
+    # =====================================================
+    def summary(self, since: float = None, run_id: str = None) -> Dict[str, Dict[str, Any]]:
+        """
+        按 span 名汇总：次数、错误数、总耗时/最长耗时、字节、token、重试、费用
+        """
+        stats: Dict[str, Dict[str, Any]] = {}
+        for sp in self.spans(since, run_id):
+            s = stats.setdefault(sp.name, {
+                "count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "cost": 0.0
+            })
+            s["count"] += 1
+            s["errors"] += sp.outcome != "ok"
+            s["seconds"] += sp.duration
+            s["max_seconds"] = max(s["max_seconds"], sp.duration)
+            for key in self.NUMERIC_KEYS:
+                if key in sp.attrs:
+                    s[key] = s.get(key, 0) + sp.attrs[key]
+                    s["cost"] += sp.attrs[key] * self.prices.get(f"{sp.name}:{key}", 0.0)
+        for s in stats.values():
+            s["seconds"] = round(s["seconds"], 3)
+            s["max_seconds"] = round(s["max_seconds"], 3)
+            s["cost"] = round(s["cost"], 4)
+        return stats
+
+    def print_summary(self, since: float = None, run_id: str = None) -> None:
+        stats = self.summary(since, run_id)
+        if not stats:
+            return
+        print("\n📈 阶段耗时汇总：")
+        for name, s in sorted(stats.items(), key=lambda kv: -kv[1]["seconds"]):
+            extra = []
+            if s.get("total_tokens"):
+                extra.append(f"{s['total_tokens']} tokens")
+            if s.get("bytes"):
+                extra.append(f"{s['bytes'] / 1024:.1f} KB")
+            if s.get("retries"):
+                extra.append(f"重试 {s['retries']} 次")
+            if s["cost"]:
+                extra.append(f"¥{s['cost']}")
+            if s["errors"]:
+                extra.append(f"失败 {s['errors']} 次")
+            print(f"  {name:<18} ×{s['count']:<3} 合计 {s['seconds']:>8.2f}s  最长 {s['max_seconds']:>7.2f}s  "
+                  f"{'  '.join(extra)}")
+
+    def export_jsonl(self, path: str, since: float = None, run_id: str = None) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for sp in self.spans(since, run_id):
+                f.write(json.dumps(sp.to_dict(), ensure_ascii=False) + "\n")
+        return path
+
+    def prometheus_text(self, since: float = None, run_id: str = None) -> str:
+        """
+        Prometheus 文本格式快照（counter 累计值）
+        """
+        stats = self.summary(since, run_id)
+        lines = [
+            "# HELP lesson_stage_calls_total Stage invocations.",
+            "# TYPE lesson_stage_calls_total counter",
+        ]
+        lines += [f'lesson_stage_calls_total{{stage="{n}"}} {s["count"]}' for n, s in stats.items()]
+        lines += [
+            "# HELP lesson_stage_errors_total Stage invocations that ended in error.",
+            "# TYPE lesson_stage_errors_total counter",
+        ]
+        lines += [f'lesson_stage_errors_total{{stage="{n}"}} {s["errors"]}' for n, s in stats.items()]
+        lines += [
+            "# HELP lesson_stage_seconds_total Wall-clock seconds spent per stage.",
+            "# TYPE lesson_stage_seconds_total counter",
+        ]
+        lines += [f'lesson_stage_seconds_total{{stage="{n}"}} {s["seconds"]}' for n, s in stats.items()]
+        for key, help_text in (
+            ("bytes", "Bytes transferred per stage."),
+            ("total_tokens", "LLM tokens consumed per stage."),
+            ("retries", "Retries per stage."),
+        ):
+            metric = f"lesson_stage_{key}_total"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{stage="{n}"}} {s.get(key, 0)}' for n, s in stats.items()]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, since: float = None, run_id: str = None) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(since, run_id))
+        os.replace(tmp_path, path)
+        return path
+
+
+# 进程级默认追踪器，各模块直接使用
+tracer = Tracer()
@@ -0,0 +1,377 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from lesson_plan.parser import TeachingPlanParser
+from db.segment_store import iter_records, parse_ref, record_exists
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id          TEXT,
+    level           TEXT NOT NULL,
+    topic           TEXT NOT NULL,
+    model           TEXT,
+    lesson_text     TEXT,
+    total_tokens    INTEGER,
+    created_at      TEXT NOT NULL,
+    path            TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_plans_level_created ON plans(level, created_at);
+CREATE INDEX IF NOT EXISTS idx_plans_topic ON plans(topic);
+CREATE INDEX IF NOT EXISTS idx_plans_created ON plans(created_at);
+CREATE INDEX IF NOT EXISTS idx_plans_run ON plans(run_id);
+
+CREATE TABLE IF NOT EXISTS prompts (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id          TEXT,
+    level           TEXT NOT NULL,
+    task            TEXT NOT NULL,
+    engine          TEXT NOT NULL,
+    lesson_source   TEXT,
+    prompt          TEXT,
+    created_at      TEXT NOT NULL,
+    path            TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_prompts_level_created ON prompts(level, created_at);
+CREATE INDEX IF NOT EXISTS idx_prompts_engine ON prompts(engine, created_at);
+CREATE INDEX IF NOT EXISTS idx_prompts_created ON prompts(created_at);
+CREATE INDEX IF NOT EXISTS idx_prompts_run ON prompts(run_id);
+
+CREATE TABLE IF NOT EXISTS media (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id          TEXT,
+    kind            TEXT NOT NULL,
+    level           TEXT,
+    prompt_path     TEXT,
+    size            INTEGER,
+    created_at      TEXT NOT NULL,
+    path            TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_media_run ON media(run_id);
+CREATE INDEX IF NOT EXISTS idx_media_kind_created ON media(kind, created_at);
+CREATE INDEX IF NOT EXISTS idx_media_prompt ON media(prompt_path);
+"""
+
+# 主题 / 课文的子串检索：FTS5 外部内容表 + trigram 分词（中文无需分词），由触发器与 plans 同步
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS plans_fts USING fts5(
+    topic, lesson_text, content='plans', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS plans_fts_ai AFTER INSERT ON plans BEGIN
+    INSERT INTO plans_fts(rowid, topic, lesson_text) VALUES (new.id, new.topic, new.lesson_text);
+END;
+CREATE TRIGGER IF NOT EXISTS plans_fts_ad AFTER DELETE ON plans BEGIN
+    INSERT INTO plans_fts(plans_fts, rowid, topic, lesson_text) VALUES ('delete', old.id, old.topic, old.lesson_text);
+END;
+CREATE TRIGGER IF NOT EXISTS plans_fts_au AFTER UPDATE ON plans BEGIN
+    INSERT INTO plans_fts(plans_fts, rowid, topic, lesson_text) VALUES ('delete', old.id, old.topic, old.lesson_text);
+    INSERT INTO plans_fts(rowid, topic, lesson_text) VALUES (new.id, new.topic, new.lesson_text);
+END;
+"""
+# trigram 索引只能检索不少于 3 个字符的子串
+FTS_MIN_CHARS = 3
+
+MEDIA_KINDS = {".png": "image", ".jpg": "image", ".mp3": "audio", ".mp4": "video"}
+
+
+class LessonIndex:
+    """
+    教案 / 提示词 / 媒体素材的 SQLite 索引
+    JSON 文件仍是原始数据，索引只保存可查询字段和文件路径，三者通过 run_id 关联
+    """
+
+    def __init__(self, db_path: str = os.path.join("storage", "index.db")):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # INSERT OR REPLACE 删除旧行时也要触发 plans_fts_ad，否则全文索引会残留旧内容
+            self._conn.execute("PRAGMA recursive_triggers=ON")
+            self._conn.executescript(SCHEMA)
+        self.fts = self._init_fts()
+
+    def _init_fts(self) -> bool:
+        """
+        创建全文索引；已有数据库首次升级时从 plans 重建。SQLite 不支持 FTS5 / trigram（< 3.34）时退回 LIKE 扫描
+        """
+        with self._lock:
+            existed = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'plans_fts'").fetchone()
+            try:
+                with self._conn:
+                    self._conn.executescript(FTS_SCHEMA)
+                    if not existed:
+                        self._conn.execute("INSERT INTO plans_fts(plans_fts) VALUES ('rebuild')")
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ SQLite 不支持 FTS5 trigram，主题检索退回全表扫描: {e}")
+                return False
+        return True
+
+    # =====================================================
+    # 写入
+    # =====================================================
+    def add_plan(self, result: Dict[str, Any], path: str, run_id: str = None) -> None:
+        lesson_text = TeachingPlanParser(result.get("teaching_plan", "")).extract_lesson_text()
+        self._execute(
+            "INSERT OR REPLACE INTO plans "
+            "(run_id, level, topic, model, lesson_text, total_tokens, created_at, path) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id or result.get("run_id"),
+                result["student_level"],
+                result["input_content"],
+                result.get("model"),
+                lesson_text,
+                (result.get("usage") or {}).get("total_tokens"),
+                result.get("created_time") or self._now(),
+                self._norm(path)
+            )
+        )
+
+    def add_prompt(self, data: Dict[str, Any], path: str, run_id: str = None) -> None:
+        meta, payload = data["metadata"], data["payload"]
+        self._execute(
+            "INSERT OR REPLACE INTO prompts "
+            "(run_id, level, task, engine, lesson_source, prompt, created_at, path) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id or meta.get("run_id"),
+                meta["student_level"],
+                meta["task"],
+                meta["engine"],
+                payload.get("lesson_source"),
+                payload.get("prompt"),
+                meta.get("created_at") or self._now(),
+                self._norm(path)
+            )
+        )
+
+    def add_media(
+        self,
+        path: str,
+        kind: str = None,
+        run_id: str = None,
+        level: str = None,
+        prompt_path: str = None
+    ) -> None:
+        if not path or not os.path.exists(path):
+            return
+        kind = kind or MEDIA_KINDS.get(os.path.splitext(path)[1].lower(), "other")
+        created_at = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+        self._execute(
+            "INSERT OR REPLACE INTO media (run_id, kind, level, prompt_path, size, created_at, path) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_id, kind, level, self._norm(prompt_path) if prompt_path else None,
+             os.path.getsize(path), created_at, self._norm(path))
+        )
+
+    # =====================================================
+    # 查询
+    # =====================================================
+    def find_plans(
+        self,
+        level: str = None,
+        topic: str = None,
+        since: str = None,
+        until: str = None,
+        limit: int = 100,
+        match: str = "substring"
+    ) -> List[Dict[str, Any]]:
+        """
+        match 决定 topic 的匹配方式：
+        - "substring"（默认）：同时在输入内容和课文中查找子串（如 "去超市"），走 plans_fts 全文索引；
+          不足 3 个字符的查询 trigram 无法检索，退回 LIKE 扫描
+        - "exact" / "prefix"：只比较输入内容，走 idx_plans_topic
+        since / until 为 "YYYY-MM-DD[ HH:MM:SS]" 字符串
+        """
+        if match not in ("substring", "exact", "prefix"):
+            raise ValueError(f"不支持的匹配方式: {match}（可选: substring, exact, prefix）")
+        sql, args = "SELECT * FROM plans WHERE 1=1", []
+        if level:
+            sql += " AND level = ?"
+            args.append(level)
+        if topic and match == "exact":
+            sql += " AND topic = ?"
+            args.append(topic)
+        elif topic and match == "prefix":
+            sql += " AND topic >= ? AND topic < ?"
+            args += [topic, topic + "\U0010ffff"]
+        elif topic and self.fts and len(topic) >= FTS_MIN_CHARS:
+            sql += " AND id IN (SELECT rowid FROM plans_fts WHERE plans_fts MATCH ?)"
+            args.append('"' + topic.replace('"', '""') + '"')
+        elif topic:
+            sql += " AND (topic LIKE ? OR lesson_text LIKE ?)"
+            args += [f"%{topic}%", f"%{topic}%"]
+        if since:
+            sql += " AND created_at >= ?"
+            args.append(since)
+        if until:
+            sql += " AND created_at <= ?"
+            args.append(until)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        return self._query(sql, args)
+
+    def find_prompts(
+        self,
+        level: str = None,
+        task: str = None,
+        engine: str = None,
+        since: str = None,
+        until: str = None,
+        run_id: str = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        sql, args = "SELECT * FROM prompts WHERE 1=1", []
+        for col, val in (("level", level), ("task", task), ("engine", engine), ("run_id", run_id)):
+            if val:
+                sql += f" AND {col} = ?"
+                args.append(val)
+        if since:
+            sql += " AND created_at >= ?"
+            args.append(since)
+        if until:
+            sql += " AND created_at <= ?"
+            args.append(until)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        return self._query(sql, args)
+
+    def prompts_for_media(self, media_path: str) -> List[Dict[str, Any]]:
+        """
+        查询某个素材文件（或素材目录）所用的提示词
+        """
+        norm = self._norm(media_path)
+        rows = self._query(
+            "SELECT p.* FROM media m JOIN prompts p "
+            "ON p.path = m.prompt_path OR (m.prompt_path IS NULL AND p.run_id = m.run_id) "
+            "WHERE m.path = ? OR m.path LIKE ?",
+            [norm, norm.rstrip("/") + "/%"]
+        )
+        seen, unique = set(), []
+        for r in rows:
+            if r["path"] not in seen:
+                seen.add(r["path"])
+                unique.append(r)
+        return unique
+
+    def get_run(self, run_id: str) -> Dict[str, List[Dict[str, Any]]]:
+        return {
+            "plans": self._query("SELECT * FROM plans WHERE run_id = ?", [run_id]),
+            "prompts": self._query("SELECT * FROM prompts WHERE run_id = ?", [run_id]),
+            "media": self._query("SELECT * FROM media WHERE run_id = ?", [run_id])
+        }
+
+    def run_artifacts(self, run_id: str) -> Dict[str, Dict[str, str]]:
+        """
+        某次运行可复用的产物：每类提示词 / 素材取最新一条且文件（或分段存储记录）仍存在的路径
+        返回 {"prompts": {"image": path, "video": path}, "media": {"image": ..., "audio": ..., "video": ...}}
+        """
+        run = self.get_run(run_id)
+        artifacts = {"prompts": {}, "media": {}}
+        for section, key, exists in (("prompts", "task", record_exists), ("media", "kind", os.path.exists)):
+            for row in sorted(run[section], key=lambda r: r["created_at"]):
+                if exists(row["path"]):
+                    artifacts[section][row[key]] = row["path"]
+        return artifacts
+
+    def plans_since(self, last_id: int = 0) -> List[Dict[str, Any]]:
+        return self._query(
+            "SELECT id, run_id, level, topic, lesson_text, path FROM plans WHERE id > ? ORDER BY id", [last_id])
+
+    def plan_ids(self) -> List[int]:
+        return [r["id"] for r in self._query("SELECT id FROM plans", [])]
+
+    # =====================================================
+    # 历史 JSON 回填
+    # =====================================================
+    def backfill(self, lesson_db: str, prompt_db: str, output_root: str) -> Dict[str, int]:
+        """
+        导入已有的 teaching_db / prompt_db 记录（逐文件 JSON 与分段存储）与 output 素材
+        历史数据没有 run_id：提示词按课文内容关联到教案，素材目录按时间戳关联到提示词
+        """
+        counts = {"plans": 0, "prompts": 0, "media": 0}
+        lesson_to_run = {}
+
+        for path, result in iter_records(lesson_db):
+            try:
+                run_id = result.get("run_id") or os.path.splitext(os.path.basename(path))[0]
+                self.add_plan(result, path, run_id)
+                lesson_text = TeachingPlanParser(result.get("teaching_plan", "")).extract_lesson_text()
+                if lesson_text:
+                    lesson_to_run[lesson_text] = run_id
+                counts["plans"] += 1
+            except (ValueError, KeyError) as e:
+                print(f"⚠️ 跳过教案文件 {path}: {e}")
+
+        stamp_to_run = {}
+        for path, data in iter_records(prompt_db):
+            try:
+                run_id = data["metadata"].get("run_id") or lesson_to_run.get(
+                    (data["payload"].get("lesson_source") or "").strip())
+                self.add_prompt(data, path, run_id)
+                ref = parse_ref(path)
+                stamp = self._stamp(ref[1] if ref else os.path.basename(path))
+                if stamp and run_id:
+                    stamp_to_run[stamp] = run_id
+                counts["prompts"] += 1
+            except (ValueError, KeyError) as e:
+                print(f"⚠️ 跳过提示词文件 {path}: {e}")
+
+        for root, _, names in os.walk(output_root):
+            folder = os.path.basename(root) if root != output_root else ""
+            run_id = stamp_to_run.get(self._stamp(folder)) if folder else None
+            for name in names:
+                if os.path.splitext(name)[1].lower() in MEDIA_KINDS:
+                    level = name.split("_")[0]
+                    self.add_media(os.path.join(root, name), run_id=run_id, level=level)
+                    counts["media"] += 1
+
+        print(f"✓ 索引回填完成：{counts}")
+        return counts
+
+    # =====================================================
+    # 工具方法
+    # =====================================================
+    def _execute(self, sql: str, args) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(sql, args)
+
+    def _query(self, sql: str, args) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(r) for r in self._conn.execute(sql, args).fetchall()]
+
+    @staticmethod
+    def _stamp(name: str) -> Optional[str]:
+        match = re.match(r"(\d{8}_\d{6})", name)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def _norm(path: str) -> str:
+        return os.path.normpath(path).replace("\\", "/")
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+
+    index = LessonIndex()
+    index.backfill(
+        os.path.join("storage", "teaching_db"),
+        os.path.join("storage", "prompt_db"),
+        os.path.join("storage", "output")
+    )
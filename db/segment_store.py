@@ -0,0 +1,463 @@
+import argparse
+import atexit
+import glob
+import json
+import mmap
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+
+SEGMENT_DIR = "segments"
+SEGMENT_RE = re.compile(r"^seg_(\d{6})\.jsonl$")
+# 记录 ID：时间戳_段号_段内序号，段由写入进程独占，因此同一秒内多次保存也不会重名
+RECORD_ID_RE = re.compile(r"^\d{8}_\d{6}_\d{6}_\d{6}$")
+
+
+class SegmentStore:
+    """
+    追加式分段存储：每条记录压缩成一行 JSON 追加到滚动的 seg_NNNNNN.jsonl，
+    同名 .idx 记录 (id, offset, length)，按 ID 读取时 mmap 切出这一行再解析，不扫描其余记录
+    - 每条写入立即交给操作系统（其他进程可读到），fsync 按批：每 fsync_every 条或 fsync_interval 秒一次，
+      close / flush 时补齐
+    - 每个写入进程独占自己的活动段，服务与命令行同时写入同一目录时互不干扰
+    - 进程崩溃时 .idx 可能落后于 .jsonl：打开时从最后一条索引位置扫描补齐，残缺的最后一行忽略
+    - 同一 ID 以后写入的为准，delete 写入删除标记；compact 重写成紧凑的新段并去掉过期记录
+    """
+
+    def __init__(
+        self,
+        base_dir: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        fsync_every: int = 32,
+        fsync_interval: float = 1.0
+    ):
+        self.base_dir = base_dir
+        self.segment_dir = os.path.join(base_dir, SEGMENT_DIR)
+        self.segment_bytes = segment_bytes
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        os.makedirs(self.segment_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._index: Dict[str, Tuple[int, int, int]] = {}  # id -> (段号, offset, length)
+        self._ends: Dict[int, int] = {}  # 各段已索引到的字节位置
+        self._maps: Dict[int, Tuple[mmap.mmap, int]] = {}
+        # 本进程的活动段
+        self._active: Optional[int] = None
+        self._f = None
+        self._idx_f = None
+        self._size = 0
+        self._count = 0
+        self._pending = 0
+        self._synced_at = time.time()
+        self.refresh()
+
+    # =====================================================
+    # 路径与引用
+    # =====================================================
+    def _segment_path(self, seg: int) -> str:
+        return os.path.join(self.segment_dir, f"seg_{seg:06d}.jsonl")
+
+    def _idx_path(self, seg: int) -> str:
+        return os.path.join(self.segment_dir, f"seg_{seg:06d}.idx")
+
+    def _segments(self) -> List[int]:
+        return sorted(int(m.group(1)) for m in
+                      (SEGMENT_RE.match(name) for name in os.listdir(self.segment_dir)) if m)
+
+    def ref(self, record_id: str) -> str:
+        """
+        记录在索引 / 检查点里使用的路径形式：<base_dir>#<id>
+        """
+        return f"{self.base_dir}#{record_id}"
+
+    # =====================================================
+    # 索引加载
+    # =====================================================
+    def refresh(self) -> int:
+        """
+        读取其他进程新写入的段与记录，返回新增索引条数
+        """
+        added = 0
+        with self._lock:
+            for seg in self._segments():
+                if seg == self._active:
+                    continue
+                if seg not in self._ends:
+                    self._ends[seg] = 0
+                    added += self._load_idx(seg)
+                added += self._scan_tail(seg)
+        return added
+
+    def _load_idx(self, seg: int) -> int:
+        count = 0
+        try:
+            with open(self._idx_path(seg), "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4:
+                        break  # 写到一半的最后一行
+                    record_id, offset, length, flag = parts[0], int(parts[1]), int(parts[2]), parts[3]
+                    self._apply(record_id, seg, offset, length, flag == "D")
+                    self._ends[seg] = offset + length
+                    count += 1
+        except FileNotFoundError:
+            pass
+        return count
+
+    def _scan_tail(self, seg: int) -> int:
+        """
+        .idx 之后追加的行（崩溃前未写入索引，或其他进程仍在写的活动段）逐行补齐
+        """
+        start = self._ends.get(seg, 0)
+        try:
+            with open(self._segment_path(seg), "rb") as f:
+                f.seek(start)
+                tail = f.read()
+        except FileNotFoundError:
+            return 0
+        count = 0
+        offset = start
+        for line in tail.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break
+            self._apply(rec["id"], seg, offset, len(line), bool(rec.get("deleted")))
+            offset += len(line)
+            count += 1
+        self._ends[seg] = offset
+        return count
+
+    def _apply(self, record_id: str, seg: int, offset: int, length: int, deleted: bool) -> None:
+        if deleted:
+            self._index.pop(record_id, None)
+        else:
+            self._index[record_id] = (seg, offset, length)
+
+    # =====================================================
+    # 写入
+    # =====================================================
+    def put(self, record: Dict[str, Any], name: str = None, record_id: str = None) -> str:
+        """
+        追加一条记录，返回记录 ID；name 为导出成逐文件布局时使用的文件名
+        """
+        with self._lock:
+            if self._active is None or self._size >= self.segment_bytes:
+                self._roll()
+            record_id = record_id or (
+                f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self._active:06d}_{self._count:06d}")
+            self._append(record_id, {"id": record_id, "name": name, "data": record}, deleted=False)
+            return record_id
+
+    def delete(self, record_id: str) -> bool:
+        with self._lock:
+            if record_id not in self._index:
+                return False
+            if self._active is None or self._size >= self.segment_bytes:
+                self._roll()
+            self._append(record_id, {"id": record_id, "deleted": True}, deleted=True)
+            return True
+
+    def _append(self, record_id: str, rec: Dict[str, Any], deleted: bool) -> None:
+        # 调用方已持有 self._lock
+        line = (json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        offset = self._size
+        self._f.write(line)
+        self._idx_f.write(f"{record_id}\t{offset}\t{len(line)}\t{'D' if deleted else 'R'}\n")
+        self._size += len(line)
+        self._count += 1
+        self._apply(record_id, self._active, offset, len(line), deleted)
+
+        self._pending += 1
+        if self._pending >= self.fsync_every or time.time() - self._synced_at >= self.fsync_interval:
+            self._sync()
+        else:
+            self._f.flush()
+            self._idx_f.flush()
+
+    def _roll(self) -> None:
+        """
+        封存当前活动段，独占创建下一个段号（O_EXCL，多个进程不会拿到同一段）
+        """
+        self._close_active()
+        seg = max(self._segments() or [0]) + 1
+        while True:
+            try:
+                fd = os.open(self._segment_path(seg),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0))
+                break
+            except FileExistsError:
+                seg += 1
+        self._f = os.fdopen(fd, "wb")
+        self._idx_f = open(self._idx_path(seg), "w", encoding="utf-8", newline="\n")
+        self._active, self._size, self._count = seg, 0, 0
+        self._ends[seg] = 0
+
+    def _sync(self) -> None:
+        # 调用方已持有 self._lock
+        if self._f is None:
+            return
+        self._f.flush()
+        self._idx_f.flush()
+        if self._pending:
+            os.fsync(self._f.fileno())
+            os.fsync(self._idx_f.fileno())
+        self._pending = 0
+        self._synced_at = time.time()
+
+    def _close_active(self) -> None:
+        if self._f is None:
+            return
+        self._sync()
+        self._f.close()
+        self._idx_f.close()
+        self._ends[self._active] = self._size
+        self._f = self._idx_f = None
+        self._active = None
+
+    def flush(self) -> None:
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_active()
+            for mm, _ in self._maps.values():
+                mm.close()
+            self._maps.clear()
+
+    # =====================================================
+    # 读取（mmap）
+    # =====================================================
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self._index
+
+    def _read(self, loc: Tuple[int, int, int]) -> Dict[str, Any]:
+        seg, offset, length = loc
+        with self._lock:
+            mm, size = self._maps.get(seg, (None, 0))
+            if offset + length > size:
+                if mm is not None:
+                    mm.close()
+                with open(self._segment_path(seg), "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[seg] = (mm, len(mm))
+            raw = mm[offset:offset + length]
+        return json.loads(raw)
+
+    def get(self, record_id: str) -> Dict[str, Any]:
+        loc = self._index.get(record_id)
+        if loc is None and self.refresh():
+            loc = self._index.get(record_id)
+        if loc is None:
+            raise KeyError(f"记录不存在: {record_id}")
+        return self._read(loc)["data"]
+
+    def _locations(self) -> List[Tuple[str, Tuple[int, int, int]]]:
+        with self._lock:
+            return sorted(self._index.items(), key=lambda item: item[1])
+
+    def scan(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        按写入顺序遍历全部有效记录，产出 (id, record)
+        """
+        for record_id, loc in self._locations():
+            yield record_id, self._read(loc)["data"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            segments = self._segments()
+            size = sum(os.path.getsize(self._segment_path(s)) for s in segments)
+            live = sum(length for _, _, length in self._index.values())
+        return {"records": len(self._index), "segments": len(segments), "bytes": size, "live_bytes": live}
+
+    # =====================================================
+    # 压缩 / 导出
+    # =====================================================
+    def compact(self) -> Dict[str, Any]:
+        """
+        把全部有效记录按原顺序拷贝进新段（直接复制原始字节，不重新序列化），
+        去掉被覆盖与已删除的记录后删除旧段；应在没有其他写入进程时执行
+        """
+        with self._lock:
+            self._close_active()
+            self.refresh()
+            before = self.stats()
+            old = self._segments()
+            locations = self._locations()
+
+            new_index: Dict[str, Tuple[int, int, int]] = {}
+            for record_id, loc in locations:
+                raw = self._raw(loc)
+                if self._active is None or self._size >= self.segment_bytes:
+                    self._roll()
+                offset = self._size
+                self._f.write(raw)
+                self._idx_f.write(f"{record_id}\t{offset}\t{len(raw)}\tR\n")
+                self._size += len(raw)
+                self._count += 1
+                self._pending += 1
+                new_index[record_id] = (self._active, offset, len(raw))
+            self._close_active()
+
+            for mm, _ in self._maps.values():
+                mm.close()
+            self._maps.clear()
+            for seg in old:
+                for path in (self._segment_path(seg), self._idx_path(seg)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                self._ends.pop(seg, None)
+            self._index = new_index
+
+            after = self.stats()
+        return {
+            "records": after["records"],
+            "segments_before": before["segments"],
+            "segments_after": after["segments"],
+            "bytes_before": before["bytes"],
+            "bytes_after": after["bytes"]
+        }
+
+    def _raw(self, loc: Tuple[int, int, int]) -> bytes:
+        seg, offset, length = loc
+        with open(self._segment_path(seg), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def export(self, dest_dir: str, indent: int = 2) -> int:
+        """
+        兼容导出：还原成逐文件 JSON 布局（文件名为保存时的原名，重名时加序号），返回导出数量
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        used = set(os.listdir(dest_dir))
+        count = 0
+        for record_id, loc in self._locations():
+            rec = self._read(loc)
+            name = rec.get("name") or f"{record_id}.json"
+            stem, ext = os.path.splitext(name)
+            n = 1
+            while name in used:
+                n += 1
+                name = f"{stem}_{n}{ext}"
+            used.add(name)
+            with open(os.path.join(dest_dir, name), "w", encoding="utf-8") as f:
+                json.dump(rec["data"], f, ensure_ascii=False, indent=indent)
+            count += 1
+        return count
+
+
+# =====================================================
+# 进程内共享实例与路径解析
+# =====================================================
+_stores: Dict[str, SegmentStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(base_dir: str, **options) -> SegmentStore:
+    """
+    同一目录在进程内只打开一次（共享活动段），进程退出时自动 fsync 并关闭
+    """
+    key = os.path.abspath(base_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = SegmentStore(base_dir, **options)
+            _stores[key] = store
+            atexit.register(store.close)
+        return store
+
+
+def has_store(base_dir: str) -> bool:
+    return os.path.isdir(os.path.join(base_dir, SEGMENT_DIR))
+
+
+def parse_ref(path: str) -> Optional[Tuple[str, str]]:
+    """
+    "<base_dir>#<id>" -> (base_dir, id)；普通文件路径返回 None
+    """
+    base_dir, sep, record_id = (path or "").rpartition("#")
+    if not sep or not RECORD_ID_RE.match(record_id):
+        return None
+    return base_dir, record_id
+
+
+def record_exists(path: str) -> bool:
+    ref = parse_ref(path)
+    if ref is None:
+        return os.path.exists(path)
+    base_dir, record_id = ref
+    if not has_store(base_dir):
+        return False
+    store = open_store(base_dir)
+    return record_id in store or (store.refresh() > 0 and record_id in store)
+
+
+def read_record(path: str) -> Dict[str, Any]:
+    """
+    读取教案 / 提示词：分段存储引用或旧版逐文件 JSON 均可
+    """
+    ref = parse_ref(path)
+    if ref is None:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    base_dir, record_id = ref
+    return open_store(base_dir).get(record_id)
+
+
+def iter_records(base_dir: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    遍历目录下的全部记录（旧版 *.json 文件在前，分段存储在后），产出 (路径或引用, record)
+    损坏的文件打印提示后跳过
+    """
+    for path in sorted(glob.glob(os.path.join(base_dir, "*.json"))):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                yield path, json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 跳过无法解析的文件 {path}: {e}")
+    if has_store(base_dir):
+        store = open_store(base_dir)
+        store.refresh()
+        for record_id, record in store.scan():
+            yield store.ref(record_id), record
+
+
+def _build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="分段存储维护：统计 / 压缩 / 导出为逐文件 JSON")
+    ap.add_argument("action", choices=("stats", "compact", "export"))
+    ap.add_argument("base_dir", help="存储目录，如 storage/prompt_db")
+    ap.add_argument("--dest", help="export 的输出目录")
+    ap.add_argument("--indent", type=int, default=2, help="export 的 JSON 缩进（教案 2 / 提示词 4）")
+    return ap
+
+
+if __name__ == "__main__":
+
+    args = _build_arg_parser().parse_args()
+    if not has_store(args.base_dir):
+        print(f"❌ {args.base_dir} 下没有分段存储")
+        raise SystemExit(1)
+
+    seg_store = open_store(args.base_dir)
+    if args.action == "stats":
+        print(json.dumps(seg_store.stats(), ensure_ascii=False, indent=2))
+    elif args.action == "compact":
+        print(f"🗜️ 压缩完成：{seg_store.compact()}")
+    else:
+        if not args.dest:
+            print("❌ export 需要 --dest")
+            raise SystemExit(1)
+        print(f"📤 已导出 {seg_store.export(args.dest, args.indent)} 条记录至：{args.dest}")
@@ -0,0 +1,236 @@
+import json
+import os
+import re
+import shutil
+import threading
+import unicodedata
+import zlib
+from typing import Dict, Any, List
+
+import numpy as np
+
+
+# 对话里的说话人标签（"A：" "B:"），几乎每篇都有，会冲淡相似度
+SPEAKER_RE = re.compile(r"(?m)^\s*[A-Za-z]{1,2}\s*[：:]")
+
+
+class TopicIndex:
+    """
+    近重复主题检索：教案的输入内容（input_content）与课文各自切成字符 1~2-gram，
+    哈希到固定维度后按 TF-IDF 加权，存成 NumPy 矩阵；查询时两次矩阵乘法得到全部余弦相似度
+    相似度取 max(与历史输入内容, 与历史课文)，因为请求既可能是一个主题，也可能直接贴了一段对话
+    数据来源是 LessonIndex 的 plans 表，本索引只是其上的向量缓存，可随时重建
+    可选依赖：需要 numpy（pip install numpy）；未安装时 main 跳过相似主题检索，其余流程不受影响
+    """
+
+    def __init__(self, dim: int = 2048, ngram: tuple = (1, 2)):
+        self.dim = dim
+        self.ngram = ngram
+        self._lock = threading.Lock()
+        self._rows: List[Dict[str, Any]] = []  # id, level, topic, run_id, path
+        self._by_path: Dict[str, int] = {}
+        # 预分配、按倍数扩容的行缓冲，前 len(self._rows) 行有效
+        self._topic_buf = np.zeros((0, dim), dtype=np.float32)
+        self._text_buf = np.zeros((0, dim), dtype=np.float32)
+        self._normed = None  # (topic, text, idf) 归一化矩阵缓存，写入后失效
+        self.last_id = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # =====================================================
+    # 向量化
+    # =====================================================
+    @staticmethod
+    def normalize(text: str) -> str:
+        # 全半角统一、去掉标点与空白，只保留文字与数字
+        text = SPEAKER_RE.sub("", unicodedata.normalize("NFKC", text or "")).lower()
+        return "".join(ch for ch in text if ch.isalnum())
+
+    def vectorize(self, text: str) -> np.ndarray:
+        """
+        字符 n-gram 词频（1 + log tf），哈希到 dim 维
+        """
+        text = self.normalize(text)
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for n in range(self.ngram[0], self.ngram[1] + 1):
+            for i in range(len(text) - n + 1):
+                vec[zlib.crc32(text[i:i + n].encode("utf-8")) % self.dim] += 1
+        nz = vec > 0
+        vec[nz] = 1 + np.log(vec[nz])
+        return vec
+
+    # =====================================================
+    # 写入 / 同步
+    # =====================================================
+    def add(self, plan_id: int, level: str, topic: str, lesson_text: str, run_id: str, path: str) -> None:
+        topic_vec, text_vec = self.vectorize(topic), self.vectorize(lesson_text)
+        row = {"id": plan_id, "level": level, "topic": topic, "run_id": run_id, "path": path}
+        with self._lock:
+            i = self._by_path.get(path)
+            if i is None:
+                # 同一教案文件重新登记时（INSERT OR REPLACE 会换 id）原地覆盖，不产生重复行
+                i = len(self._rows)
+                if i == len(self._topic_buf):
+                    self._grow(max(64, 2 * i))
+                self._rows.append(row)
+                self._by_path[path] = i
+            else:
+                self._rows[i] = row
+            self._topic_buf[i], self._text_buf[i] = topic_vec, text_vec
+            self.last_id = max(self.last_id, plan_id)
+            self._normed = None
+
+    def sync(self, index, prune: bool = False) -> int:
+        """
+        从 LessonIndex 增量拉取 last_id 之后登记的教案；prune=True 时同时剔除已删除的记录
+        返回新增条数
+        """
+        rows = index.plans_since(self.last_id)
+        for r in rows:
+            self.add(r["id"], r["level"], r["topic"], r["lesson_text"] or "", r["run_id"], r["path"])
+        if prune:
+            live = set(index.plan_ids())
+            with self._lock:
+                keep = [i for i, r in enumerate(self._rows) if r["id"] in live]
+                if len(keep) != len(self._rows):
+                    self._take(keep)
+        return len(rows)
+
+    @property
+    def _topic_tf(self) -> np.ndarray:
+        return self._topic_buf[:len(self._rows)]
+
+    @property
+    def _text_tf(self) -> np.ndarray:
+        return self._text_buf[:len(self._rows)]
+
+    def _grow(self, capacity: int) -> None:
+        # 调用方已持有 self._lock
+        n = len(self._rows)
+        for name in ("_topic_buf", "_text_buf"):
+            buf = np.zeros((capacity, self.dim), dtype=np.float32)
+            buf[:n] = getattr(self, name)[:n]
+            setattr(self, name, buf)
+
+    def _take(self, keep: List[int]) -> None:
+        # 调用方已持有 self._lock
+        self._rows = [self._rows[i] for i in keep]
+        self._by_path = {r["path"]: i for i, r in enumerate(self._rows)}
+        self._topic_buf = self._topic_buf[keep]
+        self._text_buf = self._text_buf[keep]
+        self._normed = None
+
+    # =====================================================
+    # 查询
+    # =====================================================
+    def search(self, level: str, query: str, k: int = 3, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        在同一等级内查找与 query 最相似的教案，按相似度降序返回
+        每条结果带 score（取两者较大值）、topic_score、text_score 与 run_id / path
+        """
+        with self._lock:
+            if not self._rows:
+                return []
+            topic_m, text_m, idf = self._matrices()
+            rows = self._rows
+            levels = np.array([r["level"] == level for r in rows])
+
+        q = self.vectorize(query) * idf
+        norm = np.linalg.norm(q)
+        if not norm or not levels.any():
+            return []
+        q /= norm
+        topic_scores = topic_m @ q
+        text_scores = text_m @ q
+        scores = np.where(levels, np.maximum(topic_scores, text_scores), -1.0)
+
+        top = np.argsort(-scores)[:k]
+        return [
+            dict(rows[i], score=round(float(scores[i]), 4),
+                 topic_score=round(float(topic_scores[i]), 4), text_score=round(float(text_scores[i]), 4))
+            for i in top if scores[i] >= max(min_score, 0.0) and levels[i]
+        ]
+
+    def _matrices(self):
+        # 调用方已持有 self._lock；IDF 按教案计文档频率（输入内容或课文中出现即计一次）
+        if self._normed is None:
+            n = len(self._rows)
+            df = np.count_nonzero((self._topic_tf > 0) | (self._text_tf > 0), axis=0)
+            idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+            self._normed = (self._l2(self._topic_tf * idf), self._l2(self._text_tf * idf), idf)
+        return self._normed
+
+    @staticmethod
+    def _l2(m: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(m, axis=1, keepdims=True)
+        return m / np.where(norms == 0, 1, norms)
+
+    # =====================================================
+    # 持久化：向量缓存落盘，下次启动只增量同步新教案
+    # =====================================================
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with self._lock, open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                topic_tf=self._topic_tf,
+                text_tf=self._text_tf,
+                meta=np.array(json.dumps(
+                    {"dim": self.dim, "ngram": list(self.ngram), "last_id": self.last_id, "rows": self._rows},
+                    ensure_ascii=False))
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, dim: int = 2048, ngram: tuple = (1, 2)) -> "TopicIndex":
+        """
+        读取向量缓存；文件不存在、损坏或参数不一致时返回空索引（随后 sync 全量重建）
+        """
+        index = cls(dim, ngram)
+        if not os.path.exists(path):
+            return index
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta["dim"] != dim or tuple(meta["ngram"]) != tuple(ngram):
+                    return index
+                index._topic_buf = data["topic_tf"]
+                index._text_buf = data["text_tf"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ 主题索引缓存不可用，将重建: {e}")
+            return cls(dim, ngram)
+        index._rows = meta["rows"]
+        index._by_path = {r["path"]: i for i, r in enumerate(index._rows)}
+        index.last_id = meta["last_id"]
+        return index
+
+    @classmethod
+    def open(cls, path: str, lesson_index) -> "TopicIndex":
+        """
+        读取缓存并与 LessonIndex 对齐（增量 + 剔除已删除），有变化时写回缓存
+        """
+        index = cls.load(path)
+        size = len(index)
+        added = index.sync(lesson_index, prune=True)
+        if added or len(index) != size or not os.path.exists(path):
+            index.save(path)
+        return index
+
+
+def link_artifact(src: str, dest_dir: str) -> str:
+    """
+    把复用的素材放进新运行的目录：优先硬链接（不占额外空间），跨磁盘时复制
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    dest = os.path.join(dest_dir, os.path.basename(src))
+    if os.path.abspath(src) == os.path.abspath(dest):
+        return dest
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+    return dest
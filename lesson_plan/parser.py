@@ -1,37 +1,435 @@
+import hashlib
 import re
-from typing import Dict
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+
+CN_NUMERALS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+
+# 一次扫描同时识别：一级标题「一、」、二级标题「（一）」、课文标记【课文开始】【课文结束】
+# 标题允许带 Markdown 前缀 / 加粗（如 "## 一、教学目标"、"**（一）生词**"）
+TOKEN_RE = re.compile(
+    r"^[ \t#>*]*(?:(?P<h1>[一二三四五六七八九十]{1,3})、|[（(](?P<h2>[一二三四五六七八九十]{1,3})[）)])"
+    r"[ \t*]*(?P<title>[^\n]*)$"
+    r"|(?P<tag>【课文开始】|【课文结束】)",
+    re.M
+)
+
+VOCAB_LABELS = {
+    "word": ("生词", "词语", "词汇"),
+    "pinyin": ("拼音",),
+    "pos": ("词性",),
+    "gloss": ("英文释义", "释义", "英文", "English", "翻译"),
+    "example": ("例句",),
+}
+
+POS_RE = re.compile(
+    r"(?<![A-Za-z])(?:n|v|adj|adv|m|mw|pron|prep|conj|num|part|int|interj|aux|phr|q|vo|pn)\.(?![A-Za-z])"
+    r"|名词|动词|形容词|副词|量词|代词|介词|连词|数词|助词|叹词|能愿动词|离合词|短语|专有名词"
+)
+LATIN_CHARS = "A-Za-zāáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜüÜĀÁǍÀĒÉĚÈĪÍǏÌŌÓǑÒŪÚǓÙ'"
+LATIN_WORD_RE = re.compile(f"[{LATIN_CHARS}]+")
+# 紧跟词语的括号拼音，如 "什么（shén me）"，整段括号内容即拼音
+BRACKET_PINYIN_RE = re.compile(rf"^\s*[（(]\s*(?P<pinyin>[{LATIN_CHARS}]+(?:[ \t-]+[{LATIN_CHARS}]+)*)\s*[）)]")
+# 不带括号时，词性缩写之前的一串音节（可不带声调，如 "呢 ne part."）
+PLAIN_PINYIN_RE = re.compile(rf"^\s*(?P<pinyin>[{LATIN_CHARS}]+(?:[ \t]+[{LATIN_CHARS}]+)*)\s*$")
+WORD_RE = re.compile(r"[\u4e00-\u9fff][\u4e00-\u9fff…·]*")
+ENTRY_PREFIX_RE = re.compile(r"^\s*(?:[-*•]\s*)?(?:\d+\s*[.、．)）]\s*)?[*\s]*")
+LABEL_RE = re.compile(r"^\s*[-*•]?\s*\**\s*(?P<label>[^：:\s*]{1,6})\s*\**\s*[：:]\s*(?P<value>.*)$")
+TONE_MARKS = set("āáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜ")
+
+
+class Section:
+    """
+    教案中的一个标题节点：一级（一、教学目标）或二级（（一）知识目标）
+    start / end 为整节（含标题行）在原文中的位置，正文按需切片
+    """
+
+    __slots__ = ("level", "number", "title", "key", "path", "start", "body_start", "end",
+                 "children", "parent", "_source")
+
+    def __init__(self, level: int, number: int, title: str, start: int, body_start: int,
+                 parent: "Section" = None, source: str = ""):
+        self.level = level
+        self.number = number
+        self.title = title
+        # 去掉括号说明与冒号后的部分，得到规范名，如 "生词（包括拼音…）" -> "生词"
+        self.key = re.split(r"[（(：:\s]", title, maxsplit=1)[0].strip("*# ") or title
+        self.path = f"{parent.path}/{self.key}" if parent is not None and parent.level else self.key
+        self.start = start
+        self.body_start = body_start
+        self.end = len(source)
+        self.children: List["Section"] = []
+        self.parent = parent
+        self._source = source
+
+    @property
+    def text(self) -> str:
+        """
+        本节正文（不含标题行，包含子节）
+        """
+        return self._source[self.body_start:self.end].strip()
+
+    @property
+    def intro(self) -> str:
+        """
+        本节正文中第一个子标题之前的部分
+        """
+        stop = self.children[0].start if self.children else self.end
+        return self._source[self.body_start:stop].strip()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "level": self.level,
+            "number": self.number,
+            "title": self.title,
+            "key": self.key,
+            "path": self.path,
+            "text": self.intro if self.children else self.text,
+            "children": [c.to_dict() for c in self.children]
+        }
+
+    def __repr__(self) -> str:
+        return f"Section({self.path!r}, children={len(self.children)})"
+
+
+class VocabEntry:
+    """
+    生词表中的一行：词语、拼音、词性、英文释义、例句
+    """
+
+    __slots__ = ("word", "pinyin", "pos", "gloss", "example")
+
+    def __init__(self, word: str = "", pinyin: str = "", pos: str = "", gloss: str = "", example: str = ""):
+        self.word = word
+        self.pinyin = pinyin
+        self.pos = pos
+        self.gloss = gloss
+        self.example = example
+
+    def to_dict(self) -> Dict[str, str]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"VocabEntry({self.word!r}, {self.pinyin!r})"
+
+
+class PlanDocument:
+    """
+    一份教案的解析结果：一次扫描建立标题树，按规范名或路径 O(1) 查询任意栏目
+    通过 parse_plan() 获取（按教案内容哈希缓存），不要直接修改
+    """
+
+    __slots__ = ("text", "digest", "root", "sections", "_by_key", "_by_path", "_lesson_span", "_vocab")
+
+    def __init__(self, text: str, digest: str):
+        self.text = text
+        self.digest = digest
+        self.root = Section(0, 0, "", 0, 0, source=text)
+        self.sections: List[Section] = []
+        self._by_key: Dict[str, Section] = {}
+        self._by_path: Dict[str, Section] = {}
+        self._lesson_span: Optional[tuple] = None
+        self._vocab: Optional[List[VocabEntry]] = None
+        self._scan()
+
+    # =====================================================
+    # 单次扫描
+    # =====================================================
+    def _scan(self) -> None:
+        text = self.text
+        current_h1: Optional[Section] = None
+        current_h2: Optional[Section] = None
+        lesson_start = -1
+        in_lesson = False
+        # 只有确认开始标记之后还有结束标记，才把两者之间的编号行视为课文正文；
+        # 缺少结束标记时照常识别标题，课文取到下一个标题为止
+        open_at = text.find("【课文开始】")
+        lesson_closed = open_at >= 0 and text.find("【课文结束】", open_at) >= 0
+
+        for m in TOKEN_RE.finditer(text):
+            tag = m.group("tag")
+            if tag is not None:
+                if tag == "【课文开始】" and lesson_start < 0:
+                    lesson_start, in_lesson = m.end(), True
+                elif tag == "【课文结束】" and in_lesson and self._lesson_span is None:
+                    self._lesson_span = (lesson_start, m.start())
+                    in_lesson = False
+                continue
+            if in_lesson and lesson_closed:
+                continue  # 课文正文里的编号行不当作标题
+
+            title = m.group("title").strip().rstrip("*#").strip()
+            body_start = m.end() + 1
+            # "（一）知识目标：掌握……" 这类同行写正文的，冒号后的内容归入正文
+            # 括号内的冒号属于标题说明（如 "语法（包括：中文解释、……）"），不切分
+            colon = self._top_level_colon(title)
+            if colon > 0:
+                raw = m.group("title")
+                body_start = m.start("title") + (len(raw) - len(raw.lstrip())) + colon + 1
+                title = title[:colon].strip("* ")
+            if m.group("h1") is not None:
+                number = self._numeral(m.group("h1"))
+                # 编号须递增，教学步骤里的 "一、导入" 之类不会打断结构
+                if number is None or (current_h1 is not None and number <= current_h1.number):
+                    continue
+                for open_section in (current_h2, current_h1):
+                    if open_section is not None:
+                        open_section.end = m.start()
+                current_h1 = self._add(Section(1, number, title, m.start(), body_start, self.root, text))
+                current_h2 = None
+            else:
+                number = self._numeral(m.group("h2"))
+                parent = current_h1 or self.root
+                if number is None or (current_h2 is not None and number <= current_h2.number):
+                    continue
+                if current_h2 is not None:
+                    current_h2.end = m.start()
+                current_h2 = self._add(Section(2, number, title, m.start(), body_start, parent, text))
+
+        if in_lesson:
+            # 只有开始标记：课文取到下一个标题（或全文末尾）
+            following = [s.start for s in self.sections if s.start > lesson_start]
+            self._lesson_span = (lesson_start, following[0] if following else len(text))
+
+    def _add(self, section: Section) -> Section:
+        section.body_start = min(section.body_start, len(self.text))
+        section.parent.children.append(section)
+        self.sections.append(section)
+        self._by_path.setdefault(section.path, section)
+        self._by_key.setdefault(section.key, section)
+        return section
+
+    @staticmethod
+    def _top_level_colon(title: str) -> int:
+        """
+        返回不在（）/ () 内的第一个冒号位置，没有时返回 -1
+        """
+        depth = 0
+        for i, ch in enumerate(title):
+            if ch in "（(":
+                depth += 1
+            elif ch in "）)":
+                depth = max(0, depth - 1)
+            elif ch in "：:" and depth == 0 and i > 0:
+                return i
+        return -1
+
+    @staticmethod
+    def _numeral(value: str) -> Optional[int]:
+        if value in CN_NUMERALS:
+            return CN_NUMERALS[value]
+        if len(value) == 2 and value[0] == "十" and value[1] in CN_NUMERALS:
+            return 10 + CN_NUMERALS[value[1]]
+        return None
+
+    # =====================================================
+    # 查询
+    # =====================================================
+    def section(self, name: str) -> Optional[Section]:
+        """
+        按规范名（"语法"）或路径（"教学内容/语法"）查找栏目
+        """
+        return self._by_path.get(name) or self._by_key.get(name)
+
+    def section_text(self, name: str) -> str:
+        section = self.section(name)
+        return section.text if section is not None else ""
+
+    @property
+    def lesson_text(self) -> str:
+        """
+        优先取【课文开始】【课文结束】之间的内容，没有标记时退回到「课文」栏目正文
+        """
+        if self._lesson_span is not None:
+            return self.text[self._lesson_span[0]:self._lesson_span[1]].strip()
+        return self.section_text("课文")
+
+    @property
+    def vocabulary(self) -> List[VocabEntry]:
+        if self._vocab is None:
+            self._vocab = parse_vocabulary(self.section_text("生词"))
+        return self._vocab
+
+    def outline(self) -> Dict[str, str]:
+        """
+        {路径: 正文}，供入库或下游按栏目读取
+        """
+        return {s.path: s.text for s in self.sections}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "digest": self.digest,
+            "lesson_text": self.lesson_text,
+            "vocabulary": [v.to_dict() for v in self.vocabulary],
+            "sections": [s.to_dict() for s in self.root.children]
+        }
+
+
+# =====================================================
+# 生词表解析：兼容 Markdown 表格、"1. 词 (pinyin) n. gloss 例句：…" 单行式与分行标注式
+# =====================================================
+def parse_vocabulary(text: str) -> List[VocabEntry]:
+    entries: List[VocabEntry] = []
+    columns: Optional[List[Optional[str]]] = None
+    current: Optional[VocabEntry] = None
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+
+        if line.startswith("|"):
+            cells = [c.strip().strip("*") for c in line.strip("|").split("|")]
+            if all(set(c) <= set("-: ") for c in cells):
+                continue  # 表格分隔行
+            if columns is None and any(_label_of(c) for c in cells):
+                columns = [_label_of(c) for c in cells]
+                continue
+            fields = dict(zip(columns or ["word", "pinyin", "pos", "gloss", "example"], cells))
+            fields.pop(None, None)
+            if fields.get("word"):
+                current = VocabEntry(**{k: v for k, v in fields.items() if k in VocabEntry.__slots__})
+                entries.append(current)
+            continue
+
+        labeled = LABEL_RE.match(line)
+        if labeled and _label_of(labeled.group("label")):
+            field = _label_of(labeled.group("label"))
+            value = labeled.group("value").strip().strip("*").strip()
+            if field == "word" or current is None:
+                current = VocabEntry()
+                entries.append(current)
+            setattr(current, field, value)
+            continue
+
+        entry = _parse_inline_entry(line)
+        if entry is not None:
+            current = entry
+            entries.append(entry)
+        elif current is not None and not current.example:
+            current.gloss = f"{current.gloss} {line}".strip() if current.gloss else line
+    return entries
+
+
+def _label_of(cell: str) -> Optional[str]:
+    cell = cell.strip().strip("*").strip()
+    for field, labels in VOCAB_LABELS.items():
+        if any(cell.startswith(label) for label in labels):
+            return field
+    return None
+
+
+def _parse_inline_entry(line: str) -> Optional[VocabEntry]:
+    body = ENTRY_PREFIX_RE.sub("", line, 1)
+    word = WORD_RE.match(body)
+    if not word:
+        return None
+    rest = body[word.end():]
+
+    example = ""
+    for marker in ("例句：", "例句:", "例："):
+        if marker in rest:
+            rest, example = rest.split(marker, 1)
+            break
+
+    pinyin = ""
+    span = None
+    pos_match = POS_RE.search(rest)
+    bracketed = BRACKET_PINYIN_RE.match(rest)
+    plain = PLAIN_PINYIN_RE.match(rest[:pos_match.start()]) if pos_match else None
+    if bracketed:
+        # 括号紧跟词语：括号内整段都是拼音（多音节、轻声均可）
+        pinyin, span = bracketed.group("pinyin"), [bracketed.start(), bracketed.end()]
+    elif plain:
+        # 词语与词性之间只有拉丁字母音节：整串都是拼音，不要求声调符号（如 "呢 ne part."）
+        pinyin, span = plain.group("pinyin"), [plain.start("pinyin"), plain.end("pinyin")]
+    else:
+        # 其余情况只有带声调符号的连续音节才算拼音，避免把英文释义或词性缩写当作拼音
+        for match in LATIN_WORD_RE.finditer(rest):
+            toned = bool(TONE_MARKS & set(match.group(0).lower()))
+            if span is None:
+                if toned:
+                    span = [match.start(), match.end()]
+            elif toned and not rest[span[1]:match.start()].strip():
+                span[1] = match.end()
+            else:
+                break
+        if span is not None:
+            pinyin = rest[span[0]:span[1]]
+    if span is not None:
+        rest = rest[:span[0]] + rest[span[1]:]
+
+    pos = ""
+    pos_match = POS_RE.search(rest)
+    if pos_match:
+        pos = pos_match.group(0)
+        rest = rest[:pos_match.start()] + rest[pos_match.end():]
+
+    gloss = re.sub(r"^[\s*（()）\[\]【】,，;；/|:：-]+|[\s*（()）\[\]【】,，;；/|:：-]+$", "", rest)
+    gloss = re.sub(r"[（()）\[\]]", "", gloss).strip()
+    if not (pinyin or pos or gloss or example) and body[word.end():].strip("* "):
+        return None  # 不是生词行（如说明文字）；只有词语本身的行则是分行标注式条目的开头
+    return VocabEntry(word.group(0), pinyin, pos, gloss, example.strip().strip("*").strip())
+
+
+# =====================================================
+# 解析缓存：同一份教案在各阶段与索引间只扫描一次
+# =====================================================
+_CACHE_SIZE = 256
+_cache: "OrderedDict[str, PlanDocument]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def parse_plan(text: str) -> PlanDocument:
+    text = text or ""
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        doc = _cache.get(digest)
+        if doc is not None:
+            _cache.move_to_end(digest)
+            return doc
+    doc = PlanDocument(text, digest)
+    with _cache_lock:
+        _cache[digest] = doc
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return doc
 
 
 class TeachingPlanParser:
     """
     教案解析器：从教案中提取纯净的课文及其他教学要素
+    基于 parse_plan() 的标题树，原有接口保持不变
     """
 
     def __init__(self, teaching_plan_text: str):
         self.text = teaching_plan_text
+        self.document = parse_plan(teaching_plan_text)
 
     def extract_lesson_text(self) -> str:
         """
-        提取标记内的纯净课文内容
+        提取标记内的纯净课文内容（无标记时降级使用「课文」栏目）
         """
-        # 尝试匹配标记内的内容
-        tag_pattern = r"【课文开始】([\s\S]*?)【课文结束】"
-        match = re.search(tag_pattern, self.text)
-        if match:
-            return match.group(1).strip()
-
-        # 如果模型没有生成标记，降级使用标题匹配逻辑（兼容性处理）
-        fallback_pattern = r"（二）课文([\s\S]*?)（三）语法"
-        match = re.search(fallback_pattern, self.text)
-        return match.group(1).strip() if match else ""
+        return self.document.lesson_text
 
     def extract_vocab(self) -> str:
-        pattern = r"（一）生词([\s\S]*?)（二）课文"
-        match = re.search(pattern, self.text)
-        return match.group(1).strip() if match else ""
+        return self.document.section_text("生词")
+
+    def extract_section(self, name: str) -> str:
+        """
+        按栏目名（如 "语法"、"教学重点"）或路径（如 "教学内容/文化"）提取正文
+        """
+        return self.document.section_text(name)
+
+    def extract_vocab_table(self) -> List[Dict[str, str]]:
+        return [entry.to_dict() for entry in self.document.vocabulary]
 
-    def parse(self) -> Dict[str, str]:
+    def parse(self) -> Dict[str, Any]:
         return {
             "lesson_text": self.extract_lesson_text(),
-            "vocabulary": self.extract_vocab()
-        }
\ No newline at end of file
+            "vocabulary": self.extract_vocab(),
+            "vocab_table": self.extract_vocab_table(),
+            "sections": self.document.outline()
+        }
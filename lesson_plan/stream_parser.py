@@ -0,0 +1,55 @@
+from typing import Callable, Optional
+
+
+class IncrementalLessonParser:
+    """
+    增量课文解析器：边接收流式教案边查找【课文开始】…【课文结束】
+    结束标记一到达即回调课文内容，无需等待整份教案生成完毕
+    """
+
+    START_TAG = "【课文开始】"
+    END_TAG = "【课文结束】"
+
+    def __init__(self, on_lesson_text: Optional[Callable[[str], None]] = None):
+        self.on_lesson_text = on_lesson_text
+        self.lesson_text: Optional[str] = None
+        self._buffer = ""
+        self._scan_pos = 0
+        self._start_idx = -1
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    @property
+    def found(self) -> bool:
+        return self.lesson_text is not None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """
+        追加一段流式文本；若本次恰好收齐课文则返回课文内容
+        只从上次扫描位置（回退一个标记长度）继续查找，避免重复扫描全文
+        """
+        if not chunk:
+            return None
+        self._buffer += chunk
+        if self.found:
+            return None
+
+        if self._start_idx < 0:
+            idx = self._buffer.find(self.START_TAG, max(0, self._scan_pos - len(self.START_TAG)))
+            if idx < 0:
+                self._scan_pos = len(self._buffer)
+                return None
+            self._start_idx = idx + len(self.START_TAG)
+            self._scan_pos = self._start_idx
+
+        end = self._buffer.find(self.END_TAG, max(self._start_idx, self._scan_pos - len(self.END_TAG)))
+        if end < 0:
+            self._scan_pos = len(self._buffer)
+            return None
+
+        self.lesson_text = self._buffer[self._start_idx:end].strip()
+        if self.on_lesson_text is not None:
+            self.on_lesson_text(self.lesson_text)
+        return self.lesson_text
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Qwen 响应缓存（内容寻址，持久化到磁盘）
+    键 = hash(模型 + messages + 采样参数)，同一输入的重复调用直接从本地读取
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = os.path.join("storage", "llm_cache"),
+        max_bytes: int = 200 * 1024 * 1024,
+        max_age: float = 30 * 24 * 3600,
+        evict_every: int = 32
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evict_every = max(1, evict_every)
+        self._puts = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # =====================================================
+    # 键与路径
+    # =====================================================
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+        raw = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    # =====================================================
+    # 读写
+    # =====================================================
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        if self.max_age and time.time() - entry.get("created_at", 0) > self.max_age:
+            self._remove(path)
+            self._count(hit=False)
+            return None
+
+        # 刷新访问时间，淘汰时按最近使用排序
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self._count(hit=True)
+        return entry
+
+    def put(self, key: str, content: str, usage: Dict[str, int] = None) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"created_at": time.time(), "content": content, "usage": usage or {}}
+
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        # 每写入若干条才扫描一次目录，避免每次写入都遍历整个缓存
+        with self._lock:
+            self._puts += 1
+            due = self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        清理过期条目，并在总大小超限时按最近使用时间淘汰，返回删除数量
+        """
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+
+        removed = 0
+        total = 0
+        kept = []
+        for mtime, size, path in files:
+            if self.max_age and now - mtime > self.max_age:
+                removed += self._remove(path)
+            else:
+                kept.append((mtime, size, path))
+                total += size
+
+        if self.max_bytes and total > self.max_bytes:
+            for mtime, size, path in sorted(kept):
+                if total <= self.max_bytes:
+                    break
+                removed += self._remove(path)
+                total -= size
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    # =====================================================
+    # 带缓存的 chat.completions 调用
+    # =====================================================
+    def completion(
+        self,
+        client,
+        model: str,
+        messages: List[Dict[str, str]],
+        use_cache: bool = True,
+        governor=None,
+        **params
+    ) -> Tuple[str, Dict[str, int], bool]:
+        """
+        返回 (content, usage, 是否命中缓存)
+        use_cache=False 时跳过读取、强制请求模型，并用新结果覆盖缓存
+        传入 governor（ProviderGovernor）时，未命中缓存的请求经其限速与重试
+        """
+        key = self.make_key(model, messages, params)
+        if use_cache:
+            entry = self.get(key)
+            if entry is not None:
+                return entry["content"], entry.get("usage", {}), True
+
+        request = dict(model=model, messages=messages, stream=False, **params)
+        if governor is not None:
+            completion = governor.call(client.chat.completions.create, **request)
+        else:
+            completion = client.chat.completions.create(**request)
+        content = completion.choices[0].message.content
+        usage = {
+            "prompt_tokens": completion.usage.prompt_tokens,
+            "completion_tokens": completion.usage.completion_tokens,
+            "total_tokens": completion.usage.total_tokens
+        }
+        self.put(key, content, usage)
+        return content, usage, False
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
@@ -1,9 +1,32 @@
 from openai import OpenAI
 import os
+import re
 import json
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Tuple
 from datetime import datetime
 
+from llm.response_cache import ResponseCache
+from lesson_plan.stream_parser import IncrementalLessonParser
+from common.tracing import tracer
+from common.governor import get_governor
+
+
+NUMBERING_RE = re.compile(r"^[（(]?[一二三四五六七八九十]+[、）)]")
+
+# 栏目并行模式：先生成核心（生词 + 课文），其余栏目以核心为条件并发生成
+# (键, 标题行, 撰写要求)
+PLAN_SECTIONS = (
+    ("goals", "一、教学目标", "分（一）知识目标、（二）技能目标、（三）情感与文化目标三部分"),
+    ("core", "二、教学内容", "（一）生词与（二）课文"),
+    ("grammar", "（三）语法", "包括：中文解释、英文解释、例句、练习"),
+    ("hanzi", "（四）汉字", "与主题和生词相关"),
+    ("culture", "（五）文化", "与主题相关"),
+    ("focus", "三、教学重点与难点", "分（一）教学重点、（二）教学难点两部分"),
+    ("steps", "四、教学步骤（45分钟）", "按教学环节写明时间分配与师生活动"),
+    ("methods", "五、教学方法", "结合本课内容说明所用的教学方法"),
+)
+
 
 class QwenTeachingPlanGenerator:
     """
@@ -18,7 +41,12 @@ class QwenTeachingPlanGenerator:
         model: str = "qwen3-max",
         temperature: float = 0.7,
         top_p: float = 0.3,
-        save_dir: str = r"storage\teaching_db"
+        save_dir: str = r"storage\teaching_db",
+        cache: ResponseCache = None,
+        index=None,
+        base_url: str = None,
+        governor=None,
+        store=None
     ):
         # ========= API Key =========
         if api_key is None:
@@ -27,27 +55,29 @@ class QwenTeachingPlanGenerator:
                 raise ValueError("未检测到 DASHSCOPE_API_KEY，请设置环境变量或直接传入")
 
         # ========= Client =========
+        # 可通过参数或 DASHSCOPE_BASE_URL 指向其他兼容端点（如本地 mock）
+        # 重试统一交给 governor，关闭 SDK 自带的重试以免叠加
         self.client = OpenAI(
             api_key=api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+            base_url=base_url or os.getenv(
+                "DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
+            max_retries=0
         )
+        self.governor = governor or get_governor("qwen")
 
         self.model = model
         self.temperature = temperature
         self.top_p = top_p
         self.save_dir = save_dir
+        self.cache = cache
+        self.index = index  # 可选 LessonIndex，保存时同步写入索引
+        self.store = store  # 可选 SegmentStore，设置后教案追加到分段存储而不是逐个写 JSON 文件
         os.makedirs(self.save_dir, exist_ok=True)
 
     # =====================================================
-    # 教案生成主函数
+    # 提示词构造
     # =====================================================
-    def generate_teaching_plan(
-        self,
-        student_level: str,
-        content: str,
-        save: bool = True
-    ) -> Dict[str, Any]:
-
+    def _build_messages(self, student_level: str, content: str) -> List[Dict[str, str]]:
         system_prompt = """你是一名优秀的国际中文教师，具有优秀的教学组织能力和教案撰写能力。
 你必须严格按照规定结构撰写教案，不得缺项，不得合并栏目。
 
@@ -84,38 +114,125 @@ class QwenTeachingPlanGenerator:
 撰写一份可直接用于数字化国际中文教学的详细、完整教案。
 """
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
 
-        try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=False,
+    def _build_core_messages(self, student_level: str, content: str) -> List[Dict[str, str]]:
+        system_prompt = """你是一名优秀的国际中文教师，具有优秀的教学组织能力和教案撰写能力。
+本次只撰写教案「二、教学内容」中的以下两部分，不要输出其他栏目：
+
+（一）生词（包括拼音、词性、英文释义、例句）
+（二）课文
+    - 若输入内容为完整文本，请直接以输入内容作为课文，不能修改
+    - 若输入内容为话题，请围绕话题生成课文
+    - 课文一律使用【课文开始】【课文结束】标记
+    - 对话体课文需明确交际场景
+
+请以「（一）生词」开头直接输出。
+"""
+        user_prompt = f"""
+本次课程的学生汉语水平为：{student_level}。
+输入内容为：{content}。
+"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _build_section_messages(
+        self,
+        student_level: str,
+        content: str,
+        core: str,
+        heading: str,
+        requirement: str
+    ) -> List[Dict[str, str]]:
+        system_prompt = """你是一名优秀的国际中文教师，具有优秀的教学组织能力和教案撰写能力。
+你正在与其他老师分工撰写同一份教案，本次只负责其中一个栏目。
+"""
+        numbering = "" if "、" in heading else "\n正文中不要使用“一、”“（一）”形式的编号。"
+        user_prompt = f"""
+本次课程的学生汉语水平为：{student_level}。
+输入内容为：{content}。
+
+本课的生词与课文已经确定：
+{core}
+
+本次只撰写教案中的「{heading}」部分（{requirement}），内容须与上面的生词和课文一致。
+直接输出该部分正文，不要重复标题，不要输出其他栏目。{numbering}
+"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _complete(self, messages: List[Dict[str, str]], use_cache: bool = True) -> Tuple[str, Dict[str, int], bool]:
+        """
+        单次非流式调用，返回 (content, usage, 是否命中缓存)
+        """
+        if self.cache is not None:
+            # 命中缓存时直接返回本地结果；use_cache=False 则强制重新生成并刷新缓存
+            return self.cache.completion(
+                self.client,
+                self.model,
+                messages,
+                use_cache=use_cache,
+                governor=self.governor,
                 temperature=self.temperature,
                 top_p=self.top_p
             )
+        completion = self.governor.call(
+            self.client.chat.completions.create,
+            model=self.model,
+            messages=messages,
+            stream=False,
+            temperature=self.temperature,
+            top_p=self.top_p
+        )
+        usage = {
+            "prompt_tokens": completion.usage.prompt_tokens,
+            "completion_tokens": completion.usage.completion_tokens,
+            "total_tokens": completion.usage.total_tokens
+        }
+        return completion.choices[0].message.content, usage, False
 
-            teaching_plan_text = completion.choices[0].message.content
+    # =====================================================
+    # 教案生成主函数
+    # =====================================================
+    def generate_teaching_plan(
+        self,
+        student_level: str,
+        content: str,
+        save: bool = True,
+        use_cache: bool = True,
+        run_id: str = None
+    ) -> Dict[str, Any]:
+
+        messages = self._build_messages(student_level, content)
+
+        try:
+            with tracer.span("llm.plan", model=self.model, run_id=run_id) as sp:
+                teaching_plan_text, usage, cached = self._complete(messages, use_cache)
+                sp.set(cached=cached)
+                if not cached:
+                    sp.set(**usage)
 
             result = {
                 "success": True,
                 "student_level": student_level,
                 "input_content": content,
                 "teaching_plan": teaching_plan_text,
-                "usage": {
-                    "prompt_tokens": completion.usage.prompt_tokens,
-                    "completion_tokens": completion.usage.completion_tokens,
-                    "total_tokens": completion.usage.total_tokens
-                },
+                "usage": usage,
+                "cached": cached,
                 "model": self.model,
+                "run_id": run_id,
                 "created_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
 
             if save:
-                self._save_teaching_plan(result)
+                result["save_path"] = self._save_teaching_plan(result)
 
             return result
 
@@ -127,19 +244,219 @@ class QwenTeachingPlanGenerator:
                 "input_content": content
             }
 
+    # =====================================================
+    # 流式教案生成：课文一结束即回调，其余部分继续生成
+    # =====================================================
+    def generate_teaching_plan_stream(
+        self,
+        student_level: str,
+        content: str,
+        on_lesson_text: Callable[[str], None] = None,
+        save: bool = True,
+        use_cache: bool = True,
+        run_id: str = None
+    ) -> Dict[str, Any]:
+        """
+        以 stream=True 调用模型，边接收边用 IncrementalLessonParser 解析
+        收到【课文结束】时立即触发 on_lesson_text(课文)，下游的提示词生成 / TTS 可提前开始
+        返回结构与 generate_teaching_plan 相同
+        """
+        messages = self._build_messages(student_level, content)
+        parser = IncrementalLessonParser(on_lesson_text)
+        params = {"temperature": self.temperature, "top_p": self.top_p}
+
+        try:
+            with tracer.span("llm.plan", model=self.model, run_id=run_id, stream=True) as sp:
+                cache_key = None
+                entry = None
+                if self.cache is not None:
+                    cache_key = self.cache.make_key(self.model, messages, params)
+                    entry = self.cache.get(cache_key) if use_cache else None
+
+                if entry is not None:
+                    parser.feed(entry["content"])
+                    usage = entry.get("usage", {})
+                    cached = True
+                else:
+                    # 限速与重试只作用于建立请求；流开始后中途断开不重试（课文回调可能已触发）
+                    stream = self.governor.call(
+                        self.client.chat.completions.create,
+                        model=self.model,
+                        messages=messages,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **params
+                    )
+                    usage = {}
+                    for chunk in stream:
+                        if chunk.choices:
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                if "first_token_s" not in sp.attrs:
+                                    sp.set(first_token_s=round(sp.duration, 3))
+                                found = parser.found
+                                parser.feed(delta)
+                                if parser.found and not found:
+                                    sp.set(lesson_text_s=round(sp.duration, 3))
+                        if getattr(chunk, "usage", None):
+                            usage = {
+                                "prompt_tokens": chunk.usage.prompt_tokens,
+                                "completion_tokens": chunk.usage.completion_tokens,
+                                "total_tokens": chunk.usage.total_tokens
+                            }
+                    cached = False
+                    if cache_key is not None:
+                        self.cache.put(cache_key, parser.text, usage)
+                sp.set(cached=cached)
+                if not cached:
+                    sp.set(**usage)
+
+            result = {
+                "success": True,
+                "student_level": student_level,
+                "input_content": content,
+                "teaching_plan": parser.text,
+                "usage": usage,
+                "cached": cached,
+                "model": self.model,
+                "run_id": run_id,
+                "created_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+
+            if save:
+                result["save_path"] = self._save_teaching_plan(result)
+
+            return result
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "student_level": student_level,
+                "input_content": content
+            }
+
+    # =====================================================
+    # 栏目并行生成：耗时≈核心 + 最慢的一个栏目，而不是整份教案顺序生成
+    # =====================================================
+    def generate_teaching_plan_parallel(
+        self,
+        student_level: str,
+        content: str,
+        on_lesson_text: Callable[[str], None] = None,
+        save: bool = True,
+        use_cache: bool = True,
+        run_id: str = None
+    ) -> Dict[str, Any]:
+        """
+        先生成核心（生词 + 课文），课文就绪即触发 on_lesson_text；
+        再以核心为条件并发生成教学目标、语法、汉字、文化、重点难点、教学步骤、教学方法，
+        按 PLAN_SECTIONS 的顺序拼回与单次生成相同的标题结构（TeachingPlanParser 可直接解析）
+        返回结构与 generate_teaching_plan 相同，另含各栏目的 section_usage
+        """
+        section_usage = {}
+
+        def run_section(key: str, heading: str, messages: List[Dict[str, str]]) -> str:
+            with tracer.span("llm.plan.section", model=self.model, run_id=run_id, section=key) as ssp:
+                text, usage, cached = self._complete(messages, use_cache)
+                ssp.set(cached=cached)
+                if not cached:
+                    ssp.set(**usage)
+            section_usage[key] = dict(usage, cached=cached, seconds=round(ssp.duration, 3))
+            return self._strip_heading(text, heading)
+
+        try:
+            with tracer.span("llm.plan", model=self.model, run_id=run_id, parallel=True) as sp:
+                specs = {key: (heading, requirement) for key, heading, requirement in PLAN_SECTIONS}
+                core = run_section("core", specs["core"][0], self._build_core_messages(student_level, content))
+                IncrementalLessonParser(on_lesson_text).feed(core)
+                sp.set(lesson_text_s=round(sp.duration, 3))
+
+                others = [(key, heading, req) for key, heading, req in PLAN_SECTIONS if key != "core"]
+                with ThreadPoolExecutor(max_workers=len(others), thread_name_prefix="plan-section") as pool:
+                    futures = {
+                        key: pool.submit(
+                            run_section, key, heading,
+                            self._build_section_messages(student_level, content, core, heading, req))
+                        for key, heading, req in others
+                    }
+                    bodies = {key: future.result() for key, future in futures.items()}
+                bodies["core"] = core
+
+                teaching_plan_text = "\n\n".join(
+                    f"{heading}\n{bodies[key]}" for key, heading, _ in PLAN_SECTIONS)
+                usage = {
+                    name: sum(u.get(name, 0) for u in section_usage.values())
+                    for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+                }
+                cached = all(u["cached"] for u in section_usage.values())
+                sp.set(cached=cached)
+                if not cached:
+                    sp.set(**usage)
+
+            result = {
+                "success": True,
+                "student_level": student_level,
+                "input_content": content,
+                "teaching_plan": teaching_plan_text,
+                "usage": usage,
+                "section_usage": {key: section_usage[key] for key, _, _ in PLAN_SECTIONS},
+                "cached": cached,
+                "model": self.model,
+                "mode": "parallel",
+                "run_id": run_id,
+                "created_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+
+            if save:
+                result["save_path"] = self._save_teaching_plan(result)
+
+            return result
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "student_level": student_level,
+                "input_content": content
+            }
+
+    @staticmethod
+    def _strip_heading(text: str, heading: str) -> str:
+        """
+        模型偶尔会重复栏目标题（如 "## 三、教学重点与难点"），拼装前去掉
+        """
+        lines = text.strip().splitlines()
+        title = NUMBERING_RE.sub("", heading).split("（")[0]
+        if lines:
+            first = lines[0].strip("#*　 \t")
+            bare = NUMBERING_RE.sub("", first)
+            # 带编号的同名标题，或单独一行的栏目名（可带括号说明）
+            if (bare != first and bare.startswith(title)) or first.rstrip("：:") == title \
+                    or first.startswith((f"{title}（", f"{title}(")):
+                lines = lines[1:]
+        return "\n".join(lines).strip()
+
     # =====================================================
     # 教案保存
     # =====================================================
-    def _save_teaching_plan(self, result: Dict[str, Any]) -> None:
+    def _save_teaching_plan(self, result: Dict[str, Any]) -> str:
         safe_level = result["student_level"].replace(" ", "_")
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{safe_level}_teaching_plan_{timestamp}.json"
         path = os.path.join(self.save_dir, filename)
 
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        if self.store is not None:
+            path = self.store.ref(self.store.put(result, name=filename))
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+
+        if self.index is not None:
+            self.index.add_plan(result, path)
 
         print(f"\n✓ 教案已保存至：{path}")
+        return path
 
 
 # =====================================================
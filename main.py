@@ -1,19 +1,36 @@
 import os
-from datetime import datetime
-# 导入你的模块
-from llm.teaching_plan_gen import QwenTeachingPlanGenerator
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+# 导入你的模块（各服务商生成器经 providers 按需导入，启动时不加载 SDK）
+from llm.response_cache import ResponseCache
 from lesson_plan.parser import TeachingPlanParser
-from prompt.prompt_builder import MultimodalPromptBuilder
 from prompt.prompt_saver import PromptSaver
-from multimodal.image_wanx import WanXImageGenerator
-from multimodal.tts_xunfei import XunfeiTTSGenerator
-from multimodal.video_seedance import SeedanceVideoGenerator
+from multimodal.media_executor import MediaStageExecutor
+from multimodal.audio_cache import AudioSegmentCache
+from db.lesson_index import LessonIndex
+from db.segment_store import open_store, read_record, record_exists
+from pipeline.checkpoint import RunCheckpoint
+from pipeline.run_identity import RunManifest, new_run_id, run_dir
+from common.tracing import tracer
+from common import providers
 
 # ================= 绝对路径配置 =================
 STORAGE_ROOT = 'storage'
 LESSON_DB = os.path.join(STORAGE_ROOT, "teaching_db")  # 统一教案库
 PROMPT_DB = os.path.join(STORAGE_ROOT, "prompt_db")  # 统一提示词库
 OUTPUT_ROOT = os.path.join(STORAGE_ROOT, "output")  # 媒体素材根目录
+LLM_CACHE = os.path.join(STORAGE_ROOT, "llm_cache")  # Qwen 响应缓存
+TTS_CACHE = os.path.join(STORAGE_ROOT, "tts_cache")  # 讯飞 TTS 分段音频缓存
+INDEX_DB = os.path.join(STORAGE_ROOT, "index.db")  # 教案/提示词/素材索引
+RUNS_DIR = os.path.join(STORAGE_ROOT, "runs")  # 各次运行的阶段检查点
+TRACES_DIR = os.path.join(STORAGE_ROOT, "traces")  # 各阶段耗时 / token 追踪记录
+JOBS_DB = os.path.join(STORAGE_ROOT, "jobs.db")  # 服务模式的持久化任务队列
+TOPIC_INDEX = os.path.join(STORAGE_ROOT, "topic_index.npz")  # 近重复主题检索的向量缓存
+REPLAY_ROOT = os.path.join(STORAGE_ROOT, "replay")  # 按提示词 hash 寻址的重放素材
+BUNDLE_ROOT = os.path.join(STORAGE_ROOT, "bundles")  # 导出的课程包
+REUSE_THRESHOLD = 0.85  # 同等级主题相似度达到该值才提示 / 复用
+SEGMENT_STORE = True  # 教案 / 提示词追加到分段存储（False 时沿用逐个 JSON 文件）
 
 KEYS = {
     "QWEN": "your-api-key",
@@ -23,67 +40,592 @@ KEYS = {
     "ARK_KEY": ""
 }
 
+# 各子命令会用到的生成器，只有这些会被导入
+COMMAND_PROVIDERS = {
+    "plan": ("plan",),
+    "prompts": ("prompt",),
+    "image": ("image",),
+    "audio": ("tts",),
+    "video": ("video",),
+    "all": ("plan", "prompt", "image", "tts", "video"),
+    "replay": ("image", "video"),
+    "export": (),
+}
+
 
-def run_system():
+def run_system(use_cache: bool = True, image_n: int = 1, image_sizes: list = None, reuse: str = "suggest",
+               reuse_threshold: float = REUSE_THRESHOLD, parallel_plan: bool = False):
     level = input("请输入学生等级 (如: 三级): ").strip()
     topic = input("请输入教学主题: ").strip()
+    run_pipeline(level, topic, use_cache=use_cache, image_n=image_n, image_sizes=image_sizes,
+                 reuse=reuse, reuse_threshold=reuse_threshold, parallel_plan=parallel_plan)
+
+
+def resume_run(run_id: str, use_cache: bool = True, image_n: int = 1, image_sizes: list = None,
+               parallel_plan: bool = False):
+    """
+    续跑：读取 run_id 的检查点，跳过已完成的阶段
+    """
+    checkpoint = RunCheckpoint.load(RUNS_DIR, run_id)
+    pending = checkpoint.pending()
+    if not pending:
+        print(f"✅ 运行 {run_id} 的所有阶段均已完成，无需续跑。")
+        return
+    print(f"🔁 续跑 {run_id}，待完成阶段: {', '.join(pending)}")
+    data = checkpoint.data
+    run_pipeline(data["level"], data["topic"], use_cache=use_cache, checkpoint=checkpoint,
+                 image_n=image_n, image_sizes=image_sizes, parallel_plan=parallel_plan)
+
+
+def run_pipeline(level: str, topic: str, use_cache: bool = True, checkpoint: RunCheckpoint = None,
+                 image_n: int = 1, image_sizes: list = None, reuse: str = "suggest",
+                 reuse_threshold: float = REUSE_THRESHOLD, parallel_plan: bool = False):
+    """
+    image_n / image_sizes：每个尺寸生成的候选图数量与画幅（如 ["16:9", "1:1"]），默认单张 1:1
+    reuse：新建运行时先查同等级的近重复教案，off 不查 / suggest 只提示 / auto 直接复用
+    parallel_plan：先生成课文核心，其余教案章节并发生成后按固定顺序拼接
+    """
+    if checkpoint is None:
+        checkpoint = _new_checkpoint(level, topic)
+        _reuse_similar(level, topic, checkpoint, reuse, reuse_threshold)
+
+    trace_start = time.time()
+    try:
+        _run_stages(level, topic, use_cache, checkpoint, image_n, image_sizes, parallel_plan)
+    finally:
+        _export_traces(checkpoint.run_id, trace_start)
+
+
+def _new_checkpoint(level: str, topic: str) -> RunCheckpoint:
+    # 素材目录提前确定，便于课文一就绪就开始合成音频
+    # run_id 单调且跨进程不重复，同时作为素材目录名关联教案、提示词、素材与检查点；目录按哈希两级分片
+    run_id = new_run_id(level, topic)
+    return RunCheckpoint.create(RUNS_DIR, run_id, level, topic, run_dir(OUTPUT_ROOT, run_id))
+
+
+def _write_manifest(checkpoint: RunCheckpoint) -> None:
+    """
+    按检查点把已完成的素材（含复用链接进来的）登记进运行目录的 manifest.json
+    """
+    media_dir = checkpoint.data["media_dir"]
+    if not os.path.isdir(media_dir):
+        return
+    manifest = RunManifest.open(media_dir, checkpoint.run_id, checkpoint.data["level"], checkpoint.data["topic"])
+    if checkpoint.is_done("plan"):
+        manifest.set_source("plan", checkpoint.get("plan")["path"])
+    if checkpoint.is_done("prompts"):
+        for kind in ("image", "video"):
+            manifest.set_source(f"{kind}_prompt", checkpoint.get("prompts")[kind])
+    for kind in ("image", "audio", "video"):
+        stage = checkpoint.get(kind)
+        if stage["status"] == "done" and os.path.exists(stage["path"]):
+            extra = {"reused_from": stage["reused_from"]} if stage.get("reused_from") else {}
+            manifest.add_asset(kind, stage["path"], elapsed=stage.get("elapsed"), **extra)
+            manifest.set_timing(kind, stage.get("elapsed"))
+    manifest.collect()
+    manifest.save()
+
+
+def _reuse_similar(level: str, topic: str, checkpoint: RunCheckpoint, mode: str = "suggest",
+                   threshold: float = REUSE_THRESHOLD):
+    """
+    调用 Qwen 之前按输入内容查找同等级的近重复教案
+    auto 模式下把原运行的教案、提示词与素材登记进本次检查点（素材硬链接进新目录），
+    后续 _run_stages 只生成缺失的阶段
+    """
+    index = LessonIndex(INDEX_DB)
+    topic_index = _open_topic_index(mode, index)
+    if topic_index is None:
+        return None
+    from db.topic_index import link_artifact
+
+    matches = topic_index.search(level, topic, k=3, min_score=threshold)
+    if not matches:
+        return None
+    for m in matches:
+        print(f"💡 相似教案（相似度 {m['score']:.2f}）：{m['topic'][:30]} → {m['path']}")
+    best = matches[0]
+    if mode != "auto" or not record_exists(best["path"]):
+        print("   如需直接复用，可加 --reuse auto")
+        return best
+
+    clean_text = TeachingPlanParser(read_record(best["path"])["teaching_plan"]).extract_lesson_text()
+    if not clean_text:
+        return best
+    info = {"reused_from": best["run_id"], "similarity": best["score"]}
+    checkpoint.mark_done("plan", path=best["path"], **info)
+    checkpoint.mark_done("parse", lesson_text=clean_text)
+
+    artifacts = index.run_artifacts(best["run_id"]) if best["run_id"] else {"prompts": {}, "media": {}}
+    prompts = artifacts["prompts"]
+    prompts_ready = "image" in prompts and "video" in prompts
+    if prompts_ready:
+        checkpoint.mark_done("prompts", image=prompts["image"], video=prompts["video"], **info)
+    for kind, src in artifacts["media"].items():
+        # 图片 / 视频与提示词配套，只有提示词一并复用时才复用；音频只取决于课文
+        if kind not in ("image", "audio", "video") or (kind != "audio" and not prompts_ready):
+            continue
+        path = link_artifact(src, checkpoint.data["media_dir"])
+        index.add_media(path, kind=kind, run_id=checkpoint.run_id, level=level, prompt_path=prompts.get(kind))
+        checkpoint.mark_done(kind, path=path, **info)
+
+    reused = [stage for stage in checkpoint.STAGES if checkpoint.is_done(stage)]
+    print(f"♻️ 已复用 {best['run_id']} 的 {', '.join(reused)}，只生成其余阶段")
+    return best
+
+
+def _store(base_dir: str):
+    return open_store(base_dir) if SEGMENT_STORE else None
+
+
+def _open_topic_index(mode: str, index: LessonIndex):
+    if mode == "off":
+        return None
+    try:
+        from db.topic_index import TopicIndex
+    except ImportError:
+        print("⚠️ 未安装 numpy，跳过相似主题检索")
+        return None
+    return TopicIndex.open(TOPIC_INDEX, index)
+
+
+def _export_traces(run_id: str, since: float) -> None:
+    # 无论成功与否都输出本次运行的阶段汇总，并导出 JSONL 与 Prometheus 快照
+    tracer.print_summary(since=since)
+    trace_path = tracer.export_jsonl(os.path.join(TRACES_DIR, f"{run_id}.jsonl"), since=since)
+    tracer.write_prometheus(os.path.join(TRACES_DIR, "metrics.prom"))
+    print(f"📈 追踪记录已保存至：{trace_path}")
+
+
+def _run_stages(level: str, topic: str, use_cache: bool, checkpoint: RunCheckpoint,
+                image_n: int = 1, image_sizes: list = None, parallel_plan: bool = False):
+    run_id = checkpoint.run_id
+    current_media_dir = checkpoint.data["media_dir"]
+
+    cache = ResponseCache(LLM_CACHE)
+    index = LessonIndex(INDEX_DB)
+    p_builder = providers.create("prompt", api_key=KEYS["QWEN"], cache=cache)
+    p_saver = PromptSaver(base_dir=PROMPT_DB, index=index, store=_store(PROMPT_DB))
+
+    # 流式生成时，【课文结束】一到就提前启动提示词生成与 TTS，与教案剩余部分并行
+    early_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="early")
+    early = {}
+
+    def on_lesson_text(text: str):
+        print("⚡ 课文已就绪，提前启动提示词生成与语音合成...")
+        early["text"] = text
+        if not checkpoint.is_done("prompts"):
+            early["prompts"] = early_pool.submit(p_builder.generate_many, ["image", "video"], level, text, use_cache)
+        if not checkpoint.is_done("audio"):
+            early["audio"] = early_pool.submit(
+                lambda: _tts().generate(text, level, current_media_dir))
 
     # --- 阶段 1: 教案生成 (存入统一教案库) ---
-    print("\n[1/4] 正在生成教案并存入统一库...")
-    gen = QwenTeachingPlanGenerator(api_key=KEYS["QWEN"], save_dir=LESSON_DB)
-    res = gen.generate_teaching_plan(level, topic)
-    if not res["success"]: return
+    if checkpoint.is_done("plan"):
+        print("\n[1/4] 教案已生成，读取检查点...")
+        plan_text = read_record(checkpoint.get("plan")["path"])["teaching_plan"]
+    else:
+        print("\n[1/4] 正在生成教案并存入统一库...")
+        gen = providers.create("plan", api_key=KEYS["QWEN"], save_dir=LESSON_DB, cache=cache, index=index,
+                               store=_store(LESSON_DB))
+        generate = gen.generate_teaching_plan_parallel if parallel_plan else gen.generate_teaching_plan_stream
+        res = generate(level, topic, on_lesson_text=on_lesson_text, use_cache=use_cache, run_id=run_id)
+        if not res["success"]:
+            checkpoint.mark_failed("plan", res["error"])
+            early_pool.shutdown(wait=True)
+            print(f"❌ 教案生成失败: {res['error']}（可用 --resume {run_id} 续跑）")
+            return
+        checkpoint.mark_done("plan", path=res["save_path"])
+        plan_text = res["teaching_plan"]
 
     # --- 阶段 2: 解析课文 ---
-    parser = TeachingPlanParser(res["teaching_plan"])
-    clean_text = parser.extract_lesson_text()
+    if checkpoint.is_done("parse"):
+        clean_text = checkpoint.get("parse")["lesson_text"]
+    else:
+        parser = TeachingPlanParser(plan_text)
+        clean_text = parser.extract_lesson_text()
+        if not clean_text:
+            checkpoint.mark_failed("parse", "未能从教案中解析出课文")
+            early_pool.shutdown(wait=True)
+            print("❌ 未能从教案中解析出课文")
+            return
+        checkpoint.mark_done("parse", lesson_text=clean_text)
+    early_ready = early.get("text") == clean_text
 
     # --- 阶段 3: 提示词生成 (存入统一提示词库) ---
-    print("[2/4] 正在生成提示词并存入统一库...")
-    p_builder = MultimodalPromptBuilder(api_key=KEYS["QWEN"])
-    p_saver = PromptSaver(base_dir=PROMPT_DB)
-
-    img_prompt = p_builder.generate("image", level, clean_text)
-    vid_prompt = p_builder.generate("video", level, clean_text)
+    if checkpoint.is_done("prompts"):
+        print("[2/4] 提示词已生成，读取检查点...")
+        img_prompt_path = checkpoint.get("prompts")["image"]
+        vid_prompt_path = checkpoint.get("prompts")["video"]
+    else:
+        print("[2/4] 正在生成提示词并存入统一库...")
+        try:
+            if early_ready:
+                prompts = early["prompts"].result()
+            else:
+                # 模型未输出课文标记时，只能在完整教案上解析后再生成
+                prompts = p_builder.generate_many(["image", "video"], level, clean_text, use_cache=use_cache)
+        except Exception as e:
+            checkpoint.mark_failed("prompts", str(e))
+            early_pool.shutdown(wait=True)
+            print(f"❌ 提示词生成失败: {e}（可用 --resume {run_id} 续跑）")
+            return
+        img_prompt, vid_prompt = prompts["image"], prompts["video"]
+        print(f"💾 Qwen 缓存: {cache.stats()}")
 
-    p_saver.save("image", "WanX-2.5", level, clean_text, img_prompt)
-    p_saver.save("video", "Seedance", level, clean_text, vid_prompt)
+        img_prompt_path = p_saver.save("image", "WanX-2.5", level, clean_text, img_prompt, run_id=run_id)
+        vid_prompt_path = p_saver.save("video", "Seedance", level, clean_text, vid_prompt, run_id=run_id)
+        checkpoint.mark_done("prompts", image=img_prompt_path, video=vid_prompt_path)
 
     # --- 阶段 4: 媒体素材生成 (存入独立文件夹) ---
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    # 文件夹名：时间_等级_主题
-    media_folder_name = f"{timestamp}_{level}_{topic[:10]}"
-    current_media_dir = os.path.join(OUTPUT_ROOT, media_folder_name)
     os.makedirs(current_media_dir, exist_ok=True)
 
-    print(f"[3/4] 正在生成多模态素材，保存至: {media_folder_name}")
+    print(f"[3/4] 正在生成多模态素材，保存至: {current_media_dir}")
 
-    # A. 图片
-    try:
-        wanx = WanXImageGenerator(api_key=KEYS["QWEN"])
-        wanx.execute_generation(img_prompt, level, current_media_dir)
-    except Exception as e:
-        print(f"图片生成失败: {e}")
+    # 图片/视频统一从提示词库 JSON 重新进入，续跑时同样适用
+    jobs = {}
+    if not checkpoint.is_done("image"):
+        jobs["image"] = lambda: providers.create("image", api_key=KEYS["QWEN"], index=index).generate_from_prompt_file(
+            img_prompt_path, current_media_dir, n=image_n, sizes=image_sizes)
+    if not checkpoint.is_done("audio"):
+        jobs["audio"] = (lambda: early["audio"].result()) if "audio" in early and early_ready else (
+            lambda: _tts().generate(clean_text, level, current_media_dir))
+    if not checkpoint.is_done("video"):
+        jobs["video"] = lambda: providers.create("video", api_key=KEYS["ARK_KEY"], index=index).generate_from_prompt_file(
+            vid_prompt_path, current_media_dir)
 
-    # B. 音频
-    try:
-        tts = XunfeiTTSGenerator(KEYS["XUNFEI_APPID"], KEYS["XUNFEI_KEY"], KEYS["XUNFEI_SECRET"])
-        tts.generate(clean_text, level, current_media_dir)
-    except Exception as e:
-        print(f"音频生成失败: {e}")
+    # 三路素材并发生成（视频最先启动），整体耗时取决于最慢的一路
+    executor = MediaStageExecutor()
+    media = executor.run_jobs(jobs)
 
-    # C. 视频
-    try:
-        seedance = SeedanceVideoGenerator(api_key=KEYS["ARK_KEY"])
-        seedance.execute_generation(vid_prompt, level, current_media_dir)
-    except Exception as e:
-        print(f"视频生成失败: {e}")
+    labels = {"image": "图片", "audio": "音频", "video": "视频"}
+    for name, r in media["results"].items():
+        if not r["success"]:
+            print(f"{labels[name]}生成失败: {r['error']}")
+            checkpoint.mark_failed(name, r["error"])
+        else:
+            if name == "audio":
+                index.add_media(r["path"], kind="audio", run_id=run_id, level=level)
+            checkpoint.mark_done(name, path=r["path"], elapsed=r["elapsed"])
+    print(f"⏱️ 素材阶段耗时: {media['elapsed']} 秒")
+    early_pool.shutdown(wait=True)
+    _write_manifest(checkpoint)
 
-    print(f"\n✅ 流程全部完成！")
+    pending = checkpoint.pending()
+    if pending:
+        print(f"\n⚠️ 以下阶段未完成: {', '.join(pending)}，可执行 python main.py --resume {run_id} 续跑")
+    else:
+        print(f"\n✅ 流程全部完成！")
     print(f"📄 教案与提示词已汇总至对应数据库。")
     print(f"🎬 多模态素材请查看: {current_media_dir}")
 
 
+def _tts():
+    return providers.create("tts", KEYS["XUNFEI_APPID"], KEYS["XUNFEI_KEY"], KEYS["XUNFEI_SECRET"],
+                            cache=AudioSegmentCache(TTS_CACHE))
+
+
+# =====================================================
+# 单阶段子命令：plan 新建运行，其余按 run_id 在检查点上重跑一个阶段，
+# 只导入该阶段用到的生成器（如只重做音频时不加载 openai / dashscope / ark）
+# =====================================================
+def run_plan(level: str, topic: str, use_cache: bool = True, reuse: str = "suggest",
+             reuse_threshold: float = REUSE_THRESHOLD, parallel_plan: bool = False):
+    checkpoint = _new_checkpoint(level, topic)
+    run_id = checkpoint.run_id
+    _reuse_similar(level, topic, checkpoint, reuse, reuse_threshold)
+    if checkpoint.is_done("plan"):
+        return run_id
+    trace_start = time.time()
+    try:
+        print("正在生成教案并存入统一库...")
+        gen = providers.create(
+            "plan", api_key=KEYS["QWEN"], save_dir=LESSON_DB, cache=ResponseCache(LLM_CACHE),
+            index=LessonIndex(INDEX_DB), store=_store(LESSON_DB))
+        generate = gen.generate_teaching_plan_parallel if parallel_plan else gen.generate_teaching_plan
+        res = generate(level, topic, use_cache=use_cache, run_id=run_id)
+        if not res["success"]:
+            checkpoint.mark_failed("plan", res["error"])
+            print(f"❌ 教案生成失败: {res['error']}")
+            return None
+        checkpoint.mark_done("plan", path=res["save_path"])
+
+        clean_text = TeachingPlanParser(res["teaching_plan"]).extract_lesson_text()
+        if not clean_text:
+            checkpoint.mark_failed("parse", "未能从教案中解析出课文")
+            print("❌ 未能从教案中解析出课文")
+        else:
+            checkpoint.mark_done("parse", lesson_text=clean_text)
+            print(f"✅ 教案已保存：{res['save_path']}\n   后续可执行 python main.py prompts {run_id}")
+        return run_id
+    finally:
+        _export_traces(run_id, trace_start)
+
+
+def run_stage(stage: str, run_id: str, use_cache: bool = True, image_n: int = 1, image_sizes: list = None):
+    """
+    在已有运行上（重新）执行 prompts / image / audio / video 中的一个阶段，结果写回检查点
+    """
+    checkpoint = RunCheckpoint.load(RUNS_DIR, run_id)
+    required = "parse" if stage in ("prompts", "audio") else "prompts"
+    if not checkpoint.is_done(required):
+        print(f"❌ 运行 {run_id} 尚未完成 {required} 阶段，请先执行"
+              f" {'plan' if required == 'parse' else 'prompts ' + run_id}")
+        return None
+
+    level = checkpoint.data["level"]
+    media_dir = checkpoint.data["media_dir"]
+    clean_text = checkpoint.get("parse")["lesson_text"]
+    index = LessonIndex(INDEX_DB)
+    trace_start = time.time()
+    try:
+        if stage == "prompts":
+            p_builder = providers.create("prompt", api_key=KEYS["QWEN"], cache=ResponseCache(LLM_CACHE))
+            p_saver = PromptSaver(base_dir=PROMPT_DB, index=index, store=_store(PROMPT_DB))
+            try:
+                prompts = p_builder.generate_many(["image", "video"], level, clean_text, use_cache=use_cache)
+            except Exception as e:
+                checkpoint.mark_failed("prompts", str(e))
+                print(f"❌ 提示词生成失败: {e}")
+                return None
+            result = {
+                "image": p_saver.save("image", "WanX-2.5", level, clean_text, prompts["image"], run_id=run_id),
+                "video": p_saver.save("video", "Seedance", level, clean_text, prompts["video"], run_id=run_id)
+            }
+            checkpoint.mark_done("prompts", **result)
+            return result
+
+        os.makedirs(media_dir, exist_ok=True)
+        started = time.time()
+        if stage == "image":
+            path = providers.create("image", api_key=KEYS["QWEN"], index=index).generate_from_prompt_file(
+                checkpoint.get("prompts")["image"], media_dir, n=image_n, sizes=image_sizes)
+        elif stage == "video":
+            path = providers.create("video", api_key=KEYS["ARK_KEY"], index=index).generate_from_prompt_file(
+                checkpoint.get("prompts")["video"], media_dir)
+        else:
+            tts = _tts()
+            try:
+                path = tts.generate(clean_text, level, media_dir)
+            finally:
+                tts.close()
+            if path:
+                index.add_media(path, kind="audio", run_id=run_id, level=level)
+
+        if path:
+            checkpoint.mark_done(stage, path=path, elapsed=round(time.time() - started, 2))
+            _write_manifest(checkpoint)
+        else:
+            checkpoint.mark_failed(stage, "生成器未返回结果")
+        return path
+    finally:
+        _export_traces(run_id, trace_start)
+
+
+def run_batch(manifest_path: str, limits: dict = None, report_path: str = None, use_cache: bool = True,
+              image_n: int = 1, image_sizes: list = None, reuse: str = "suggest",
+              reuse_threshold: float = REUSE_THRESHOLD, parallel_plan: bool = False):
+    """
+    批量模式：从清单文件 (CSV/JSONL) 读取多组 (等级, 主题) 并发生成
+    """
+    from pipeline.batch_runner import BatchLessonRunner, load_manifest
+
+    rows = load_manifest(manifest_path)
+    if not rows:
+        print("⚠️ 清单为空，未执行任何任务。")
+        return None
+
+    index = LessonIndex(INDEX_DB)
+    runner = BatchLessonRunner(
+        keys=KEYS,
+        lesson_db=LESSON_DB,
+        prompt_db=PROMPT_DB,
+        output_root=OUTPUT_ROOT,
+        limits=limits,
+        cache=ResponseCache(LLM_CACHE),
+        use_cache=use_cache,
+        lesson_index=index,
+        image_n=image_n,
+        image_sizes=image_sizes,
+        topic_index=_open_topic_index(reuse, index),
+        reuse=reuse,
+        reuse_threshold=reuse_threshold,
+        audio_cache=AudioSegmentCache(TTS_CACHE),
+        parallel_plan=parallel_plan,
+        plan_store=_store(LESSON_DB),
+        prompt_store=_store(PROMPT_DB)
+    )
+    return runner.run(rows, report_path=report_path)
+
+
+def run_service(host: str = "127.0.0.1", port: int = 8765, limits: dict = None, use_cache: bool = True,
+                image_n: int = 1, image_sizes: list = None, reuse: str = "suggest",
+                reuse_threshold: float = REUSE_THRESHOLD, parallel_plan: bool = False):
+    """
+    服务模式：常驻进程，客户端与连接池只初始化一次，通过本地 HTTP 接口提交课程任务
+    """
+    from pipeline.service import build_service
+
+    index = LessonIndex(INDEX_DB)
+    service = build_service(
+        keys=KEYS,
+        lesson_db=LESSON_DB,
+        prompt_db=PROMPT_DB,
+        output_root=OUTPUT_ROOT,
+        jobs_db=JOBS_DB,
+        host=host,
+        port=port,
+        limits=limits,
+        cache=ResponseCache(LLM_CACHE),
+        use_cache=use_cache,
+        lesson_index=index,
+        image_n=image_n,
+        image_sizes=image_sizes,
+        topic_index=_open_topic_index(reuse, index),
+        reuse=reuse,
+        reuse_threshold=reuse_threshold,
+        audio_cache=AudioSegmentCache(TTS_CACHE),
+        parallel_plan=parallel_plan,
+        plan_store=_store(LESSON_DB),
+        prompt_store=_store(PROMPT_DB)
+    )
+    service.serve_forever()
+
+
+def run_replay(filters: dict = None, image_workers: int = 2, video_workers: int = 2, force: bool = False,
+               report_path: str = None, image_n: int = 1, image_sizes: list = None):
+    """
+    重放模式：按筛选条件扫描提示词库，批量重新生成图片 / 视频，已生成的提示词跳过
+    """
+    from pipeline.replay import replay_prompts
+
+    return replay_prompts(
+        KEYS,
+        PROMPT_DB,
+        filters=filters,
+        force=force,
+        report_path=report_path,
+        output_dir=REPLAY_ROOT,
+        lesson_index=LessonIndex(INDEX_DB),
+        image_workers=image_workers,
+        video_workers=video_workers,
+        image_n=image_n,
+        image_sizes=image_sizes
+    )
+
+
+def run_export(run_ids: list, fmt: str = "zip", dest: str = None, out: str = None, send: str = None,
+               workers: int = 4):
+    """
+    导出课程包：默认每次运行一个包（有界线程池并发）；out 写成单个包，send 直接推送到 HOST:PORT
+    """
+    from pipeline.bundle import BundleExporter
+
+    exporter = BundleExporter(OUTPUT_ROOT, runs_dir=RUNS_DIR)
+    if send:
+        host, _, port = send.rpartition(":")
+        manifest = exporter.send(run_ids, host, int(port), fmt)
+        print(f"📤 已推送 {len(manifest['files'])} 个文件（{manifest['bytes'] / 1024 / 1024:.1f} MB）至 {send}")
+        return manifest
+    if out:
+        manifest = exporter.write(run_ids, out, fmt)
+        print(f"📦 课程包已保存至：{out}（{len(manifest['files'])} 个文件，{manifest['bytes'] / 1024 / 1024:.1f} MB）")
+        return manifest
+    return exporter.export_many(run_ids, dest or BUNDLE_ROOT, fmt, workers)
+
+
+def _build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="国际中文多模态教学资源生成系统")
+    sub = ap.add_subparsers(dest="command", metavar="COMMAND")
+    # 子命令里的公共选项默认值用 SUPPRESS，避免覆盖写在子命令之前的同名选项
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--no-cache", action="store_true", default=argparse.SUPPRESS, help="跳过 Qwen 响应缓存")
+    common.add_argument("--image-n", type=int, default=argparse.SUPPRESS, help="每个尺寸生成的候选图数量")
+    common.add_argument("--image-sizes", nargs="+", metavar="RATIO", default=argparse.SUPPRESS, help="候选图画幅")
+    common.add_argument("--reuse", choices=("off", "suggest", "auto"), default=argparse.SUPPRESS,
+                        help="近重复主题处理方式")
+    common.add_argument("--reuse-threshold", type=float, default=argparse.SUPPRESS, help="相似度阈值")
+    common.add_argument("--parallel-plan", action="store_true", default=argparse.SUPPRESS,
+                        help="教案章节并发生成")
+    for name, helptext in (("plan", "只生成教案（新建运行）"), ("all", "完整流程")):
+        p = sub.add_parser(name, parents=[common], help=helptext)
+        p.add_argument("level", help="学生等级，如 三级")
+        p.add_argument("topic", help="教学主题")
+    for name, helptext in (("prompts", "为已有运行生成提示词"), ("image", "重新生成图片"),
+                           ("audio", "重新合成音频"), ("video", "重新生成视频")):
+        p = sub.add_parser(name, parents=[common], help=helptext)
+        p.add_argument("run_id", help="运行 ID（storage/runs 下的检查点名）")
+    p = sub.add_parser("replay", parents=[common], help="按提示词库批量重新生成图片 / 视频")
+    p.add_argument("--level", nargs="+", dest="levels", help="只重放这些等级")
+    p.add_argument("--task", nargs="+", dest="tasks", choices=("image", "video"), help="只重放这些任务类型")
+    p.add_argument("--engine", nargs="+", dest="engines", help="只重放这些引擎（如 WanX-2.5 Seedance）")
+    p.add_argument("--since", help="创建时间下限，如 2025-01-01")
+    p.add_argument("--until", help="创建时间上限（含当天），如 2025-01-31")
+    p.add_argument("--image-workers", type=int, default=2, help="图片并发数")
+    p.add_argument("--video-workers", type=int, default=2, help="视频并发数")
+    p.add_argument("--force", action="store_true", help="输出已存在时也重新生成")
+    p.add_argument("--report", default=argparse.SUPPRESS, help="重放报告输出路径")
+    p = sub.add_parser("export", help="把运行打包成 zip / tar 课程包（教案、提示词、素材与 manifest）")
+    p.add_argument("run_ids", nargs="+", metavar="RUN_ID", help="运行 ID，可写多个")
+    p.add_argument("--format", choices=("zip", "tar"), default="zip", help="打包格式（均不压缩）")
+    p.add_argument("--dest", help="每次运行一个包时的输出目录（默认 storage/bundles）")
+    p.add_argument("--out", help="把所有运行写进这一个包")
+    p.add_argument("--send", metavar="HOST:PORT", help="不落盘，直接推送到 TCP 对端")
+    p.add_argument("--workers", type=int, default=4, help="同时导出的包数量")
+
+    ap.add_argument("--batch", metavar="MANIFEST", help="批量清单文件 (CSV/JSONL，字段 level, topic)")
+    ap.add_argument("--resume", metavar="RUN_ID", help="按检查点续跑指定运行，只执行未完成或失败的阶段")
+    ap.add_argument("--report", help="批量报告输出路径")
+    ap.add_argument("--serve", action="store_true", help="以常驻服务模式运行，通过 HTTP 接口提交任务")
+    ap.add_argument("--host", default="127.0.0.1", help="服务模式监听地址")
+    ap.add_argument("--port", type=int, default=8765, help="服务模式监听端口")
+    ap.add_argument("--no-cache", action="store_true", help="跳过 Qwen 响应缓存，强制重新生成")
+    ap.add_argument("--lessons", type=int, help="同时处理的课程数")
+    ap.add_argument("--llm", type=int, help="Qwen 调用并发上限")
+    ap.add_argument("--image", type=int, help="WanX 文生图并发上限")
+    ap.add_argument("--tts", type=int, help="讯飞 TTS 连接并发上限")
+    ap.add_argument("--video", type=int, help="Seedance 任务并发上限")
+    ap.add_argument("--image-n", type=int, default=1, help="每个尺寸生成的候选图数量（>1 时去重并排序）")
+    ap.add_argument("--image-sizes", nargs="+", metavar="RATIO", help="候选图画幅，如 16:9 1:1 4:3")
+    ap.add_argument("--reuse", choices=("off", "suggest", "auto"), default="suggest",
+                    help="生成前查找同等级的近重复教案：off 不查 / suggest 只提示 / auto 直接复用教案与素材"
+                         "（需要可选依赖 numpy，未安装时跳过）")
+    ap.add_argument("--reuse-threshold", type=float, default=REUSE_THRESHOLD, help="相似度阈值（0~1）")
+    ap.add_argument("--parallel-plan", action="store_true",
+                    help="先生成课文核心，其余教案章节并发生成（缩短教案阶段耗时）")
+    return ap
+
+
 if __name__ == "__main__":
 
-    run_system()
+    args = _build_arg_parser().parse_args()
+    image_options = {"image_n": args.image_n, "image_sizes": args.image_sizes}
+    reuse_options = {"reuse": args.reuse, "reuse_threshold": args.reuse_threshold}
+    plan_options = {"parallel_plan": args.parallel_plan}
+    stage_limits = {
+        k: getattr(args, k) for k in ("lessons", "llm", "image", "tts", "video")
+        if getattr(args, k) is not None
+    }
+    if args.command == "plan":
+        run_plan(args.level, args.topic, use_cache=not args.no_cache, **reuse_options, **plan_options)
+    elif args.command == "all":
+        run_pipeline(args.level, args.topic, use_cache=not args.no_cache,
+                     **image_options, **reuse_options, **plan_options)
+    elif args.command == "export":
+        run_export(args.run_ids, args.format, dest=args.dest, out=args.out, send=args.send, workers=args.workers)
+    elif args.command == "replay":
+        run_replay({k: getattr(args, k) for k in ("levels", "tasks", "engines", "since", "until")},
+                   image_workers=args.image_workers, video_workers=args.video_workers, force=args.force,
+                   report_path=args.report, **image_options)
+    elif args.command:
+        run_stage(args.command, args.run_id, use_cache=not args.no_cache, **image_options)
+    elif args.resume:
+        resume_run(args.resume, use_cache=not args.no_cache, **image_options, **plan_options)
+    elif args.serve:
+        run_service(args.host, args.port, limits=stage_limits, use_cache=not args.no_cache,
+                    **image_options, **reuse_options, **plan_options)
+    elif args.batch:
+        run_batch(args.batch, limits=stage_limits, report_path=args.report, use_cache=not args.no_cache,
+                  **image_options, **reuse_options, **plan_options)
+    else:
+        run_system(use_cache=not args.no_cache, **image_options, **reuse_options, **plan_options)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Any, Optional
+
+
+class AudioSegmentCache:
+    """
+    TTS 分段音频缓存（内容寻址，持久化到磁盘）
+    键 = hash(文本 + 发音人 + 合成参数)，值为该段的 MP3 字节；
+    问候语、购物对话等重复的句子只合成一次，课文由命中段与新合成段按顺序拼接
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = os.path.join("storage", "tts_cache"),
+        max_bytes: int = 500 * 1024 * 1024,
+        evict_every: int = 64
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evict_every = max(1, evict_every)
+        self._puts = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(text: str, params: Dict[str, Any]) -> str:
+        raw = json.dumps({"text": text.strip(), "params": params},
+                         ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.mp3")
+
+    # =====================================================
+    # 读写
+    # =====================================================
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+        except OSError:
+            self._count(hit=False)
+            return None
+        if not audio:
+            self._count(hit=False)
+            return None
+
+        # 刷新访问时间，淘汰时按最近使用排序
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self._count(hit=True)
+        return audio
+
+    def put(self, key: str, audio: bytes) -> None:
+        if not audio:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+        # 每写入若干段才扫描一次目录
+        with self._lock:
+            self._puts += 1
+            due = self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        总大小超过 max_bytes 时按最近使用时间淘汰，返回删除数量
+        """
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".mp3"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        removed = 0
+        if self.max_bytes and total > self.max_bytes:
+            for mtime, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                removed += 1
+                total -= size
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
@@ -0,0 +1,100 @@
+import os
+from typing import Callable
+
+
+class AudioSink:
+    """
+    音频输出抽象：合成得到的音频帧按顺序写入 sink，
+    全部完成后 commit()，中途失败则 abort()
+    """
+
+    def __init__(self):
+        self.bytes_written = 0
+
+    def write(self, data) -> None:
+        self._write(data)
+        self.bytes_written += len(data)
+
+    def _write(self, data) -> None:
+        raise NotImplementedError
+
+    def commit(self):
+        return None
+
+    def abort(self) -> None:
+        return None
+
+
+class FileAudioSink(AudioSink):
+    """
+    写入 <path>.part 临时文件（整个会话只打开一次，带缓冲），
+    commit 时 fsync 并原子重命名为最终文件，连接中断不会留下半截音频
+    """
+
+    def __init__(self, path: str, buffer_size: int = 256 * 1024):
+        super().__init__()
+        self.path = path
+        self.tmp_path = f"{path}.part"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._f = open(self.tmp_path, "wb", buffering=buffer_size)
+
+    def _write(self, data) -> None:
+        self._f.write(data)
+
+    def commit(self) -> str:
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        if not self._f.closed:
+            self._f.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class MemoryAudioSink(AudioSink):
+    """
+    内存模式：音频保存在 bytearray 中，不落盘
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._buf = bytearray()
+
+    def _write(self, data) -> None:
+        self._buf += data
+
+    def getbuffer(self) -> memoryview:
+        return memoryview(self._buf)
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buf)
+
+    def commit(self) -> bytes:
+        return self.getvalue()
+
+    def abort(self) -> None:
+        self._buf.clear()
+
+
+class StreamAudioSink(AudioSink):
+    """
+    流式模式：每段音频直接交给回调（如 socket.sendall、sys.stdout.buffer.write），
+    调用方可以边合成边播放/转发
+    """
+
+    def __init__(self, on_data: Callable[[bytes], None], on_close: Callable[[], None] = None):
+        super().__init__()
+        self._on_data = on_data
+        self._on_close = on_close
+
+    def _write(self, data) -> None:
+        self._on_data(data)
+
+    def commit(self):
+        if self._on_close is not None:
+            self._on_close()
+        return None
@@ -1,33 +1,59 @@
 import os
-import requests
-import json
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from http import HTTPStatus
+from typing import Dict, Any, List
 from dashscope import ImageSynthesis
 import dashscope
 
+try:
+    from PIL import Image  # 可选：用于感知哈希去重，未安装时退化为按文件内容去重
+except ImportError:
+    Image = None
+
+from common.tracing import tracer
+from common.governor import get_governor, ProviderError, is_retryable, retry_after
+from common.downloader import get_downloader
+from db.segment_store import record_exists, read_record
+
 
 class WanXImageGenerator:
     """
     通义万相 WanX-2.5 文生图模块
     """
 
-    def __init__(self, api_key: str = None):
+    # 常用画幅对应的 WanX 尺寸（宽*高，总像素在模型允许范围内）
+    ASPECT_SIZES = {
+        "1:1": "1280*1280",
+        "16:9": "1440*810",
+        "9:16": "810*1440",
+        "4:3": "1280*960",
+        "3:4": "960*1280",
+    }
+    MAX_N = 4  # 单次调用最多返回的图片数
+
+    def __init__(self, api_key: str = None, index=None, base_url: str = None, governor=None):
         # 设置 API Key
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
         dashscope.api_key = self.api_key
-        # 设置基础 URL
-        dashscope.base_http_api_url = 'https://dashscope.aliyuncs.com/api/v1'
+        # 设置基础 URL（可通过参数或 DASHSCOPE_HTTP_BASE_URL 覆盖）
+        dashscope.base_http_api_url = base_url or os.getenv(
+            "DASHSCOPE_HTTP_BASE_URL", 'https://dashscope.aliyuncs.com/api/v1')
+        self.index = index  # 可选 LessonIndex，生成后登记素材与所用提示词
+        self.governor = governor or get_governor("wanx")
 
-    def generate_from_prompt_file(self, json_path: str, output_dir: str):
+    def generate_from_prompt_file(self, json_path: str, output_dir: str, n: int = 1, sizes: List[str] = None):
         """
         从你之前生成的 Prompt JSON 文件中读取并生成图片
+        n > 1 或指定 sizes 时走多候选模式：全部候选登记入索引，返回排名第一的图片路径
         """
-        if not os.path.exists(json_path):
+        if not record_exists(json_path):
             print(f"❌ 找不到提示词文件: {json_path}")
             return
 
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = read_record(json_path)
 
         # 根据之前的 PromptSaver 结构提取数据
         pure_prompt = data["payload"]["prompt"]
@@ -35,48 +61,210 @@ class WanXImageGenerator:
         task_type = data["metadata"]["task"]
 
         print(f"正在为 [{student_level}] 生成 {task_type} 图片...")
-        self.execute_generation(pure_prompt, student_level, output_dir)
+        run_id = data["metadata"].get("run_id")
+        if n > 1 or sizes:
+            variants = self.generate_variants(pure_prompt, student_level, output_dir, n, sizes, run_id)
+            if self.index is not None:
+                for v in variants:
+                    self.index.add_media(v["path"], kind="image", run_id=run_id,
+                                         level=student_level, prompt_path=json_path)
+            return variants[0]["path"] if variants else None
 
-    def execute_generation(self, prompt: str, level: str, output_dir: str):
+        save_path = self.execute_generation(pure_prompt, student_level, output_dir, run_id)
+        if save_path and self.index is not None:
+            self.index.add_media(save_path, kind="image", run_id=run_id,
+                                 level=student_level, prompt_path=json_path)
+        return save_path
+
+    def execute_generation(self, prompt: str, level: str, output_dir: str, run_id: str = None):
         """
         执行模型调用与保存
         """
         os.makedirs(output_dir, exist_ok=True)
 
         try:
-            rsp = ImageSynthesis.call(
-                model="wan2.5-t2i-preview",  # 确保使用最新的预览版或正式版
-                prompt=prompt,
-                n=1,
-                size='1280*1280',
-                prompt_extend=True,
-                watermark=False
-            )
-
-            if rsp.status_code == HTTPStatus.OK:
-                image_url = rsp.output.results[0].url
-                # 文件命名：等级_时间戳.png
-                from datetime import datetime
-                timestamp = datetime.now().strftime("%H%M%S")
-                save_path = os.path.join(output_dir, f"{level}_{timestamp}.png")
-
-                self._download_image(image_url, save_path)
-                return save_path
-            else:
-                print(f"❌ WanX 生成失败: {rsp.message}")
-                return None
+            with tracer.span("image.synthesis", model="wan2.5-t2i-preview", run_id=run_id, units=1):
+                rsp = self._synthesize(prompt)
+
+            image_url = rsp.output.results[0].url
+            # 文件命名：等级_时间戳.png
+            timestamp = datetime.now().strftime("%H%M%S")
+            save_path = os.path.join(output_dir, f"{level}_{timestamp}.png")
+
+            self._download_image(image_url, save_path, run_id)
+            return save_path
         except Exception as e:
             print(f"❌ WanX 异常: {e}")
             return None
 
-    def _download_image(self, url: str, save_path: str):
+    # =====================================================
+    # 多候选模式
+    # =====================================================
+    def generate_variants(
+        self,
+        prompt: str,
+        level: str,
+        output_dir: str,
+        n: int = 4,
+        sizes: List[str] = None,
+        run_id: str = None,
+        dedup_distance: int = 6
+    ) -> List[Dict[str, Any]]:
+        """
+        一轮并发请求生成多张候选图：每个尺寸请求 n 张（超过 MAX_N 时拆成多次调用），
+        sizes 可写画幅（"16:9"）或 WanX 尺寸（"1440*810"），各尺寸同时提交
+        所有结果并发下载，按感知哈希去掉近似重复（汉明距离 <= dedup_distance），返回排序后的列表：
+        [{"path", "size", "url", "bytes", "hash", "rank"}, ...]
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        n = max(1, n)  # --image-n 0 等非法值按单张处理，避免 calls 为空
+        sizes = [self.ASPECT_SIZES.get(s, s) for s in (sizes or ["1:1"])]
+        calls = [(size, min(self.MAX_N, n - i)) for size in sizes for i in range(0, n, self.MAX_N)]
+
+        def request(call):
+            size, count = call
+            try:
+                with tracer.span("image.synthesis", model="wan2.5-t2i-preview", run_id=run_id,
+                                 units=count, size=size):
+                    rsp = self._synthesize(prompt, count, size)
+                return [(size, r.url) for r in rsp.output.results]
+            except Exception as e:
+                print(f"❌ WanX 异常({size}): {e}")
+                return []
+
+        with ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="wanx") as pool:
+            urls = [item for batch in pool.map(request, calls) for item in batch]
+        if not urls:
+            return []
+
+        timestamp = datetime.now().strftime("%H%M%S")
+        items = [
+            (url, os.path.join(output_dir, f"{level}_{timestamp}_{size.replace('*', 'x')}_{i + 1}.png"))
+            for i, (size, url) in enumerate(urls)
+        ]
+        with tracer.span("image.download", run_id=run_id, units=len(items)) as sp:
+            downloads = get_downloader().download_many(items)
+            sp.set(bytes=sum(d["bytes"] for d in downloads))
+
+        candidates = []
+        for (size, url), d in zip(urls, downloads):
+            if d["path"] is None:
+                print(f"❌ 下载异常: {d['error']}")
+                continue
+            candidates.append({"path": d["path"], "size": size, "url": url, "bytes": d["bytes"],
+                               "hash": image_hash(d["path"])})
+
+        variants = self._dedup_and_rank(candidates, dedup_distance)
+        print(f"✅ 候选图片 {len(variants)} 张（请求 {len(urls)} 张，去重 {len(candidates) - len(variants)} 张）")
+        return variants
+
+    @staticmethod
+    def _dedup_and_rank(candidates: List[Dict[str, Any]], dedup_distance: int) -> List[Dict[str, Any]]:
+        """
+        近似重复只保留先出现的一张并删除其余文件；
+        排序：与其他候选差异越大越靠前（更有区分度），其次文件越大越靠前（细节更多）
+        """
+        kept = []
+        for c in candidates:
+            if any(hash_distance(c["hash"], k["hash"]) <= dedup_distance for k in kept):
+                os.remove(c["path"])
+                continue
+            kept.append(c)
+
+        for c in kept:
+            others = [hash_distance(c["hash"], k["hash"]) for k in kept if k is not c]
+            c["distinct"] = min(others) if others else 0
+        kept.sort(key=lambda c: (-c["distinct"], -c["bytes"]))
+        for rank, c in enumerate(kept, 1):
+            c["rank"] = rank
+            del c["distinct"]
+        return kept
+
+    def _synthesize(self, prompt: str, n: int = 1, size: str = "1280*1280"):
+        """
+        单次 WanX 调用：提交任务并等待结果（即 ImageSynthesis.call 的两步）
+        只有提交经过 governor（限速、并发名额、失败重提交）；任务受理后等待结果不占名额，
+        查询失败只重试查询，不会重新提交一次付费生成
+        """
+        task = self.governor.call(self._submit, prompt, n, size)
+        return self._wait(task)
+
+    @staticmethod
+    def _submit(prompt: str, n: int = 1, size: str = "1280*1280"):
+        """
+        拆开调用是因为 call() 在提交失败时只抛出不带状态码的 InvalidTask，
+        这里把非 200 结果转成 ProviderError，由 governor 判断是否重试（429 / 5xx）
+        """
+        task = ImageSynthesis.async_call(
+            model="wan2.5-t2i-preview",  # 确保使用最新的预览版或正式版
+            prompt=prompt,
+            n=n,
+            size=size,
+            prompt_extend=True,
+            watermark=False
+        )
+        if task.status_code != HTTPStatus.OK:
+            raise ProviderError(f"WanX 任务提交失败: {task.message}", status_code=task.status_code)
+        return task
+
+    def _wait(self, task, retries: int = 5):
+        """
+        按 task_id 等待已受理的任务；查询超时 / 429 / 5xx 时退避后继续等待同一个任务
+        """
+        attempt = 0
+        while True:
+            try:
+                rsp = ImageSynthesis.wait(task)
+                if rsp.status_code != HTTPStatus.OK:
+                    raise ProviderError(f"WanX 生成失败: {rsp.message}", status_code=rsp.status_code)
+                return rsp
+            except Exception as e:
+                if not is_retryable(e) or attempt >= retries:
+                    raise
+                delay = self.governor.backoff(attempt, retry_after(e))
+                print(f"⚠️ WanX 查询任务失败，{delay:.1f} 秒后继续等待({attempt + 1}/{retries}): {e}")
+                time.sleep(delay)
+                attempt += 1
+
+    def _download_image(self, url: str, save_path: str, run_id: str = None):
         try:
-            response = requests.get(url, timeout=30)
-            if response.status_code == 200:
-                with open(save_path, "wb") as f:
-                    f.write(response.content)
-                print(f"✅ 图片已保存至: {save_path}")
-            else:
-                print(f"❌ 下载失败，状态码: {response.status_code}")
+            with tracer.span("image.download", run_id=run_id) as sp:
+                result = get_downloader().download(url, save_path)
+                sp.set(bytes=result["bytes"], retries=result["resumes"])
+            print(f"✅ 图片已保存至: {save_path}")
         except Exception as e:
-            print(f"❌ 下载异常: {e}")
\ No newline at end of file
+            print(f"❌ 下载异常: {e}")
+
+
+# =====================================================
+# 感知哈希（dHash）：缩成 9x8 灰度图，比较相邻像素明暗，得到 64 位指纹
+# =====================================================
+def image_hash(path: str) -> str:
+    """
+    返回 "d:<16 位十六进制>"（感知哈希）；未安装 Pillow 或无法解码时返回 "s:<sha256>"（仅能识别完全相同的文件）
+    """
+    if Image is not None:
+        try:
+            with Image.open(path) as img:
+                pixels = list(img.convert("L").resize((9, 8)).getdata())
+            bits = 0
+            for row in range(8):
+                for col in range(8):
+                    bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+            return f"d:{bits:016x}"
+        except Exception:
+            pass
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return f"s:{h.hexdigest()}"
+
+
+def hash_distance(a: str, b: str) -> int:
+    """
+    两个 dHash 的汉明距离；内容哈希只区分相同（0）与不同（64）
+    """
+    if a.startswith("d:") and b.startswith("d:"):
+        return bin(int(a[2:], 16) ^ int(b[2:], 16)).count("1")
+    return 0 if a == b else 64
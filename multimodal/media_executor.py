@@ -0,0 +1,91 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+
+class MediaStageExecutor:
+    """
+    多模态素材并发执行器
+    图片 / 音频 / 视频 三路同时执行，整体耗时≈最慢的一路，而不是三者之和
+    """
+
+    # 提交顺序：预计耗时长的先启动（视频轮询最长可达 15 分钟）
+    SUBMIT_ORDER = ("video", "audio", "image")
+
+    def __init__(self, image_gen=None, tts_gen=None, video_gen=None):
+        self.image_gen = image_gen
+        self.tts_gen = tts_gen
+        self.video_gen = video_gen
+
+    def run(
+        self,
+        level: str,
+        output_dir: str,
+        img_prompt: Optional[str] = None,
+        lesson_text: Optional[str] = None,
+        vid_prompt: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        按已配置的生成器组装任务并并发执行
+        """
+        jobs = {}
+        if self.video_gen is not None and vid_prompt:
+            jobs["video"] = lambda: self.video_gen.execute_generation(vid_prompt, level, output_dir)
+        if self.tts_gen is not None and lesson_text:
+            jobs["audio"] = lambda: self.tts_gen.generate(lesson_text, level, output_dir)
+        if self.image_gen is not None and img_prompt:
+            jobs["image"] = lambda: self.image_gen.execute_generation(img_prompt, level, output_dir)
+
+        os.makedirs(output_dir, exist_ok=True)
+        return self.run_jobs(jobs)
+
+    def run_jobs(self, jobs: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """
+        并发执行任意 {模态: 可调用对象}，汇总每一路的结果与异常
+        返回结构：
+        {
+            "success": 全部成功与否,
+            "elapsed": 总耗时(秒),
+            "results": {模态: {"success", "path", "error", "elapsed"}}
+        }
+        """
+        ordered = sorted(
+            jobs.items(),
+            key=lambda kv: self.SUBMIT_ORDER.index(kv[0]) if kv[0] in self.SUBMIT_ORDER else len(self.SUBMIT_ORDER)
+        )
+
+        start = time.time()
+        results: Dict[str, Dict[str, Any]] = {}
+
+        if ordered:
+            with ThreadPoolExecutor(max_workers=len(ordered), thread_name_prefix="media") as pool:
+                futures = {name: pool.submit(self._timed_call, fn) for name, fn in ordered}
+                for name, future in futures.items():
+                    results[name] = future.result()
+
+        return {
+            "success": bool(results) and all(r["success"] for r in results.values()),
+            "elapsed": round(time.time() - start, 3),
+            "results": results
+        }
+
+    @staticmethod
+    def _timed_call(fn: Callable[[], Any]) -> Dict[str, Any]:
+        start = time.time()
+        try:
+            path = fn()
+            ok = bool(path) and os.path.exists(path)
+            return {
+                "success": ok,
+                "path": path if ok else None,
+                "error": None if ok else "未生成输出文件",
+                "elapsed": round(time.time() - start, 3)
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "path": None,
+                "error": str(e),
+                "elapsed": round(time.time() - start, 3)
+            }
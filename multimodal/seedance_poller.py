@@ -0,0 +1,205 @@
+import heapq
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+from multimodal.video_seedance import SeedanceVideoGenerator
+from common.tracing import tracer
+
+
+class SeedanceTaskPoller:
+    """
+    Seedance 任务轮询器：一个后台线程统一轮询所有在途视频任务
+    - 自适应退避：刚提交时查询较快，之后逐步放慢，并遵循服务端 Retry-After 提示
+    - submit / track 返回 Future，任务完成后解析为下载好的视频路径
+    - 在途任务持久化到 state_path，进程重启后 resume() 可继续跟踪
+    """
+
+    def __init__(
+        self,
+        generator: SeedanceVideoGenerator,
+        state_path: str = os.path.join("storage", "seedance_pending.json"),
+        min_interval: float = 5.0,
+        max_interval: float = 60.0,
+        backoff: float = 1.5,
+        timeout: float = 900.0,
+        download_workers: int = 4
+    ):
+        self.generator = generator
+        self.state_path = state_path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._futures: Dict[str, Future] = {}
+        self._heap = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._downloads = ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="seedance-dl")
+        self._thread = threading.Thread(target=self._loop, name="seedance-poller", daemon=True)
+        self._thread.start()
+
+    # =====================================================
+    # 对外接口
+    # =====================================================
+    def submit(self, prompt: str, level: str, output_dir: str) -> Future:
+        """
+        提交新任务并开始跟踪
+        """
+        task_id = self.generator.submit_task(prompt)
+        return self.track(task_id, level, output_dir)
+
+    def track(self, task_id: str, level: str, output_dir: str, submitted_at: float = None) -> Future:
+        """
+        跟踪一个已提交的任务 ID（可来自本进程或之前的进程）
+        """
+        with self._cond:
+            if task_id in self._futures:
+                return self._futures[task_id]
+            future = Future()
+            self._futures[task_id] = future
+            self._tasks[task_id] = {
+                "level": level,
+                "output_dir": output_dir,
+                "submitted_at": submitted_at or time.time(),
+                "polls": 0
+            }
+            heapq.heappush(self._heap, (time.time() + self.min_interval, task_id))
+            self._persist()
+            self._cond.notify()
+        return future
+
+    def resume(self) -> Dict[str, Future]:
+        """
+        从 state_path 恢复上次进程遗留的在途任务
+        """
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            pending = json.load(f)
+        if pending:
+            print(f"🔁 恢复 {len(pending)} 个未完成的视频任务")
+        return {
+            task_id: self.track(task_id, info["level"], info["output_dir"], info.get("submitted_at"))
+            for task_id, info in pending.items()
+        }
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._tasks)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        停止轮询线程；未完成的任务保留在 state_path 中，可下次 resume
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if wait:
+            self._thread.join()
+        self._downloads.shutdown(wait=wait)
+
+    # =====================================================
+    # 轮询主循环
+    # =====================================================
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.time()):
+                    delay = self._heap[0][0] - time.time() if self._heap else None
+                    self._cond.wait(timeout=delay)
+                if self._stopped:
+                    return
+                _, task_id = heapq.heappop(self._heap)
+                info = self._tasks.get(task_id)
+            if info is not None:
+                self._poll_once(task_id, info)
+
+    def _poll_once(self, task_id: str, info: Dict[str, Any]) -> None:
+        if time.time() - info["submitted_at"] > self.timeout:
+            self._finish(task_id, error=TimeoutError(f"视频任务 {task_id} 超时"))
+            return
+
+        hint = None
+        try:
+            # 查询失败不在这里重试，下面按退避间隔重新排队即可
+            get_result = self.generator.get_task(task_id, retries=0)
+            status = get_result.status
+        except Exception as e:
+            status = None
+            hint = self._retry_after(e)
+            print(f"⚠️ 查询视频任务 {task_id} 失败: {e}")
+
+        if status == "succeeded":
+            self._downloads.submit(self._download, task_id, get_result, info)
+            return
+        if status == "failed":
+            self._finish(task_id, error=RuntimeError(f"视频任务失败: {get_result.error}"))
+            return
+
+        info["polls"] += 1
+        interval = min(self.max_interval, self.min_interval * (self.backoff ** info["polls"]))
+        if hint is not None:
+            interval = max(interval, hint)
+        with self._cond:
+            heapq.heappush(self._heap, (time.time() + interval, task_id))
+
+    def _download(self, task_id: str, get_result, info: Dict[str, Any]) -> None:
+        try:
+            path = self.generator.save_result(get_result, info["level"], info["output_dir"])
+            if path:
+                self._finish(task_id, result=path)
+            else:
+                self._finish(task_id, error=RuntimeError(f"视频任务 {task_id} 未返回可用的视频地址"))
+        except Exception as e:
+            self._finish(task_id, error=e)
+
+    def _finish(self, task_id: str, result: Optional[str] = None, error: Exception = None) -> None:
+        with self._cond:
+            info = self._tasks.pop(task_id, None)
+            future = self._futures.pop(task_id, None)
+            self._persist()
+        if info is not None:
+            # 从提交到下载完成的整段等待，polls 为查询次数
+            tracer.record("video.wait", info["submitted_at"], outcome="error" if error else "ok",
+                          error=str(error) if error else None, task_id=task_id, polls=info["polls"])
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    # =====================================================
+    # 工具方法
+    # =====================================================
+    @staticmethod
+    def _retry_after(exc: Exception) -> Optional[float]:
+        """
+        从 SDK 异常携带的 HTTP 响应中读取 Retry-After（秒）
+        """
+        response = getattr(exc, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None
+
+    def _persist(self) -> None:
+        # 调用方已持有 self._cond
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        pending = {
+            task_id: {k: info[k] for k in ("level", "output_dir", "submitted_at")}
+            for task_id, info in self._tasks.items()
+        }
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pending, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
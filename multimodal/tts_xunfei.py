@@ -5,27 +5,134 @@ import hashlib
 import base64
 import hmac
 import json
+import queue
+import re
+import threading
 from urllib.parse import urlencode
 import time
 import ssl
+from concurrent.futures import ThreadPoolExecutor
 from wsgiref.handlers import format_date_time
 from datetime import datetime
 from time import mktime
-import _thread as thread
+from typing import List
 import os
 
+from multimodal.audio_sink import AudioSink, FileAudioSink
+from common.tracing import tracer
+from common.governor import get_governor, ProviderError
+
+
+class _ConnectionPool:
+    """
+    已鉴权 WebSocket 连接池：size 限制同时打开的连接数
+    讯飞在 status=2 的最后一帧之后即关闭连接，客户端此时往往还未察觉（ws.connected 仍为 True），
+    因此默认每段用完即关闭；reuse=True 仅用于确认会保持连接的服务端，空闲连接放回池中复用
+    """
+
+    def __init__(self, url_factory, size: int, reuse: bool = False):
+        self._url_factory = url_factory
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.reuse = reuse
+
+    def acquire(self, fresh: bool = False):
+        """
+        fresh=True 时不取空闲连接，直接新建（重试时避免再次落到失效的连接上）
+        """
+        self._slots.acquire()
+        try:
+            if fresh:
+                raise queue.Empty
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return websocket.create_connection(
+                    self._url_factory(), sslopt={"cert_reqs": ssl.CERT_NONE}, timeout=30
+                )
+            except Exception:
+                self._slots.release()
+                raise
+
+    def release(self, ws, broken: bool = False):
+        if broken or not self.reuse or not ws.connected:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        else:
+            self._idle.put(ws)
+        self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                ws = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                ws.close()
+            except Exception:
+                pass
+
 
 class XunfeiTTSGenerator:
     """
     讯飞 TTS 语音合成模块 (WebSocket版)
     """
 
-    def __init__(self, app_id: str, api_key: str, api_secret: str):
+    # 鉴权 URL 的 date 与服务端时钟偏差需在 300 秒内，留出余量后缓存复用
+    AUTH_TTL = 240
+    # 对话体课文中的说话人前缀，如 "张华：" / "A："
+    SPEAKER_PATTERN = re.compile(r"^\s*[^\s：:]{1,8}[：:]")
+
+    def __init__(
+        self,
+        app_id: str,
+        api_key: str,
+        api_secret: str,
+        pool_size: int = 3,
+        max_chunk_chars: int = 200,
+        retries: int = 2,
+        host_url: str = None,
+        governor=None,
+        cache=None,
+        reuse_connections: bool = False
+    ):
         self.app_id = app_id
         self.api_key = api_key
         self.api_secret = api_secret
-        self.host_url = 'wss://cbm01.cn-huabei-1.xf-yun.com/v1/private/mcd9m97e6'
+        # 可通过参数或 XUNFEI_TTS_URL 覆盖（如本地 mock 的 ws:// 地址）
+        self.host_url = host_url or os.getenv(
+            "XUNFEI_TTS_URL", 'wss://cbm01.cn-huabei-1.xf-yun.com/v1/private/mcd9m97e6')
         self.voice_name = "x6_lingfeiyi_pro"
+        # 合成参数固定，同时作为分段缓存键的一部分
+        self.tts_params = {
+            "vcn": self.voice_name, "volume": 50, "speed": 50, "pitch": 50,
+            "audio": {"encoding": "lame", "sample_rate": 24000}
+        }
+        self.pool_size = pool_size
+        self.max_chunk_chars = max_chunk_chars
+        self.retries = retries
+        self.governor = governor or get_governor("xunfei")
+        # 可选 AudioSegmentCache：按行/句缓存 MP3 分段
+        self.cache = cache
+
+        self._auth_lock = threading.Lock()
+        self._auth_url = None
+        self._auth_expires = 0.0
+        self._pool = _ConnectionPool(self._get_auth_url, pool_size, reuse=reuse_connections)
+
+    def _get_auth_url(self):
+        """
+        返回有效期内缓存的鉴权 URL，过期后重新签名
+        """
+        with self._auth_lock:
+            now = time.time()
+            if self._auth_url is None or now >= self._auth_expires:
+                self._auth_url = self._create_auth_url()
+                self._auth_expires = now + self.AUTH_TTL
+            return self._auth_url
 
     def _create_auth_url(self):
         # 解析URL获取host和path用于签名
@@ -50,66 +157,167 @@ class XunfeiTTSGenerator:
         values = {"host": host, "date": date, "authorization": authorization}
         return self.host_url + "?" + urlencode(values)
 
-    def generate(self, text: str, student_level: str, save_dir: str):
+    # =====================================================
+    # 文本切分
+    # =====================================================
+    def split_text(self, text: str, merge: bool = True) -> List[str]:
         """
-        核心生成方法：传入提取出的纯净课文，生成 mp3
+        按说话人行与句末标点切分课文，再把相邻短句合并到 max_chunk_chars 以内
+        merge=False 时保留逐行/逐句的切分（启用分段缓存时使用，重复的句子才能命中）
         """
-        os.makedirs(save_dir, exist_ok=True)
-        timestamp = datetime.now().strftime("%H%M%S")
-        file_path = os.path.join(save_dir, f"{student_level}_{timestamp}.mp3")
+        pieces = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if len(line) <= self.max_chunk_chars:
+                pieces.append(line)
+                continue
+            # 超长行按句末标点再切
+            sentences = [x for x in re.split(r"(?<=[。！？!?；;])", line) if x.strip()]
+            for sent in sentences:
+                while len(sent) > self.max_chunk_chars:
+                    pieces.append(sent[:self.max_chunk_chars])
+                    sent = sent[self.max_chunk_chars:]
+                if sent.strip():
+                    pieces.append(sent)
+        if not merge:
+            return pieces
+
+        chunks = []
+        for piece in pieces:
+            # 新说话人开始时优先断开，其余情况尽量合并以减少请求数
+            starts_turn = bool(self.SPEAKER_PATTERN.match(piece))
+            if chunks and not starts_turn and len(chunks[-1]) + len(piece) + 1 <= self.max_chunk_chars:
+                chunks[-1] = f"{chunks[-1]}\n{piece}"
+            elif chunks and starts_turn and len(chunks[-1]) + len(piece) + 1 <= self.max_chunk_chars // 2:
+                chunks[-1] = f"{chunks[-1]}\n{piece}"
+            else:
+                chunks.append(piece)
+        return chunks
+
+    # =====================================================
+    # 单段合成
+    # =====================================================
+    def _build_request(self, text: str) -> str:
+        d = {
+            "header": {"app_id": self.app_id, "status": 2},
+            "parameter": {
+                "tts": self.tts_params
+            },
+            "payload": {
+                "text": {
+                    "encoding": "utf8", "status": 2,
+                    "text": str(base64.b64encode(text.encode('utf-8')), "UTF8")
+                }
+            }
+        }
+        return json.dumps(d)
+
+    def _synthesize_once(self, ws, text: str) -> bytes:
+        ws.send(self._build_request(text))
+        audio = bytearray()
+        while True:
+            res = json.loads(ws.recv())
+            code = res["header"]["code"]
+            if code != 0:
+                # 讯飞错误码走在帧里而非 HTTP 状态，保持原先“分段失败即重试”的行为
+                raise ProviderError(f"讯飞错误({code}): {res['header']['message']}", status_code=code,
+                                    retryable=True)
+            payload = res.get("payload", {}).get("audio")
+            if payload:
+                audio += base64.b64decode(payload["audio"])
+                if payload["status"] == 2:
+                    return bytes(audio)
 
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    def synthesize_chunk(self, text: str) -> bytes:
+        """
+        合成一段文本，经 governor 限速并在失败时单独重试（每次重试都新建连接，不取空闲连接）
+        """
+        attempts = []
 
-        auth_url = self._create_auth_url()
+        def attempt() -> bytes:
+            attempts.append(1)
+            ws = self._pool.acquire(fresh=len(attempts) > 1)
+            try:
+                audio = self._synthesize_once(ws, text)
+            except Exception:
+                self._pool.release(ws, broken=True)
+                raise
+            self._pool.release(ws)
+            return audio
 
-        # 内部回调函数，用于处理 WebSocket 流程
-        def on_message(ws, message):
+        with tracer.span("tts.chunk", voice=self.voice_name, units=len(text)) as sp:
             try:
-                res = json.loads(message)
-                code = res["header"]["code"]
-                if code != 0:
-                    print(f"❌ 讯飞错误: {res['header']['message']}")
-                    ws.close()
-                else:
-                    audio = base64.b64decode(res["payload"]["audio"]["audio"])
-                    status = res["payload"]["audio"]["status"]
-                    with open(file_path, 'ab') as f:
-                        f.write(audio)
-                    if status == 2:
-                        print(f"✅ 音频合成成功: {os.path.basename(file_path)}")
-                        ws.close()
-            except Exception as e:
-                print("解析异常:", e)
-
-        def on_open(ws):
-            def run(*args):
-                d = {
-                    "header": {"app_id": self.app_id, "status": 2},
-                    "parameter": {
-                        "tts": {
-                            "vcn": self.voice_name, "volume": 50, "speed": 50, "pitch": 50,
-                            "audio": {"encoding": "lame", "sample_rate": 24000}
-                        }
-                    },
-                    "payload": {
-                        "text": {
-                            "encoding": "utf8", "status": 2,
-                            "text": str(base64.b64encode(text.encode('utf-8')), "UTF8")
-                        }
-                    }
-                }
-                ws.send(json.dumps(d))
+                audio = self.governor.call(attempt, retries=self.retries)
+            finally:
+                sp.set(retries=max(0, len(attempts) - 1))
+            sp.set(bytes=len(audio))
+            return audio
+
+    def synthesize_to(self, text: str, sink: AudioSink):
+        """
+        合成整篇课文并按顺序写入 sink：各段并行合成，
+        前面的段一就绪就立即写出，流式 sink 无需等待全文完成
+        启用缓存时命中的段直接写出，只有未命中的段占用连接池
+        """
+        chunks = self.split_text(text, merge=self.cache is None)
+        if not chunks:
+            # sink 可能已打开（FileAudioSink 的 .part 文件），同样要放弃
+            sink.abort()
+            raise ValueError("课文为空，无法合成音频")
+
+        start = time.time()
+        cached = [self.cache.get(self.cache.make_key(c, self.tts_params)) if self.cache else None for c in chunks]
+        # 同一课里重复的句子也只合成一次
+        misses = list(dict.fromkeys(c for c, audio in zip(chunks, cached) if audio is None))
+        hits = sum(1 for audio in cached if audio is not None)
+        with tracer.span("tts.synthesize", chunks=len(chunks), cached=hits) as sp:
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, min(self.pool_size, len(misses))),
+                                        thread_name_prefix="tts") as pool:
+                    fresh = {chunk: pool.submit(self._synthesize_segment, chunk) for chunk in misses}
+                    for chunk, audio in zip(chunks, cached):
+                        sink.write(audio if audio is not None else fresh[chunk].result())
+            except Exception:
+                sink.abort()
+                raise
+
+            result = sink.commit()
+            sp.set(bytes=sink.bytes_written)
+        elapsed = max(time.time() - start, 1e-6)
+        hit_note = f"（缓存命中 {hits} 段）" if self.cache else ""
+        print(f"🔊 音频 {len(chunks)} 段{hit_note}，{sink.bytes_written / 1024:.1f} KB，"
+              f"耗时 {elapsed:.2f} 秒（{sink.bytes_written / 1024 / elapsed:.1f} KB/s）")
+        return result
+
+    def _synthesize_segment(self, text: str) -> bytes:
+        audio = self.synthesize_chunk(text)
+        if self.cache is not None:
+            self.cache.put(self.cache.make_key(text, self.tts_params), audio)
+        return audio
+
+    def generate(self, text: str, student_level: str, save_dir: str, sink: AudioSink = None):
+        """
+        核心生成方法：传入提取出的纯净课文，生成 mp3
+        课文按句/说话人切段，经连接池并行合成，再按原顺序拼接 MP3 帧
+        传入 sink（如 MemoryAudioSink / StreamAudioSink）时不落盘，直接返回 sink.commit() 的结果
+        """
+        if sink is None:
+            os.makedirs(save_dir, exist_ok=True)
+            timestamp = datetime.now().strftime("%H%M%S")
+            file_path = os.path.join(save_dir, f"{student_level}_{timestamp}.mp3")
+            sink = FileAudioSink(file_path)
 
-            thread.start_new_thread(run, ())
+        try:
+            result = self.synthesize_to(text, sink)
+        except Exception as e:
+            print(f"❌ 音频合成失败: {e}")
+            return None
 
-        ws = websocket.WebSocketApp(
-            auth_url,
-            on_message=on_message,
-            on_error=lambda ws, e: print(f"### error: {e}"),
-            on_close=lambda ws, st, msg: None
-        )
-        ws.on_open = on_open
-        ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+        if isinstance(sink, FileAudioSink):
+            print(f"✅ 音频合成成功: {os.path.basename(result)}")
+        return result
 
-        return file_path
\ No newline at end of file
+    def close(self):
+        self._pool.close_all()
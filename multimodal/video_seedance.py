@@ -1,77 +1,115 @@
 import os
 import time
-import requests
-import json
 from datetime import datetime
 from volcenginesdkarkruntime import Ark
 
+from common.tracing import tracer
+from common.governor import get_governor
+from common.downloader import get_downloader
+from db.segment_store import record_exists, read_record
+
 
 class SeedanceVideoGenerator:
     """
     豆包 Seedance 文生视频模块 (基于火山引擎 Ark SDK)
     """
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, index=None, base_url: str = None, governor=None):
+        # 可通过参数或 ARK_BASE_URL 覆盖；重试统一交给 governor，关闭 SDK 自带的重试
         self.client = Ark(
-            base_url="https://ark.cn-beijing.volces.com/api/v3",
-            api_key=api_key
+            base_url=base_url or os.getenv("ARK_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3"),
+            api_key=api_key,
+            max_retries=0
         )
+        self.governor = governor or get_governor("ark")
         self.model_id = "doubao-seedance-1-5-pro-251215"
+        self.index = index  # 可选 LessonIndex，生成后登记素材与所用提示词
 
     def generate_from_prompt_file(self, json_path: str, output_dir: str):
         """
         从提示词库 JSON 读取并生成视频
         """
-        if not os.path.exists(json_path):
+        if not record_exists(json_path):
             print(f"❌ 未找到文件: {json_path}")
             return
 
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = read_record(json_path)
 
         pure_prompt = data["payload"]["prompt"]
         student_level = data["metadata"]["student_level"]
 
-        return self.execute_generation(pure_prompt, student_level, output_dir)
+        save_path = self.execute_generation(pure_prompt, student_level, output_dir)
+        if save_path and self.index is not None:
+            self.index.add_media(save_path, kind="video", run_id=data["metadata"].get("run_id"),
+                                 level=student_level, prompt_path=json_path)
+        return save_path
 
-    def execute_generation(self, prompt: str, level: str, output_dir: str):
+    def submit_task(self, prompt: str) -> str:
         """
-        核心逻辑：提交任务 -> 异步轮询 -> 下载保存
+        仅提交视频生成任务，返回任务 ID（轮询交由调用方或 SeedanceTaskPoller）
         """
-        os.makedirs(output_dir, exist_ok=True)
         # 补充视频参数：5秒时长、固定摄像机、水印
         full_prompt = f"{prompt} --duration 5 --camerafixed false --watermark true"
-
-        try:
-            print(f"🚀 正在向 Seedance 提交视频生成任务...")
-            create_result = self.client.content_generation.tasks.create(
+        print(f"🚀 正在向 Seedance 提交视频生成任务...")
+        with tracer.span("video.submit", model=self.model_id, units=1):
+            create_result = self.governor.call(
+                self.client.content_generation.tasks.create,
                 model=self.model_id,
                 content=[{"type": "text", "text": full_prompt}]
             )
-            task_id = create_result.id
-            print(f"🆔 任务创建成功，ID: {task_id}")
+        print(f"🆔 任务创建成功，ID: {create_result.id}")
+        return create_result.id
+
+    def get_task(self, task_id: str, retries: int = None):
+        """
+        查询任务状态；retries 透传给 governor（轮询器自带重排，可传 0）
+        """
+        with tracer.span("video.poll", task_id=task_id) as sp:
+            get_result = self.governor.call(
+                self.client.content_generation.tasks.get, task_id=task_id, retries=retries)
+            sp.set(status=get_result.status)
+            return get_result
+
+    def save_result(self, get_result, level: str, output_dir: str):
+        """
+        任务成功后解析视频地址并下载，返回保存路径；无法解析地址时返回 None
+        """
+        video_url = self._parse_url(get_result)
+        if not video_url:
+            return None
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%H%M%S")
+        save_path = os.path.join(output_dir, f"{level}_{timestamp}.mp4")
+        self._download_video(video_url, save_path)
+        return save_path
+
+    def execute_generation(self, prompt: str, level: str, output_dir: str):
+        """
+        核心逻辑：提交任务 -> 异步轮询 -> 下载保存
+        """
+        os.makedirs(output_dir, exist_ok=True)
+
+        try:
+            task_id = self.submit_task(prompt)
 
             # 轮询状态
             start_time = time.time()
             while True:
                 if time.time() - start_time > 900:  # 15分钟超时
                     print(f"⌛ 视频生成超时。")
+                    tracer.record("video.wait", start_time, outcome="error", error="timeout", task_id=task_id)
                     return None
 
-                get_result = self.client.content_generation.tasks.get(task_id=task_id)
+                get_result = self.get_task(task_id)
                 status = get_result.status
 
                 if status == "succeeded":
-                    # 解析 URL
-                    video_url = self._parse_url(get_result)
-                    if video_url:
-                        timestamp = datetime.now().strftime("%H%M%S")
-                        save_path = os.path.join(output_dir, f"{level}_{timestamp}.mp4")
-                        self._download_video(video_url, save_path)
-                        return save_path
-                    break
+                    tracer.record("video.wait", start_time, task_id=task_id)
+                    return self.save_result(get_result, level, output_dir)
                 elif status == "failed":
                     print(f"❌ 视频任务失败: {get_result.error}")
+                    tracer.record("video.wait", start_time, outcome="error", error=str(get_result.error),
+                                  task_id=task_id)
                     break
                 else:
                     print(f"⏳ 视频处理中({status})... 15秒后重试")
@@ -92,11 +130,9 @@ class SeedanceVideoGenerator:
 
     def _download_video(self, url, save_path):
         try:
-            response = requests.get(url, stream=True, timeout=60)
-            if response.status_code == 200:
-                with open(save_path, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                print(f"✅ 视频已保存: {save_path}")
+            with tracer.span("video.download") as sp:
+                result = get_downloader().download(url, save_path)
+                sp.set(bytes=result["bytes"], retries=result["resumes"])
+            print(f"✅ 视频已保存: {save_path}")
         except Exception as e:
-            print(f"❌ 下载视频异常: {e}")
\ No newline at end of file
+            print(f"❌ 下载视频异常: {e}")
@@ -0,0 +1,409 @@
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+from llm.teaching_plan_gen import QwenTeachingPlanGenerator
+from llm.response_cache import ResponseCache
+from lesson_plan.parser import TeachingPlanParser
+from prompt.prompt_builder import MultimodalPromptBuilder
+from prompt.prompt_saver import PromptSaver
+from multimodal.image_wanx import WanXImageGenerator
+from multimodal.tts_xunfei import XunfeiTTSGenerator
+from multimodal.video_seedance import SeedanceVideoGenerator
+from multimodal.seedance_poller import SeedanceTaskPoller
+from multimodal.media_executor import MediaStageExecutor
+from db.lesson_index import LessonIndex
+from pipeline.run_identity import RunManifest, new_run_id, run_dir
+from common.tracing import tracer
+from common import governor
+
+
+# 各阶段默认并发上限：LLM 调用 / 文生图 / TTS 连接 / Seedance 任务
+DEFAULT_LIMITS = {
+    "lessons": 4,
+    "llm": 4,
+    "image": 2,
+    "tts": 2,
+    "video": 2
+}
+
+
+def load_manifest(path: str) -> List[Dict[str, str]]:
+    """
+    读取批量清单（CSV 或 JSONL），每行一个 (level, topic)
+    兼容字段名：level / student_level，topic / content
+    """
+    rows = []
+    if path.lower().endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            records = list(csv.DictReader(f))
+
+    for i, rec in enumerate(records, 1):
+        level = (rec.get("level") or rec.get("student_level") or "").strip()
+        topic = (rec.get("topic") or rec.get("content") or "").strip()
+        if not level or not topic:
+            print(f"⚠️ 清单第 {i} 行缺少 level/topic，已跳过")
+            continue
+        rows.append({"level": level, "topic": topic})
+    return rows
+
+
+class BatchLessonRunner:
+    """
+    批量课程生成：清单中的每个 (等级, 主题) 依次经过
+    教案生成 -> 课文解析 -> 提示词生成 -> 三路素材生成
+    每个阶段单独限流，互不挤占
+    """
+
+    def __init__(
+        self,
+        keys: Dict[str, str],
+        lesson_db: str,
+        prompt_db: str,
+        output_root: str,
+        limits: Dict[str, int] = None,
+        cache: ResponseCache = None,
+        use_cache: bool = True,
+        lesson_index: LessonIndex = None,
+        video_poll_interval: float = 5.0,
+        image_n: int = 1,
+        image_sizes: List[str] = None,
+        topic_index=None,
+        reuse: str = "off",
+        reuse_threshold: float = 0.85,
+        audio_cache=None,
+        parallel_plan: bool = False,
+        plan_store=None,
+        prompt_store=None
+    ):
+        self.keys = keys
+        self.lesson_db = lesson_db
+        self.prompt_db = prompt_db
+        self.output_root = output_root
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.cache = cache
+        self.use_cache = use_cache
+        self.lesson_index = lesson_index
+        self.image_n = image_n
+        self.image_sizes = image_sizes
+        # 可选 TopicIndex（需要 lesson_index）：suggest 只在报告里记录相似教案，auto 直接复用齐全的旧运行
+        self.topic_index = topic_index if lesson_index is not None else None
+        self.reuse = reuse
+        self.reuse_threshold = reuse_threshold
+        self.audio_cache = audio_cache
+        # 章节并发生成时，一门课的各章节请求共用该课占到的 llm 名额
+        self.parallel_plan = parallel_plan
+
+        self._sems = {
+            name: threading.BoundedSemaphore(max(1, n))
+            for name, n in self.limits.items() if name != "lessons"
+        }
+        # 服务商层的并发上限与阶段上限保持一致（限速 qps 仍按 governor 默认策略）
+        for provider, stage in (("qwen", "llm"), ("wanx", "image"), ("xunfei", "tts"), ("ark", "video")):
+            governor.configure(provider, concurrency=max(1, self.limits[stage]))
+
+        self.plan_gen = QwenTeachingPlanGenerator(
+            api_key=keys["QWEN"], save_dir=lesson_db, cache=cache, index=lesson_index, store=plan_store)
+        self.p_builder = MultimodalPromptBuilder(api_key=keys["QWEN"], cache=cache)
+        self.p_saver = PromptSaver(base_dir=prompt_db, index=lesson_index, store=prompt_store)
+        self.image_gen = WanXImageGenerator(api_key=keys["QWEN"])
+        self.media_executor = MediaStageExecutor()
+        # 所有课程的视频任务共用一个轮询线程，不再每个视频占一个线程 sleep
+        self.video_poller = SeedanceTaskPoller(
+            SeedanceVideoGenerator(api_key=keys["ARK_KEY"]),
+            state_path=os.path.join(os.path.dirname(os.path.abspath(output_root)), "seedance_pending.json"),
+            min_interval=video_poll_interval
+        )
+        # TTS 连接池在课程之间共享：鉴权签名复用，并发连接数受 limits["tts"] 约束
+        self.tts = XunfeiTTSGenerator(
+            keys["XUNFEI_APPID"], keys["XUNFEI_KEY"], keys["XUNFEI_SECRET"], pool_size=self.limits["tts"],
+            cache=audio_cache)
+
+    def _limited(self, stage: str, fn, *args):
+        with self._sems[stage]:
+            return fn(*args)
+
+    def _generate_image(self, image_gen: WanXImageGenerator, prompt: str, level: str, media_dir: str, run_id: str):
+        """
+        单张模式直接生成；多候选模式返回排名第一的图片，其余候选留在同一目录
+        """
+        if self.image_n <= 1 and not self.image_sizes:
+            return image_gen.execute_generation(prompt, level, media_dir, run_id)
+        variants = image_gen.generate_variants(prompt, level, media_dir, self.image_n, self.image_sizes, run_id)
+        return variants[0]["path"] if variants else None
+
+    def _reuse_similar(self, level: str, topic: str, run_id: str, media_dir: str, report: Dict[str, Any]) -> bool:
+        """
+        同等级存在近重复教案时记入 report["similar"]；auto 模式且原运行三路素材齐全时
+        把素材硬链接进本课目录并返回 True，整节课不再调用任何服务商
+        """
+        if self.topic_index is None or self.reuse == "off":
+            return False
+        self.topic_index.sync(self.lesson_index)
+        matches = self.topic_index.search(level, topic, k=1, min_score=self.reuse_threshold)
+        if not matches:
+            return False
+        best = matches[0]
+        report["similar"] = {"run_id": best["run_id"], "path": best["path"], "score": best["score"]}
+        if self.reuse != "auto" or not best["run_id"]:
+            return False
+        artifacts = self.lesson_index.run_artifacts(best["run_id"])
+        if not {"image", "audio", "video"} <= set(artifacts["media"]):
+            return False
+
+        from db.topic_index import link_artifact
+        for kind in ("image", "audio", "video"):
+            path = link_artifact(artifacts["media"][kind], media_dir)
+            self.lesson_index.add_media(path, kind=kind, run_id=run_id, level=level,
+                                        prompt_path=artifacts["prompts"].get(kind))
+            report["media"][kind] = {"success": True, "path": path, "error": None, "elapsed": 0.0}
+        report.update(success=True, media_dir=media_dir, reused_from=best["run_id"])
+        return True
+
+    # =====================================================
+    # 单节课流水线
+    # =====================================================
+    def run_lesson(self, index: int, level: str, topic: str) -> Dict[str, Any]:
+        return self.start_lesson(index, level, topic).result()
+
+    def start_lesson(self, index: int, level: str, topic: str) -> Future:
+        """
+        在调用线程中执行到视频提交、图片与音频完成为止，返回解析为课程报告的 Future
+        视频提交后只由 SeedanceTaskPoller 跟踪，完成时在回调里收尾（登记素材、写 manifest），
+        课程线程与 video 名额都不再等待视频，limits["video"] 只约束同时提交的数量
+        """
+        report = {
+            "index": index,
+            "level": level,
+            "topic": topic,
+            "success": False,
+            "error": None,
+            "timings": {},
+            "media_dir": None,
+            "media": {}
+        }
+        start = time.time()
+
+        run_id = new_run_id(level, topic)
+        media_dir = run_dir(self.output_root, run_id)
+        report["run_id"] = run_id
+        sources = {}
+        done = Future()
+        # 视频一经提交就登记在这里，之后的步骤即使抛错也要等视频结束、经 _finish_video 收尾
+        in_flight: List[Tuple[Future, float]] = []
+
+        try:
+            self._run_stages(report, sources, level, topic, run_id, media_dir, in_flight)
+        except Exception as e:
+            report["error"] = str(e)
+        if not in_flight:
+            self._complete(report, sources, start, done)
+        else:
+            video, media_start = in_flight[0]
+            video.add_done_callback(lambda f: self._finish_video(report, sources, start, media_start, f, done))
+        return done
+
+    def _run_stages(self, report: Dict[str, Any], sources: Dict[str, str], level: str, topic: str,
+                    run_id: str, media_dir: str, in_flight: List[Tuple[Future, float]]) -> None:
+        """
+        阶段 0~4；视频提交后立即把 (在途视频的 Future, 素材阶段开始时间) 放入 in_flight，
+        提前结束（复用 / 失败）时 in_flight 保持为空
+        """
+        # 阶段 0: 近重复主题直接复用
+        if self._reuse_similar(level, topic, run_id, media_dir, report):
+            return
+
+        # 阶段 1: 教案
+        t0 = time.time()
+        if self.parallel_plan:
+            res = self._limited(
+                "llm", self.plan_gen.generate_teaching_plan_parallel, level, topic, None, True,
+                self.use_cache, run_id)
+        else:
+            res = self._limited(
+                "llm", self.plan_gen.generate_teaching_plan, level, topic, True, self.use_cache, run_id)
+        report["timings"]["plan"] = round(time.time() - t0, 3)
+        if not res["success"]:
+            report["error"] = f"教案生成失败: {res['error']}"
+            return
+        sources["plan"] = res.get("save_path")
+
+        # 阶段 2: 解析
+        clean_text = TeachingPlanParser(res["teaching_plan"]).extract_lesson_text()
+        if not clean_text:
+            report["error"] = "未能从教案中解析出课文"
+            return
+
+        # 阶段 3: 提示词
+        t0 = time.time()
+        prompts = self._limited(
+            "llm", self.p_builder.generate_many, ["image", "video"], level, clean_text, self.use_cache)
+        img_prompt, vid_prompt = prompts["image"], prompts["video"]
+        report["timings"]["prompts"] = round(time.time() - t0, 3)
+
+        prompt_paths = {
+            "image": self.p_saver.save("image", "WanX-2.5", level, clean_text, img_prompt, run_id=run_id),
+            "video": self.p_saver.save("video", "Seedance", level, clean_text, vid_prompt, run_id=run_id)
+        }
+        sources.update(image_prompt=prompt_paths["image"], video_prompt=prompt_paths["video"])
+
+        # 阶段 4: 素材（视频最先提交，耗时最长）
+        os.makedirs(media_dir, exist_ok=True)
+        report["media_dir"] = media_dir
+
+        t0 = time.time()
+        in_flight.append((self._submit_video(vid_prompt, level, media_dir), t0))
+        media = self.media_executor.run_jobs({
+            "image": lambda: self._limited(
+                "image", self._generate_image, self.image_gen, img_prompt, level, media_dir, run_id),
+            "audio": lambda: self._limited("tts", self.tts.generate, clean_text, level, media_dir),
+        })
+        report["timings"]["media"] = round(time.time() - t0, 3)
+        report["media"] = media["results"]
+        self._index_media(report, level, run_id, prompt_paths)
+
+    def _submit_video(self, prompt: str, level: str, media_dir: str) -> Future:
+        """
+        只有提交占用 video 名额；提交失败时返回已带异常的 Future，按视频失败处理
+        """
+        try:
+            return self._limited("video", self.video_poller.submit, prompt, level, media_dir)
+        except Exception as e:
+            failed = Future()
+            failed.set_exception(e)
+            return failed
+
+    def _finish_video(self, report: Dict[str, Any], sources: Dict[str, str], start: float, media_start: float,
+                      video: Future, done: Future) -> None:
+        """
+        视频 Future 完成时的回调（运行在轮询 / 下载线程），补全视频结果后结束本课
+        """
+        # 视频之前的步骤已失败时保留其错误，本课不算成功
+        stage_error = report["error"]
+        try:
+            try:
+                path = video.result()
+                ok = bool(path) and os.path.exists(path)
+                r = {"success": ok, "path": path if ok else None, "error": None if ok else "未生成输出文件"}
+            except Exception as e:
+                r = {"success": False, "path": None, "error": str(e)}
+            r["elapsed"] = round(time.time() - media_start, 3)
+            report["media"]["video"] = r
+            report["timings"]["media"] = r["elapsed"]
+            self._index_media(report, report["level"], report["run_id"],
+                              {"video": sources.get("video_prompt")}, kinds=("video",))
+            report["success"] = stage_error is None and all(m["success"] for m in report["media"].values())
+            if not report["success"] and stage_error is None:
+                failed = [k for k, m in report["media"].items() if not m["success"]]
+                report["error"] = f"素材生成失败: {', '.join(failed)}"
+        except Exception as e:
+            report["error"] = str(e)
+        self._complete(report, sources, start, done)
+
+    def _index_media(self, report: Dict[str, Any], level: str, run_id: str, prompt_paths: Dict[str, str],
+                     kinds=("image", "audio")) -> None:
+        if self.lesson_index is None:
+            return
+        for name in kinds:
+            r = report["media"].get(name)
+            if r and r["success"]:
+                self.lesson_index.add_media(r["path"], kind=name, run_id=run_id, level=level,
+                                            prompt_path=prompt_paths.get(name))
+
+    def _complete(self, report: Dict[str, Any], sources: Dict[str, str], start: float, done: Future) -> None:
+        report["timings"]["total"] = round(time.time() - start, 3)
+        try:
+            if report["media_dir"] and os.path.isdir(report["media_dir"]):
+                self._write_manifest(report, sources)
+        except Exception as e:
+            report["error"] = report["error"] or f"manifest 写入失败: {e}"
+        done.set_result(report)
+
+    @staticmethod
+    def _write_manifest(report: Dict[str, Any], sources: Dict[str, str]) -> None:
+        manifest = RunManifest.open(report["media_dir"], report["run_id"], report["level"], report["topic"])
+        for name, ref in sources.items():
+            manifest.set_source(name, ref)
+        if report.get("reused_from"):
+            manifest.set_source("reused_from", report["reused_from"])
+        for stage, seconds in report["timings"].items():
+            manifest.set_timing(stage, seconds)
+        for kind, r in report["media"].items():
+            if r["success"] and r["path"] and os.path.exists(r["path"]):
+                manifest.add_asset(kind, r["path"], elapsed=r["elapsed"])
+        manifest.collect()
+        report["manifest"] = manifest.save()
+
+    # =====================================================
+    # 批量执行 + 汇总报告
+    # =====================================================
+    def run(self, rows: List[Dict[str, str]], report_path: str = None) -> Dict[str, Any]:
+        print(f"📦 批量任务开始：共 {len(rows)} 节课，并发配置 {self.limits}")
+        # 上次中断时仍在生成的视频任务继续轮询并下载到原目录
+        self.video_poller.resume()
+        start = time.time()
+        futures: List[Future] = [None] * len(rows)
+        done = 0
+        lock = threading.Lock()
+
+        def progress(row: Dict[str, str], r: Dict[str, Any]):
+            nonlocal done
+            with lock:
+                done += 1
+                mark = "✅" if r["success"] else "❌"
+                print(f"{mark} [{done}/{len(rows)}] {row['level']} · {row['topic'][:20]} "
+                      f"({r['timings'].get('total')} 秒){'' if r['success'] else ' - ' + str(r['error'])}")
+
+        def worker(i: int, row: Dict[str, str]):
+            # 课程线程做完视频提交即返回，视频完成时由回调记录结果
+            futures[i] = self.start_lesson(i + 1, row["level"], row["topic"])
+            futures[i].add_done_callback(lambda f: progress(row, f.result()))
+
+        with ThreadPoolExecutor(max_workers=max(1, self.limits["lessons"]), thread_name_prefix="lesson") as pool:
+            for i, row in enumerate(rows):
+                pool.submit(worker, i, row)
+        wait([f for f in futures if f is not None])
+        lessons = [f.result() if f is not None else None for f in futures]
+
+        self.video_poller.shutdown()
+        self.tts.close()
+        elapsed = time.time() - start
+        succeeded = sum(1 for r in lessons if r and r["success"])
+        summary = {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "total": len(rows),
+            "succeeded": succeeded,
+            "failed": len(rows) - succeeded,
+            "elapsed": round(elapsed, 3),
+            "lessons_per_hour": round(len(rows) / elapsed * 3600, 2) if elapsed > 0 else 0.0,
+            "limits": self.limits,
+            "llm_cache": self.cache.stats() if self.cache is not None else None,
+            "tts_cache": self.audio_cache.stats() if self.audio_cache is not None else None,
+            "stages": tracer.summary(since=start),
+            "lessons": lessons
+        }
+
+        if report_path is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            report_path = os.path.join(self.output_root, "reports", f"batch_report_{timestamp}.json")
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        # 逐条 span 与 Prometheus 快照与报告放在一起
+        report_base = os.path.splitext(report_path)[0]
+        tracer.export_jsonl(f"{report_base}.trace.jsonl", since=start)
+        tracer.write_prometheus(f"{report_base}.prom", since=start)
+        tracer.print_summary(since=start)
+
+        print(f"\n📊 批量完成：成功 {succeeded} / 失败 {summary['failed']}，"
+              f"总耗时 {summary['elapsed']} 秒，吞吐 {summary['lessons_per_hour']} 课/小时")
+        print(f"📝 报告已保存至：{report_path}")
+        return summary
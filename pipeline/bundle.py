@@ -0,0 +1,267 @@
+import hashlib
+import io
+import json
+import os
+import socket
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, BinaryIO, Union
+
+from db.segment_store import read_record, record_exists
+from pipeline.checkpoint import RunCheckpoint
+from pipeline.run_identity import ASSET_KINDS, RunManifest, run_dir
+
+
+BUNDLE_FORMATS = {"zip": ".zip", "tar": ".tar"}
+# 教案 / 提示词在包内的位置与 JSON 缩进（与逐文件布局一致：教案 2，提示词 4）
+SOURCE_ENTRIES = {
+    "plan": ("plan.json", 2),
+    "image_prompt": ("prompts/image.json", 4),
+    "video_prompt": ("prompts/video.json", 4),
+}
+
+
+class _HashingReader:
+    """
+    tarfile.addfile 按块 read 时顺带计算 sha256，素材只读一遍
+    """
+
+    def __init__(self, f: BinaryIO):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._f.read(size)
+        self.sha256.update(chunk)
+        return chunk
+
+
+class BundleExporter:
+    """
+    课程打包：一次运行的教案、两份提示词与图片 / 音频 / 视频打成一个 zip 或 tar，附 manifest.json
+    - 媒体本身已压缩，一律不再压缩（zip 用 STORED，tar 不套 gzip），按块从磁盘直接流向输出
+    - 输出可以是文件路径，也可以是任意可写的二进制流（socket.makefile、HTTP 响应的 wfile），
+      不需要 seek，包内容不在内存中暂存；manifest.json 最后写入，带上各文件的大小与 sha256
+    - export_many 用有界线程池并发导出多次运行，每次运行一个包
+    """
+
+    def __init__(self, output_root: str, runs_dir: str = None, chunk_size: int = 1024 * 1024):
+        self.output_root = output_root
+        self.runs_dir = runs_dir
+        self.chunk_size = chunk_size
+
+    # =====================================================
+    # 收集一次运行的文件
+    # =====================================================
+    def locate(self, run_id: str) -> Dict[str, Any]:
+        """
+        优先读运行目录里的 manifest.json（批量 / 服务模式只有它）；
+        分片之前的旧运行没有清单时，按检查点找素材目录与来源
+        """
+        checkpoint = None
+        if self.runs_dir:
+            try:
+                checkpoint = RunCheckpoint.load(self.runs_dir, run_id)
+            except FileNotFoundError:
+                pass
+        media_dir = run_dir(self.output_root, run_id)
+        if not os.path.isdir(media_dir) and checkpoint is not None:
+            media_dir = checkpoint.data["media_dir"]
+        manifest = RunManifest.load(media_dir) if os.path.isdir(media_dir) else None
+        if manifest is None and checkpoint is None:
+            raise FileNotFoundError(f"未找到运行: {run_id}")
+
+        info = {"run_id": run_id, "media_dir": media_dir, "sources": {}, "timings": {}, "assets": []}
+        if checkpoint is not None:
+            info.update(level=checkpoint.data["level"], topic=checkpoint.data["topic"])
+            if checkpoint.is_done("plan"):
+                info["sources"]["plan"] = checkpoint.get("plan")["path"]
+            if checkpoint.is_done("prompts"):
+                for kind in ("image", "video"):
+                    info["sources"][f"{kind}_prompt"] = checkpoint.get("prompts")[kind]
+        if manifest is not None:
+            data = manifest.data
+            info.update(level=data.get("level"), topic=data.get("topic"), timings=data.get("timings", {}))
+            info["sources"].update(data.get("sources", {}))
+            info["assets"] = [(a["kind"], a["file"]) for a in data["assets"]]
+        elif os.path.isdir(media_dir):
+            info["assets"] = [(ASSET_KINDS[os.path.splitext(name)[1].lower()], name)
+                              for name in sorted(os.listdir(media_dir))
+                              if os.path.splitext(name)[1].lower() in ASSET_KINDS]
+        return info
+
+    def entries(self, run_id: str) -> Dict[str, Any]:
+        """
+        返回运行信息与包内条目：教案 / 提示词序列化成 JSON（体积小，放内存），素材只记路径
+        """
+        info = self.locate(run_id)
+        items = []
+        for name, (arcname, indent) in SOURCE_ENTRIES.items():
+            ref = info["sources"].get(name)
+            if not ref or not record_exists(ref):
+                continue
+            data = json.dumps(read_record(ref), ensure_ascii=False, indent=indent).encode("utf-8")
+            items.append({"arcname": f"{run_id}/{arcname}", "kind": name, "data": data, "size": len(data)})
+        for kind, rel in info["assets"]:
+            path = os.path.join(info["media_dir"], rel)
+            if not os.path.exists(path):
+                print(f"⚠️ {run_id} 缺少素材文件: {rel}")
+                continue
+            items.append({"arcname": f"{run_id}/media/{rel}", "kind": kind, "path": path,
+                          "size": os.path.getsize(path)})
+        info["items"] = items
+        return info
+
+    # =====================================================
+    # 流式写出
+    # =====================================================
+    def write(self, run_ids: List[str], out: Union[str, BinaryIO], fmt: str = "zip") -> Dict[str, Any]:
+        """
+        把一个或多个运行写成一个包；out 为路径时先写临时文件再改名，返回 manifest 内容
+        """
+        if fmt not in BUNDLE_FORMATS:
+            raise ValueError(f"不支持的打包格式: {fmt}（可选: {', '.join(BUNDLE_FORMATS)}）")
+        runs = [self.entries(run_id) for run_id in run_ids]
+
+        if isinstance(out, str):
+            os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+            tmp_path = f"{out}.tmp"
+            with open(tmp_path, "wb") as f:
+                manifest = self._write_stream(runs, f, fmt)
+            os.replace(tmp_path, out)
+            return manifest
+        return self._write_stream(runs, out, fmt)
+
+    def _write_stream(self, runs: List[Dict[str, Any]], out: BinaryIO, fmt: str) -> Dict[str, Any]:
+        files = []
+        manifest = {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "format": fmt,
+            "runs": [{k: r.get(k) for k in ("run_id", "level", "topic", "sources", "timings")} for r in runs],
+            "files": files
+        }
+        items = [item for r in runs for item in r["items"]]
+        if fmt == "zip":
+            # 输出不可 seek（socket / HTTP）时 zipfile 自动改用数据描述符，无需回写本地文件头
+            with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for item in items:
+                    files.append(self._zip_entry(zf, item))
+                self._zip_bytes(zf, "manifest.json", self._manifest_bytes(manifest))
+        else:
+            with tarfile.open(fileobj=out, mode="w|", format=tarfile.PAX_FORMAT) as tf:
+                for item in items:
+                    files.append(self._tar_entry(tf, item))
+                data = self._manifest_bytes(manifest)
+                tf.addfile(self._tarinfo("manifest.json", len(data)), io.BytesIO(data))
+        manifest["bytes"] = sum(f["bytes"] for f in files)
+        return manifest
+
+    @staticmethod
+    def _manifest_bytes(manifest: Dict[str, Any]) -> bytes:
+        return json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+
+    def _zip_entry(self, zf: zipfile.ZipFile, item: Dict[str, Any]) -> Dict[str, Any]:
+        zinfo = zipfile.ZipInfo(item["arcname"], date_time=self._date_time(item))
+        zinfo.compress_type = zipfile.ZIP_STORED
+        zinfo.file_size = item["size"]  # 预告大小，超过 4GB 时自动使用 ZIP64
+        sha256 = hashlib.sha256()
+        with zf.open(zinfo, "w") as dst:
+            if "data" in item:
+                sha256.update(item["data"])
+                dst.write(item["data"])
+            else:
+                with open(item["path"], "rb") as src:
+                    for chunk in iter(lambda: src.read(self.chunk_size), b""):
+                        sha256.update(chunk)
+                        dst.write(chunk)
+        return {"file": item["arcname"], "kind": item["kind"], "bytes": item["size"], "sha256": sha256.hexdigest()}
+
+    @staticmethod
+    def _zip_bytes(zf: zipfile.ZipFile, arcname: str, data: bytes) -> None:
+        zinfo = zipfile.ZipInfo(arcname, date_time=datetime.now().timetuple()[:6])
+        zinfo.compress_type = zipfile.ZIP_STORED
+        zf.writestr(zinfo, data)
+
+    def _tar_entry(self, tf: tarfile.TarFile, item: Dict[str, Any]) -> Dict[str, Any]:
+        info = self._tarinfo(item["arcname"], item["size"])
+        if "path" in item:
+            info.mtime = os.path.getmtime(item["path"])
+            with open(item["path"], "rb") as src:
+                reader = _HashingReader(src)
+                tf.addfile(info, reader)
+        else:
+            reader = _HashingReader(io.BytesIO(item["data"]))
+            tf.addfile(info, reader)
+        return {"file": item["arcname"], "kind": item["kind"], "bytes": item["size"],
+                "sha256": reader.sha256.hexdigest()}
+
+    @staticmethod
+    def _tarinfo(arcname: str, size: int) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(arcname)
+        info.size = size
+        info.mtime = time.time()
+        info.mode = 0o644
+        return info
+
+    @staticmethod
+    def _date_time(item: Dict[str, Any]) -> tuple:
+        ts = os.path.getmtime(item["path"]) if "path" in item else time.time()
+        # zip 的时间戳不能早于 1980 年
+        return max(datetime.fromtimestamp(ts).timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+    def send(self, run_ids: List[str], host: str, port: int, fmt: str = "zip") -> Dict[str, Any]:
+        """
+        直接推送到 TCP 对端（如另一台机器上 nc -l 接收），不落本地文件
+        """
+        with socket.create_connection((host, port)) as sock, sock.makefile("wb") as out:
+            return self.write(run_ids, out, fmt)
+
+    # =====================================================
+    # 批量导出
+    # =====================================================
+    def export_many(self, run_ids: List[str], dest_dir: str, fmt: str = "zip", workers: int = 4) -> Dict[str, Any]:
+        """
+        每次运行导出为 dest_dir/<run_id>.zip，线程池大小即同时打开的包数量
+        """
+        total = len(run_ids)
+        results: List[Dict[str, Any]] = []
+        lock = threading.Lock()
+        start = time.time()
+
+        def worker(run_id: str):
+            t0 = time.time()
+            path = os.path.join(dest_dir, f"{run_id}{BUNDLE_FORMATS[fmt]}")
+            try:
+                manifest = self.write([run_id], path, fmt)
+                r = {"run_id": run_id, "success": True, "path": path, "bytes": manifest["bytes"],
+                     "files": len(manifest["files"]), "error": None}
+            except Exception as e:
+                r = {"run_id": run_id, "success": False, "path": None, "bytes": 0, "files": 0, "error": str(e)}
+            r["elapsed"] = round(time.time() - t0, 3)
+            with lock:
+                results.append(r)
+                mark = "✅" if r["success"] else "❌"
+                print(f"{mark} [{len(results)}/{total}] {run_id} "
+                      f"{r['bytes'] / 1024 / 1024:.1f} MB{'' if r['success'] else ' - ' + str(r['error'])}")
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bundle") as pool:
+            for run_id in run_ids:
+                pool.submit(worker, run_id)
+
+        elapsed = time.time() - start
+        total_bytes = sum(r["bytes"] for r in results)
+        summary = {
+            "total": total,
+            "succeeded": sum(1 for r in results if r["success"]),
+            "bytes": total_bytes,
+            "elapsed": round(elapsed, 3),
+            "mb_per_s": round(total_bytes / 1024 / 1024 / elapsed, 2) if elapsed > 0 else 0.0,
+            "results": results
+        }
+        print(f"📦 导出完成：{summary['succeeded']}/{total} 个课程包，"
+              f"{total_bytes / 1024 / 1024:.1f} MB，{summary['mb_per_s']} MB/s，保存至：{dest_dir}")
+        return summary
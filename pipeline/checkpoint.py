@@ -0,0 +1,85 @@
+import json
+import os
+from datetime import datetime
+from typing import Dict, Any, List
+
+from pipeline.run_identity import shard
+
+
+class RunCheckpoint:
+    """
+    单次运行的阶段检查点：storage/runs/<分片>/<run_id>.json（分片规则同素材目录）
+    记录每个阶段（教案、解析、提示词、图片、音频、视频）的状态与产物路径，
+    --resume 时跳过已完成的阶段，只重跑缺失或失败的部分
+    """
+
+    STAGES = ("plan", "parse", "prompts", "image", "audio", "video")
+
+    def __init__(self, path: str, data: Dict[str, Any]):
+        self.path = path
+        self.data = data
+
+    @staticmethod
+    def _path(root: str, run_id: str) -> str:
+        return os.path.join(root, *shard(run_id), f"{run_id}.json")
+
+    @classmethod
+    def create(cls, root: str, run_id: str, level: str, topic: str, media_dir: str) -> "RunCheckpoint":
+        path = cls._path(root, run_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "run_id": run_id,
+            "level": level,
+            "topic": topic,
+            "media_dir": media_dir,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "stages": {stage: {"status": "pending"} for stage in cls.STAGES}
+        }
+        ckpt = cls(path, data)
+        ckpt._save()
+        return ckpt
+
+    @classmethod
+    def load(cls, root: str, run_id: str) -> "RunCheckpoint":
+        path = cls._path(root, run_id)
+        if not os.path.exists(path):
+            path = os.path.join(root, f"{run_id}.json")  # 分片之前的旧检查点
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"未找到运行记录: {run_id}")
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    @property
+    def run_id(self) -> str:
+        return self.data["run_id"]
+
+    def is_done(self, stage: str) -> bool:
+        return self.data["stages"][stage]["status"] == "done"
+
+    def get(self, stage: str) -> Dict[str, Any]:
+        return self.data["stages"][stage]
+
+    def pending(self) -> List[str]:
+        return [stage for stage in self.STAGES if not self.is_done(stage)]
+
+    def mark_done(self, stage: str, **info) -> None:
+        self.data["stages"][stage] = {
+            "status": "done",
+            "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            **info
+        }
+        self._save()
+
+    def mark_failed(self, stage: str, error: str) -> None:
+        self.data["stages"][stage] = {
+            "status": "failed",
+            "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "error": error
+        }
+        self._save()
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,136 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    level           TEXT NOT NULL,
+    topic           TEXT NOT NULL,
+    status          TEXT NOT NULL,
+    run_id          TEXT,
+    error           TEXT,
+    result          TEXT,
+    created_at      TEXT NOT NULL,
+    started_at      TEXT,
+    finished_at     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);
+"""
+
+STATUSES = ("queued", "running", "done", "failed")
+
+
+class JobQueue:
+    """
+    持久化课程任务队列（SQLite）：服务重启后 queued 任务继续处理，
+    上次中断时仍在 running 的任务重新排队
+    """
+
+    def __init__(self, db_path: str = os.path.join("storage", "jobs.db")):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'").rowcount
+        if requeued:
+            print(f"🔁 {requeued} 个中断的任务已重新排队")
+
+    def submit(self, level: str, topic: str) -> Dict[str, Any]:
+        with self._available, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (level, topic, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (level, topic, self._now())
+            )
+            self._available.notify()
+            job_id = cur.lastrowid
+        return self.get(job_id)
+
+    def claim(self, timeout: float = None) -> Optional[Dict[str, Any]]:
+        """
+        取出最早的 queued 任务并标记为 running；队列为空时最多等待 timeout 秒
+        """
+        with self._available:
+            row = self._claim_locked()
+            if row is None and timeout:
+                self._available.wait(timeout)
+                row = self._claim_locked()
+            return row
+
+    def _claim_locked(self) -> Optional[Dict[str, Any]]:
+        # 调用方已持有 self._lock
+        row = self._conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return None
+        with self._conn:
+            self._conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                               (self._now(), row["id"]))
+        job = dict(row)
+        job["status"] = "running"
+        return job
+
+    def finish(self, job_id: int, report: Dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, run_id = ?, error = ?, result = ?, finished_at = ? WHERE id = ?",
+                (
+                    "done" if report.get("success") else "failed",
+                    report.get("run_id"),
+                    report.get("error"),
+                    json.dumps(report, ensure_ascii=False),
+                    self._now(),
+                    job_id
+                )
+            )
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def list(self, status: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+        sql, args = "SELECT * FROM jobs", []
+        if status:
+            sql += " WHERE status = ?"
+            args.append(status)
+        sql += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [self._decode(r) for r in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in STATUSES}
+        counts.update({r["status"]: r["n"] for r in rows})
+        return counts
+
+    def wake_all(self) -> None:
+        with self._available:
+            self._available.notify_all()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        if job.get("result"):
+            job["result"] = json.loads(job["result"])
+        return job
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
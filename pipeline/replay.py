@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from common.tracing import tracer
+from common import governor, providers
+from db.segment_store import iter_records
+
+
+# 提示词库里的 task -> 素材类型与扩展名
+REPLAY_KINDS = {"image": ".png", "video": ".mp4"}
+
+
+def scan_prompts(
+    prompt_db: str,
+    levels: List[str] = None,
+    tasks: List[str] = None,
+    engines: List[str] = None,
+    since: str = None,
+    until: str = None
+) -> List[Dict[str, Any]]:
+    """
+    扫描提示词库（逐文件 JSON 与分段存储），按等级 / 任务 / 引擎 / 创建日期筛选，按创建时间升序返回
+    since / until 写成 "2025-01-01" 或 "2025-01-01 12:00:00"，until 按前缀比较（含当天）
+    """
+    engines = {e.lower() for e in engines} if engines else None
+    records = []
+    for path, data in iter_records(prompt_db):
+        try:
+            meta, prompt = data["metadata"], data["payload"]["prompt"]
+        except (KeyError, TypeError) as e:
+            print(f"⚠️ 跳过无法解析的提示词记录 {path}: {e}")
+            continue
+
+        created_at = meta.get("created_at") or ""
+        if levels and meta.get("student_level") not in levels:
+            continue
+        if tasks and meta.get("task") not in tasks:
+            continue
+        if engines is not None and str(meta.get("engine", "")).lower() not in engines:
+            continue
+        if since and created_at < since:
+            continue
+        if until and created_at[:len(until)] > until:
+            continue
+        if not prompt:
+            continue
+        records.append({
+            "path": path,
+            "level": meta.get("student_level"),
+            "task": meta.get("task"),
+            "engine": meta.get("engine"),
+            "run_id": meta.get("run_id"),
+            "created_at": created_at,
+            "prompt": prompt
+        })
+    records.sort(key=lambda r: (r["created_at"], r["path"]))
+    return records
+
+
+def prompt_hash(kind: str, prompt: str, params: Dict[str, Any]) -> str:
+    raw = json.dumps({"kind": kind, "prompt": prompt.strip(), "params": params},
+                     ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class PromptReplayer:
+    """
+    按提示词库批量重新生成素材（服务中断后补图、切换画幅后重出全部图片等）
+    - 图片、视频各走一个有界线程池，视频任务共用一个 SeedanceTaskPoller 轮询
+    - 输出按 hash(类型 + 提示词 + 生成参数) 寻址：output_dir/<类型>/<hash 前两位>/<hash>.png，
+      文件已存在即跳过，同一提示词在参数不变时只生成一次，中断后重跑只补缺失部分
+    """
+
+    def __init__(
+        self,
+        keys: Dict[str, str],
+        output_dir: str = os.path.join("storage", "replay"),
+        lesson_index=None,
+        image_workers: int = 2,
+        video_workers: int = 2,
+        image_n: int = 1,
+        image_sizes: List[str] = None,
+        video_poll_interval: float = 5.0
+    ):
+        self.keys = keys
+        self.output_dir = output_dir
+        self.lesson_index = lesson_index
+        self.workers = {"image": max(1, image_workers), "video": max(1, video_workers)}
+        self.image_n = image_n
+        self.image_sizes = image_sizes
+        self.video_poll_interval = video_poll_interval
+        self._image_gen = None
+        self._video_poller = None
+        self._lock = threading.Lock()
+
+    # =====================================================
+    # 输出寻址
+    # =====================================================
+    def params(self, kind: str) -> Dict[str, Any]:
+        """
+        参与寻址的生成参数：改了候选数量 / 画幅后会得到新的 hash，旧素材保留
+        """
+        if kind == "image":
+            return {"model": "wan2.5-t2i-preview", "n": self.image_n, "sizes": self.image_sizes or ["1:1"]}
+        return {"model": "doubao-seedance-1-5-pro-251215"}
+
+    def output_path(self, kind: str, key: str) -> str:
+        return os.path.join(self.output_dir, kind, key[:2], f"{key}{REPLAY_KINDS[kind]}")
+
+    # =====================================================
+    # 生成器（按需创建：只重放图片时不导入 Ark SDK）
+    # =====================================================
+    def _image(self):
+        with self._lock:
+            if self._image_gen is None:
+                self._image_gen = providers.create("image", api_key=self.keys["QWEN"])
+            return self._image_gen
+
+    def _poller(self):
+        with self._lock:
+            if self._video_poller is None:
+                from multimodal.seedance_poller import SeedanceTaskPoller
+
+                self._video_poller = SeedanceTaskPoller(
+                    providers.create("video", api_key=self.keys["ARK_KEY"]),
+                    state_path=os.path.join(self.output_dir, "seedance_pending.json"),
+                    min_interval=self.video_poll_interval
+                )
+            return self._video_poller
+
+    def _render(self, kind: str, record: Dict[str, Any], staging: str) -> List[str]:
+        """
+        在临时目录里生成，返回按排名排列的文件列表
+        """
+        level, prompt, run_id = record["level"], record["prompt"], record["run_id"]
+        if kind == "image":
+            if self.image_n <= 1 and not self.image_sizes:
+                path = self._image().execute_generation(prompt, level, staging, run_id)
+                return [path] if path else []
+            variants = self._image().generate_variants(
+                prompt, level, staging, self.image_n, self.image_sizes, run_id)
+            return [v["path"] for v in variants]
+        path = self._poller().submit(prompt, level, staging).result()
+        return [path] if path else []
+
+    def replay_one(self, record: Dict[str, Any], force: bool = False) -> Dict[str, Any]:
+        kind = record["task"]
+        key = prompt_hash(kind, record["prompt"], self.params(kind))
+        dest = self.output_path(kind, key)
+        result = {"prompt_path": record["path"], "kind": kind, "hash": key, "path": dest,
+                  "status": "skipped", "error": None, "elapsed": 0.0}
+        if os.path.exists(dest) and not force:
+            return result
+
+        staging = os.path.join(os.path.dirname(dest), f".{key}.tmp")
+        start = time.time()
+        try:
+            paths = self._render(kind, record, staging)
+            if not paths:
+                raise RuntimeError("生成器未返回结果")
+            # 其余候选先落位，排名第一的最后 replace：dest 存在即表示该提示词已完整生成
+            base, ext = os.path.splitext(dest)
+            for rank, path in enumerate(paths[1:], 2):
+                os.replace(path, f"{base}_{rank}{ext}")
+            os.replace(paths[0], dest)
+            result["status"] = "done"
+            if self.lesson_index is not None:
+                self.lesson_index.add_media(dest, kind=kind, run_id=record["run_id"], level=record["level"],
+                                            prompt_path=record["path"])
+        except Exception as e:
+            result.update(status="failed", error=str(e))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+            result["elapsed"] = round(time.time() - start, 3)
+        return result
+
+    # =====================================================
+    # 批量执行 + 进度 / 吞吐
+    # =====================================================
+    def run(self, records: List[Dict[str, Any]], force: bool = False, report_path: str = None) -> Dict[str, Any]:
+        jobs = {kind: [] for kind in REPLAY_KINDS}
+        seen = set()
+        duplicates = 0
+        for r in records:
+            if r["task"] not in jobs:
+                print(f"⚠️ 不支持重放的任务类型 {r['task']}: {r['path']}")
+                continue
+            # 同一提示词多次入库时只生成一次（输出路径相同，并发写会互相覆盖）
+            key = prompt_hash(r["task"], r["prompt"], self.params(r["task"]))
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            jobs[r["task"]].append(r)
+        total = sum(len(v) for v in jobs.values())
+        print(f"🔁 重放开始：图片 {len(jobs['image'])} 条 / 视频 {len(jobs['video'])} 条"
+              f"（重复提示词 {duplicates} 条已合并），并发 {self.workers}，输出 {self.output_dir}")
+
+        for provider, kind in (("wanx", "image"), ("ark", "video")):
+            if jobs[kind]:
+                governor.configure(provider, concurrency=self.workers[kind])
+
+        start = time.time()
+        results: List[Dict[str, Any]] = []
+        counts = {"done": 0, "skipped": 0, "failed": 0}
+        progress_lock = threading.Lock()
+
+        def worker(record: Dict[str, Any]):
+            r = self.replay_one(record, force)
+            with progress_lock:
+                results.append(r)
+                counts[r["status"]] += 1
+                self._print_progress(r, len(results), total, counts, time.time() - start)
+
+        # 图片与视频各一个线程池，同时推进，互不占用名额
+        pools = {
+            kind: ThreadPoolExecutor(max_workers=self.workers[kind], thread_name_prefix=f"replay-{kind}")
+            for kind in REPLAY_KINDS if jobs[kind]
+        }
+        try:
+            for kind, pool in pools.items():
+                for record in jobs[kind]:
+                    pool.submit(worker, record)
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True)
+            if self._video_poller is not None:
+                self._video_poller.shutdown()
+
+        elapsed = time.time() - start
+        summary = {
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "total": total,
+            **counts,
+            "duplicates": duplicates,
+            "elapsed": round(elapsed, 3),
+            "per_minute": round(counts["done"] / elapsed * 60, 2) if elapsed > 0 else 0.0,
+            "workers": self.workers,
+            "output_dir": self.output_dir,
+            "stages": tracer.summary(since=start),
+            "results": results
+        }
+        if report_path is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            report_path = os.path.join(self.output_dir, f"replay_report_{timestamp}.json")
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        print(f"\n📊 重放完成：生成 {counts['done']} / 跳过 {counts['skipped']} / 失败 {counts['failed']}，"
+              f"总耗时 {summary['elapsed']} 秒，吞吐 {summary['per_minute']} 条/分钟")
+        print(f"📝 报告已保存至：{report_path}")
+        return summary
+
+    @staticmethod
+    def _print_progress(r: Dict[str, Any], finished: int, total: int, counts: Dict[str, int],
+                        elapsed: float) -> None:
+        mark = {"done": "✅", "skipped": "⏭️", "failed": "❌"}[r["status"]]
+        rate = counts["done"] / elapsed * 60 if elapsed > 0 else 0.0
+        # 剩余时间按已完成（含跳过）的平均耗时估算
+        eta = elapsed / finished * (total - finished) if finished else 0.0
+        print(f"{mark} [{finished}/{total}] {r['kind']} {r['hash'][:12]} "
+              f"| 生成 {counts['done']} 跳过 {counts['skipped']} 失败 {counts['failed']} "
+              f"| {rate:.1f} 条/分钟，预计剩余 {eta:.0f} 秒"
+              f"{'' if r['status'] != 'failed' else ' - ' + str(r['error'])}")
+
+
+def replay_prompts(
+    keys: Dict[str, str],
+    prompt_db: str,
+    filters: Optional[Dict[str, Any]] = None,
+    force: bool = False,
+    report_path: str = None,
+    **replayer_options
+) -> Dict[str, Any]:
+    """
+    filters 透传给 scan_prompts（levels、tasks、engines、since、until），
+    replayer_options 透传给 PromptReplayer（output_dir、lesson_index、image_workers…）
+    """
+    records = scan_prompts(prompt_db, **(filters or {}))
+    if not records:
+        print("⚠️ 没有符合条件的提示词，未执行任何任务。")
+        return None
+    return PromptReplayer(keys, **replayer_options).run(records, force=force, report_path=report_path)
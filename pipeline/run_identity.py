@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# 目录名里不能出现的字符（含 Windows 保留字符）与空白统一替换成下划线
+UNSAFE_RE = re.compile(r'[\\/:*?"<>|#\s]+')
+MANIFEST_NAME = "manifest.json"
+ASSET_KINDS = {".png": "image", ".jpg": "image", ".mp3": "audio", ".mp4": "video"}
+
+
+def slug(text: str, limit: int = 10) -> str:
+    return UNSAFE_RE.sub("_", (text or "").strip())[:limit].strip("_") or "_"
+
+
+class RunIdAllocator:
+    """
+    运行 ID：<秒级时间戳>_<微秒><进程标记>_<等级>_<主题前 10 字>
+    - 同一进程内严格递增（同一微秒内连续申请时顺延 1 微秒），批量 / 服务的并发课程不会撞名
+    - 进程标记由 pid 与随机数混合，不同进程同一时刻申请也不会相同
+    - 以时间戳开头，按名字排序即按创建时间排序，LessonIndex 的时间戳关联规则照常适用
+    """
+
+    def __init__(self):
+        self._last = 0
+        self._lock = threading.Lock()
+        self._tag = f"{(os.getpid() ^ random.getrandbits(16)) & 0xffff:04x}"
+
+    def next(self, level: str, topic: str) -> str:
+        with self._lock:
+            now = max(time.time_ns() // 1000, self._last + 1)
+            self._last = now
+        stamp = datetime.fromtimestamp(now // 1_000_000).strftime("%Y%m%d_%H%M%S")
+        return f"{stamp}_{now % 1_000_000:06d}{self._tag}_{slug(level)}_{slug(topic)}"
+
+
+_allocator = RunIdAllocator()
+
+
+def new_run_id(level: str, topic: str) -> str:
+    return _allocator.next(level, topic)
+
+
+def shard(run_id: str, depth: int = 2) -> Tuple[str, ...]:
+    """
+    按 run_id 的哈希取两级分片目录（每级 256 个），几万次运行时单个目录也只有几百项
+    """
+    digest = hashlib.sha1(run_id.encode("utf-8")).hexdigest()
+    return tuple(digest[i * 2:i * 2 + 2] for i in range(depth))
+
+
+def run_dir(output_root: str, run_id: str) -> str:
+    return os.path.join(output_root, *shard(run_id), run_id)
+
+
+def file_checksum(path: str, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RunManifest:
+    """
+    每次运行目录下的 manifest.json：列出全部素材（相对路径、大小、sha256、生成耗时），
+    以及教案 / 提示词的来源引用与各阶段耗时，可据此校验、打包或迁移一次运行的全部产物
+    """
+
+    def __init__(self, run_dir: str, data: Dict[str, Any]):
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, MANIFEST_NAME)
+        self.data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, run_dir: str, run_id: str = None, level: str = None, topic: str = None) -> "RunManifest":
+        """
+        读取已有清单（续跑 / 单阶段重做时追加），不存在时新建
+        """
+        path = os.path.join(run_dir, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(run_dir, json.load(f))
+        return cls(run_dir, {
+            "run_id": run_id or os.path.basename(os.path.normpath(run_dir)),
+            "level": level,
+            "topic": topic,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "sources": {},
+            "timings": {},
+            "assets": []
+        })
+
+    @classmethod
+    def load(cls, run_dir: str) -> Optional["RunManifest"]:
+        return cls.open(run_dir) if os.path.exists(os.path.join(run_dir, MANIFEST_NAME)) else None
+
+    def add_asset(self, kind: str, path: str, elapsed: float = None, **extra) -> Dict[str, Any]:
+        """
+        登记一个素材；同一文件重复登记时覆盖原条目（重新生成后大小与校验和随之更新）
+        """
+        rel = os.path.relpath(path, self.run_dir).replace("\\", "/")
+        entry = {
+            "kind": kind,
+            "file": rel,
+            "bytes": os.path.getsize(path),
+            "sha256": file_checksum(path),
+            "elapsed": elapsed,
+            "created_at": datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S"),
+            **extra
+        }
+        with self._lock:
+            self.data["assets"] = [a for a in self.data["assets"] if a["file"] != rel] + [entry]
+        return entry
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """
+        补登目录中尚未列出的素材（多候选模式下排名靠后的图片等），返回新增条目
+        """
+        listed = {a["file"] for a in self.data["assets"]}
+        added = []
+        for name in sorted(os.listdir(self.run_dir)):
+            kind = ASSET_KINDS.get(os.path.splitext(name)[1].lower())
+            if kind and name not in listed:
+                added.append(self.add_asset(kind, os.path.join(self.run_dir, name)))
+        return added
+
+    def set_source(self, name: str, ref: str) -> None:
+        with self._lock:
+            self.data["sources"][name] = ref
+
+    def set_timing(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.data["timings"][stage] = seconds
+
+    def verify(self) -> List[str]:
+        """
+        重新计算校验和，返回缺失或内容不一致的文件
+        """
+        bad = []
+        for a in self.data["assets"]:
+            path = os.path.join(self.run_dir, a["file"])
+            if not os.path.exists(path) or file_checksum(path) != a["sha256"]:
+                bad.append(a["file"])
+        return bad
+
+    def save(self) -> str:
+        os.makedirs(self.run_dir, exist_ok=True)
+        with self._lock:
+            self.data["updated_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.data["total_bytes"] = sum(a["bytes"] for a in self.data["assets"])
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        return self.path
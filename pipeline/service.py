@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+from pipeline.batch_runner import BatchLessonRunner
+from pipeline.job_queue import JobQueue
+from pipeline.bundle import BUNDLE_FORMATS, BundleExporter
+from common.tracing import tracer
+
+
+class LessonService:
+    """
+    常驻服务：启动时一次性导入各 SDK 并建好客户端（Qwen / WanX / 讯飞连接池 / Seedance 轮询器），
+    之后通过本地 HTTP 接口接收课程任务，写入持久化队列，由 lessons 个工作线程处理；
+    各阶段并发仍由 BatchLessonRunner 的阶段信号量与服务商 governor 控制
+
+    接口：
+      POST /jobs            {"level": "二级", "topic": "买水果"} 或 {"jobs": [...]}，返回 202
+      GET  /jobs            ?status=queued&limit=50
+      GET  /jobs/<id>       任务状态、run_id、素材路径与各阶段耗时
+      GET  /runs/<run_id>/bundle?format=zip|tar  流式下载课程包（教案、提示词、素材与 manifest）
+      GET  /health          队列计数与运行时长
+      GET  /metrics         Prometheus 文本快照
+    """
+
+    def __init__(self, runner: BatchLessonRunner, queue: JobQueue, host: str = "127.0.0.1", port: int = 8765):
+        self.runner = runner
+        self.queue = queue
+        self.exporter = BundleExporter(runner.output_root)
+        self.started_at = time.time()
+        self._stopped = threading.Event()
+        self._workers: List[threading.Thread] = []
+        # 已交给视频轮询器、尚未收尾的课程数
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+
+        handler = type("BoundServiceHandler", (_ServiceHandler,), {"service": self})
+        self._http = ThreadingHTTPServer((host, port), handler)
+        self._http.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._http.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # =====================================================
+    # 生命周期
+    # =====================================================
+    def start(self) -> "LessonService":
+        self.runner.video_poller.resume()
+        for i in range(max(1, self.runner.limits["lessons"])):
+            t = threading.Thread(target=self._work, name=f"lesson-worker-{i + 1}", daemon=True)
+            t.start()
+            self._workers.append(t)
+        t = threading.Thread(target=self._http.serve_forever, name="lesson-http", daemon=True)
+        t.start()
+        print(f"🚀 课程生成服务已启动：{self.url}（工作线程 {len(self._workers)}，并发配置 {self.runner.limits}）")
+        return self
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            while not self._stopped.is_set():
+                self._stopped.wait(1.0)
+        except KeyboardInterrupt:
+            print("\n⏹️ 正在停止服务（进行中的课程完成后退出）...")
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._http.shutdown()
+        self._http.server_close()
+        self.queue.wake_all()
+        for t in self._workers:
+            t.join()
+        with self._pending_cond:
+            if self._pending:
+                print(f"⏳ 等待 {self._pending} 节课的视频完成...")
+            while self._pending:
+                self._pending_cond.wait()
+        self.runner.video_poller.shutdown()
+        self.runner.tts.close()
+        self.queue.close()
+
+    # =====================================================
+    # 工作线程
+    # =====================================================
+    def _work(self) -> None:
+        while not self._stopped.is_set():
+            job = self.queue.claim(timeout=1.0)
+            if job is None:
+                continue
+            print(f"▶ 任务 #{job['id']} {job['level']} · {job['topic'][:20]}")
+            try:
+                # 做完视频提交即返回，工作线程接着处理下一个任务，视频完成后由回调结束本任务
+                future = self.runner.start_lesson(job["id"], job["level"], job["topic"])
+            except Exception as e:  # start_lesson 自身已兜底，这里防止工作线程意外退出
+                self._finish_job(job, {"success": False, "error": str(e)})
+                continue
+            with self._pending_cond:
+                self._pending += 1
+            future.add_done_callback(lambda f, job=job: self._finish_job(job, f.result(), pending=True))
+
+    def _finish_job(self, job: Dict[str, Any], report: Dict[str, Any], pending: bool = False) -> None:
+        self.queue.finish(job["id"], report)
+        if pending:
+            with self._pending_cond:
+                self._pending -= 1
+                self._pending_cond.notify_all()
+        mark = "✅" if report.get("success") else "❌"
+        print(f"{mark} 任务 #{job['id']} 完成{'' if report.get('success') else ' - ' + str(report.get('error'))}")
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "stopping" if self._stopped.is_set() else "ok",
+            "uptime": round(time.time() - self.started_at, 1),
+            "workers": len(self._workers),
+            "limits": self.runner.limits,
+            "jobs": self.queue.counts(),
+            "video_pending": self.runner.video_poller.pending_count()
+        }
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    service: LessonService = None
+
+    def log_message(self, *args):
+        pass
+
+    # ---------- 工具 ----------
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, obj: Any, status: int = 200) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # ---------- 路由 ----------
+    def do_POST(self):
+        if urlparse(self.path).path != "/jobs":
+            return self._send_json({"error": "not found"}, 404)
+        try:
+            req = self._read_json()
+        except ValueError:
+            return self._send_json({"error": "请求体不是合法 JSON"}, 400)
+        if not isinstance(req, dict):
+            return self._send_json({"error": "请求体必须是 JSON 对象"}, 400)
+
+        items = req.get("jobs") if isinstance(req.get("jobs"), list) else [req]
+        rows = []
+        for item in items:
+            if not isinstance(item, dict):
+                return self._send_json({"error": "每个任务都必须是 JSON 对象"}, 400)
+            level = str(item.get("level") or item.get("student_level") or "").strip()
+            topic = str(item.get("topic") or item.get("content") or "").strip()
+            if not level or not topic:
+                return self._send_json({"error": "每个任务都需要 level 与 topic"}, 400)
+            rows.append((level, topic))
+
+        jobs = [self.service.queue.submit(level, topic) for level, topic in rows]
+        self._send_json(jobs[0] if "jobs" not in req else {"jobs": jobs}, 202)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        if path == "/health":
+            return self._send_json(self.service.health())
+        if path == "/metrics":
+            body = tracer.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path == "/jobs":
+            query = parse_qs(url.query)
+            status = query.get("status", [None])[0]
+            try:
+                limit = int(query.get("limit", ["100"])[0])
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                return self._send_json({"error": "limit 必须是正整数"}, 400)
+            return self._send_json({"jobs": self.service.queue.list(status, limit)})
+        if path.startswith("/runs/") and path.endswith("/bundle"):
+            return self._send_bundle(unquote(path[len("/runs/"):-len("/bundle")]), parse_qs(url.query))
+        if path.startswith("/jobs/"):
+            job_id = path.rsplit("/", 1)[-1]
+            job = self.service.queue.get(int(job_id)) if job_id.isdigit() else None
+            if job is None:
+                return self._send_json({"error": "任务不存在"}, 404)
+            return self._send_json(job)
+        self._send_json({"error": "not found"}, 404)
+
+    def _send_bundle(self, run_id: str, query: Dict[str, List[str]]) -> None:
+        fmt = query.get("format", ["zip"])[0]
+        # run_id 只能是单级目录名，不允许 ../ 之类跳出素材根目录
+        if fmt not in BUNDLE_FORMATS or not run_id or run_id.startswith(".") or any(c in run_id for c in "/\\"):
+            return self._send_json({"error": "参数错误"}, 400)
+        try:
+            self.service.exporter.locate(run_id)
+        except FileNotFoundError:
+            return self._send_json({"error": "运行不存在"}, 404)
+        # 包大小事先未知：不写 Content-Length，HTTP/1.0 下写完即关闭连接
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip" if fmt == "zip" else "application/x-tar")
+        self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(run_id)}{BUNDLE_FORMATS[fmt]}")
+        self.end_headers()
+        self.service.exporter.write([run_id], self.wfile, fmt)
+
+
+def build_service(
+    keys: Dict[str, str],
+    lesson_db: str,
+    prompt_db: str,
+    output_root: str,
+    jobs_db: str = os.path.join("storage", "jobs.db"),
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    **runner_options
+) -> LessonService:
+    """
+    runner_options 透传给 BatchLessonRunner（limits、cache、use_cache、lesson_index、image_n…）
+    """
+    runner = BatchLessonRunner(keys, lesson_db, prompt_db, output_root, **runner_options)
+    return LessonService(runner, JobQueue(jobs_db), host, port)
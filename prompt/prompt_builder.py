@@ -1,7 +1,12 @@
 import os
 import re  # 必须导入正则模块
 from openai import OpenAI
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+from llm.response_cache import ResponseCache
+from common.tracing import tracer
+from common.governor import get_governor
 
 class MultimodalPromptBuilder:
     """
@@ -9,12 +14,42 @@ class MultimodalPromptBuilder:
     利用 Qwen 模型为文生图 (WanX) 和 文生视频 (Seedance) 生成专业提示词
     """
 
-    def __init__(self, api_key: str, model: str = "qwen3-max"):
+    # 合并生成（generate_many）时各任务的标记名称与要求
+    TASK_SPECS = {
+        "image": {
+            "label": "图片",
+            "engine": "文生图",
+            "rules": (
+                "1. 提示词公式：内容主体（课文内容场景）+ 话题内容 + 图片风格 + 分辨率和比例。\n"
+                "2. 所有图片的分辨率要求：不得低于150dpi。\n"
+                "3. 色彩要求：彩色图片的颜色数不低于真彩（16位），灰度图片的灰度级不低于128级。"
+            )
+        },
+        "video": {
+            "label": "视频",
+            "engine": "文生视频",
+            "rules": (
+                "1. 提示词公式为：内容主体+场景空间+运动/变化+镜头运动+美感氛围。\n"
+                "2. 镜头稳定无抖动，横屏拍摄，音画同步，人物清晰。动画色彩造型和谐、帧与帧之间关联性强，"
+                "静止画面时间不超过5秒钟。彩色视频每帧图片颜色数不低于256色，黑白不低于128级。\n"
+                "3. 音频与视频有良好同步，音频中要完整包含课文内容。"
+            )
+        }
+    }
+
+    def __init__(self, api_key: str, model: str = "qwen3-max", cache: ResponseCache = None, base_url: str = None,
+                 governor=None):
+        # 可通过参数或 DASHSCOPE_BASE_URL 指向其他兼容端点（如本地 mock）
+        # 重试统一交给 governor，关闭 SDK 自带的重试以免叠加
         self.client = OpenAI(
             api_key=api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+            base_url=base_url or os.getenv(
+                "DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
+            max_retries=0
         )
         self.model = model
+        self.cache = cache
+        self.governor = governor or get_governor("qwen")
 
     def _clean_prompt(self, raw_text: str) -> str:
         """
@@ -26,7 +61,36 @@ class MultimodalPromptBuilder:
             return match.group(1).strip()
         return raw_text.strip()  # 如果模型没按格式给标记，则返回全部内容以防报错
 
-    def generate(self, task_type: str, student_level: str, lesson_text: str) -> str:
+    def _complete(self, messages: List[Dict[str, str]], use_cache: bool, task: str) -> str:
+        """
+        调用模型（或缓存）并记录 llm.prompt span，未命中缓存时的 usage 计入追踪汇总
+        """
+        with tracer.span("llm.prompt", task=task, model=self.model) as sp:
+            if self.cache is not None:
+                raw_content, usage, cached = self.cache.completion(
+                    self.client, self.model, messages, use_cache=use_cache, governor=self.governor,
+                    temperature=0.7
+                )
+            else:
+                completion = self.governor.call(
+                    self.client.chat.completions.create,
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.7
+                )
+                raw_content = completion.choices[0].message.content
+                usage = {
+                    "prompt_tokens": completion.usage.prompt_tokens,
+                    "completion_tokens": completion.usage.completion_tokens,
+                    "total_tokens": completion.usage.total_tokens
+                }
+                cached = False
+            sp.set(cached=cached)
+            if not cached:
+                sp.set(**usage)
+            return raw_content
+
+    def generate(self, task_type: str, student_level: str, lesson_text: str, use_cache: bool = True) -> str:
         if task_type == "image":
             system_prompt = (
                 """你是一名优秀的国际中文教师，你也是一名优秀的提示词写作专家，可以为文生图大模型写出清晰、完整的提示词。
@@ -46,17 +110,89 @@ class MultimodalPromptBuilder:
 
         user_prompt = f"学生等级：{student_level}\n课文内容：{lesson_text}\n\n请根据上述内容生成最适合教学的{task_type}提示词。"
 
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+        # 重试耗尽后直接抛出异常，避免把错误信息当作提示词交给 WanX / Seedance
+        raw_content = self._complete(messages, use_cache, task_type)
+        prompt = self._clean_prompt(raw_content)
+        if not prompt:
+            raise ValueError(f"模型未返回{task_type}提示词")
+        return prompt
+
+    # =====================================================
+    # 单次调用同时生成多种提示词
+    # =====================================================
+    def _extract_tagged(self, raw_text: str, label: str) -> str:
+        """
+        与 _clean_prompt 相同的提取方式，只是标记带任务名，如【图片提示词开始】…【图片提示词结束】
+        """
+        pattern = rf"【{label}提示词开始】([\s\S]*?)【{label}提示词结束】"
+        match = re.search(pattern, raw_text)
+        return match.group(1).strip() if match else ""
+
+    def generate_many(
+        self,
+        task_types: List[str],
+        student_level: str,
+        lesson_text: str,
+        use_cache: bool = True
+    ) -> Dict[str, str]:
+        """
+        一次请求同时生成多种提示词（课文只发送一次），返回 {task_type: prompt}
+        模型漏掉某个标记时，缺失的类型退回到并行的单独 generate 调用
+        """
+        task_types = list(dict.fromkeys(task_types))
+        if len(task_types) == 1 or any(t not in self.TASK_SPECS for t in task_types):
+            return self._generate_each(task_types, student_level, lesson_text, use_cache)
+
+        specs = [self.TASK_SPECS[t] for t in task_types]
+        engines = "、".join(spec["engine"] for spec in specs)
+        sections = "\n\n".join(
+            f"【{spec['label']}提示词要求】（{spec['engine']}）\n{spec['rules']}\n"
+            f"使用【{spec['label']}提示词开始】【{spec['label']}提示词结束】作为{spec['label']}提示词实际内容的标记。"
+            for spec in specs
+        )
+        system_prompt = (
+            f"你是一名优秀的国际中文教师，你也是一名优秀的提示词写作专家，可以为{engines}大模型写出清晰、完整的提示词。\n"
+            f"请针对同一篇课文，分别写出以下每一种提示词，每种提示词必须用各自的标记包裹，不得遗漏。\n\n"
+            f"{sections}"
+        )
+        labels = "、".join(spec["label"] for spec in specs)
+        user_prompt = f"学生等级：{student_level}\n课文内容：{lesson_text}\n\n请根据上述内容生成最适合教学的{labels}提示词。"
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+        results: Dict[str, str] = {}
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7
-            )
-            raw_content = completion.choices[0].message.content
-            # 这里的 self._clean_prompt 现在已经定义好了
-            return self._clean_prompt(raw_content)
+            raw_content = self._complete(messages, use_cache, "+".join(task_types))
+
+            for task_type, spec in zip(task_types, specs):
+                prompt = self._extract_tagged(raw_content, spec["label"])
+                if prompt:
+                    results[task_type] = prompt
         except Exception as e:
-            return f"Error: {str(e)}"
\ No newline at end of file
+            print(f"⚠️ 合并生成提示词失败，改为分别生成: {e}")
+
+        missing = [t for t in task_types if t not in results]
+        if missing:
+            results.update(self._generate_each(missing, student_level, lesson_text, use_cache))
+        return {t: results[t] for t in task_types}
+
+    def _generate_each(
+        self,
+        task_types: List[str],
+        student_level: str,
+        lesson_text: str,
+        use_cache: bool
+    ) -> Dict[str, str]:
+        if len(task_types) <= 1:
+            return {t: self.generate(t, student_level, lesson_text, use_cache) for t in task_types}
+        with ThreadPoolExecutor(max_workers=len(task_types), thread_name_prefix="prompt") as pool:
+            futures = {t: pool.submit(self.generate, t, student_level, lesson_text, use_cache) for t in task_types}
+            return {t: f.result() for t, f in futures.items()}
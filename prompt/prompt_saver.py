@@ -4,11 +4,14 @@ from datetime import datetime
 
 
 class PromptSaver:
-    def __init__(self, base_dir: str):
+    def __init__(self, base_dir: str, index=None, store=None):
         self.base_dir = base_dir
+        self.index = index  # 可选 LessonIndex，保存时同步写入索引
+        self.store = store  # 可选 SegmentStore，设置后追加到分段存储，返回 "<base_dir>#<id>" 引用
         os.makedirs(self.base_dir, exist_ok=True)
 
-    def save(self, task_type: str, model_name: str, student_level: str, lesson_text: str, pure_prompt: str) -> str:
+    def save(self, task_type: str, model_name: str, student_level: str, lesson_text: str, pure_prompt: str,
+             run_id: str = None) -> str:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         file_name = f"{timestamp}_{task_type}_{model_name}.json"
         save_path = os.path.join(self.base_dir, file_name)
@@ -18,7 +21,8 @@ class PromptSaver:
                 "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "student_level": student_level,
                 "task": task_type,
-                "engine": model_name
+                "engine": model_name,
+                "run_id": run_id
             },
             "payload": {
                 "lesson_source": lesson_text,
@@ -26,7 +30,13 @@ class PromptSaver:
             }
         }
 
-        with open(save_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        if self.store is not None:
+            save_path = self.store.ref(self.store.put(data, name=file_name))
+        else:
+            with open(save_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+
+        if self.index is not None:
+            self.index.add_prompt(data, save_path, run_id)
 
         return save_path
\ No newline at end of file
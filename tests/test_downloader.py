@@ -0,0 +1,85 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from common.downloader import Downloader
+from common.governor import ProviderGovernor
+
+
+PAYLOAD = hashlib.sha256(b"lesson").digest() * 32 * 1024  # 1 MB
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    drop_after = None  # 首次请求发送这么多字节后断开连接
+    ranges = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start = 0
+        rng = self.headers.get("Range")
+        type(self).ranges.append(rng)
+        if rng:
+            start = int(rng[len("bytes="):].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD) - start))
+        self.end_headers()
+        body = PAYLOAD[start:]
+        if type(self).drop_after is not None:
+            body, type(self).drop_after = body[:type(self).drop_after], None
+            self.wfile.write(body)
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    handler = type("Handler", (_RangeHandler,), {"drop_after": None, "ranges": []})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{httpd.server_address[1]}/file.bin"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _downloader() -> Downloader:
+    return Downloader(chunk_size=64 * 1024, governor=ProviderGovernor("test", qps=1000, burst=1000, base_delay=0.01))
+
+
+def test_stale_part_file_is_discarded(server, tmp_path):
+    handler, url = server
+    dest = str(tmp_path / "a.png")
+    with open(f"{dest}.part", "wb") as f:
+        f.write(b"\x00" * 500 * 1024)  # 之前崩溃的进程留下的残片
+
+    result = _downloader().download(url, dest, sha256=hashlib.sha256(PAYLOAD).hexdigest())
+    assert handler.ranges == [None]
+    assert result["bytes"] == len(PAYLOAD) and result["resumes"] == 0
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert not os.path.exists(f"{dest}.part")
+
+
+def test_resume_after_mid_transfer_drop(server, tmp_path):
+    handler, url = server
+    handler.drop_after = 300 * 1024
+    dest = str(tmp_path / "b.mp4")
+
+    result = _downloader().download(url, dest)
+    assert len(handler.ranges) == 2 and handler.ranges[0] is None
+    # 第二次请求从已落盘的整块之后续传（最后不完整的块会被丢弃）
+    offset = int(handler.ranges[1][len("bytes="):-1])
+    assert 0 < offset <= 300 * 1024
+    assert result["resumes"] == 1
+    with open(dest, "rb") as f:
+        assert f.read() == PAYLOAD
@@ -0,0 +1,135 @@
+import time
+
+import pytest
+
+from common import governor as gov
+from common.governor import CircuitBreaker, CircuitOpenError, ProviderError, ProviderGovernor, is_retryable
+
+
+class _Response:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class _HTTPError(Exception):
+    def __init__(self, status_code: int, headers: dict = None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = _Response(status_code, headers)
+
+
+class ReadTimeout(Exception):
+    """
+    模拟 SDK 自带的超时异常类型（按类名识别）
+    """
+
+
+def _governor(**policy) -> ProviderGovernor:
+    options = dict(qps=1000, burst=1000, concurrency=4, retries=2, base_delay=0.01, max_delay=0.05)
+    options.update(policy)
+    return ProviderGovernor("test", **options)
+
+
+def test_retryable_classification():
+    for code in (408, 429, 500, 502, 503, 504, 599):
+        assert is_retryable(ProviderError("x", status_code=code))
+        assert is_retryable(_HTTPError(code))
+    for code in (400, 401, 403, 404, 422):
+        assert not is_retryable(ProviderError("x", status_code=code))
+        assert not is_retryable(_HTTPError(code))
+    assert is_retryable(TimeoutError())
+    assert is_retryable(ConnectionResetError())
+    assert is_retryable(ReadTimeout())
+    assert not is_retryable(ValueError("bad input"))
+    assert not is_retryable(CircuitOpenError("open"))
+    # 显式 retryable 优先于状态码
+    assert is_retryable(ProviderError("x", status_code=10163, retryable=True))
+    assert not is_retryable(ProviderError("x", status_code=503, retryable=False))
+
+
+def test_retries_only_retryable_errors():
+    g = _governor()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ProviderError("busy", status_code=503)
+        return "ok"
+
+    assert g.call(flaky) == "ok" and len(calls) == 3
+
+    calls.clear()
+
+    def rejected():
+        calls.append(1)
+        raise ProviderError("bad request", status_code=400)
+
+    with pytest.raises(ProviderError):
+        g.call(rejected)
+    assert len(calls) == 1
+
+
+def test_breaker_trips_then_allows_single_half_open_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    assert breaker.allow()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.12)
+    assert breaker.state == "half_open"
+    assert breaker.allow()          # 只放行一次试探
+    assert not breaker.allow()
+    assert breaker.record_failure()  # 试探失败：重新熔断
+    assert breaker.state == "open"
+
+    time.sleep(0.12)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_governor_rejects_while_open_and_recovers_after_probe():
+    g = _governor(retries=0, failure_threshold=2, reset_timeout=0.1)
+
+    def unavailable():
+        raise ProviderError("down", status_code=503)
+
+    def rejected():
+        raise ProviderError("bad request", status_code=400)
+
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            g.call(unavailable)
+    with pytest.raises(CircuitOpenError):
+        g.call(lambda: "ok")
+
+    time.sleep(0.12)
+    # 半开试探遇到不可重试错误也必须结束试探，熔断器不能一直卡住
+    with pytest.raises(ProviderError):
+        g.call(rejected)
+    assert g.call(lambda: "ok") == "ok"
+    assert g.breaker.state == "closed"
+
+
+def test_retry_after_overrides_backoff(monkeypatch):
+    g = _governor(base_delay=0.01, max_delay=30.0)
+    assert g.backoff(0, hint=2.5) >= 2.5
+    # 提示超过 max_delay 时按 max_delay 截断
+    assert g.backoff(0, hint=120.0) == 30.0
+
+    sleeps = []
+    monkeypatch.setattr(gov.time, "sleep", sleeps.append)
+    calls = []
+
+    def throttled():
+        calls.append(1)
+        if len(calls) == 1:
+            raise _HTTPError(429, {"Retry-After": "3"})
+        if len(calls) == 2:
+            raise ProviderError("slow down", status_code=429, retry_after=1.5)
+        return "ok"
+
+    assert g.call(throttled) == "ok"
+    assert sleeps[0] >= 3.0 and sleeps[1] >= 1.5
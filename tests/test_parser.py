@@ -0,0 +1,56 @@
+import json
+import os
+
+from lesson_plan.parser import TeachingPlanParser, parse_vocabulary
+
+
+TEACHING_DB = os.path.join(os.path.dirname(__file__), "..", "storage", "teaching_db")
+
+
+def _load_plan(name: str) -> str:
+    with open(os.path.join(TEACHING_DB, name), "r", encoding="utf-8") as f:
+        return json.load(f)["teaching_plan"]
+
+
+def test_lesson_without_end_tag_stops_at_next_heading():
+    # 该教案只有【课文开始】没有【课文结束】，课文应止于「（三）语法」
+    parser = TeachingPlanParser(_load_plan("三级_teaching_plan_20260208_234559.json"))
+    lesson = parser.extract_lesson_text()
+    assert lesson.startswith("朋友：大山，你和马可谁个子高？")
+    assert lesson.endswith("适用于HSK三级学习者练习日常比较表达。")
+    assert "语法" not in lesson and "教学步骤" not in lesson
+    assert parser.extract_section("语法")
+
+
+def test_numbered_lines_inside_closed_lesson_are_not_headings():
+    text = ("一、教学内容\n（一）生词\n1. 书 shū n. book\n（二）课文\n【课文开始】\n"
+            "一、小明：你好！\n（一）小红：你好！\n【课文结束】\n（三）语法\n比较句\n")
+    parser = TeachingPlanParser(text)
+    assert parser.extract_lesson_text() == "一、小明：你好！\n（一）小红：你好！"
+    assert parser.extract_section("语法") == "比较句"
+
+
+def test_colon_inside_heading_brackets_does_not_split_title():
+    text = ("一、教学内容\n（二）课文\n【课文开始】\n你好！\n【课文结束】\n"
+            "（三）语法（包括：中文解释、英文解释、例句、练习）\n1. 比较句：A 比 B + 形容词\n"
+            "（四）文化：春节习俗\n")
+    doc = TeachingPlanParser(text).document
+    assert doc.section("语法").title == "语法（包括：中文解释、英文解释、例句、练习）"
+    assert doc.section_text("语法") == "1. 比较句：A 比 B + 形容词"
+    # 括号外的冒号仍然把同一行的内容归入正文
+    assert doc.section("文化").title == "文化"
+    assert doc.section_text("文化") == "春节习俗"
+
+
+def test_vocabulary_pinyin_spans_all_syllables():
+    entry = parse_vocabulary("1. 什么（shén me）pron. what")[0]
+    assert (entry.word, entry.pinyin, entry.pos, entry.gloss) == ("什么", "shén me", "pron.", "what")
+
+    entry = parse_vocabulary("呢 ne part.")[0]
+    assert (entry.word, entry.pinyin, entry.pos, entry.gloss) == ("呢", "ne", "part.", "")
+
+    entry = parse_vocabulary("2. 你好 nǐ hǎo int. hello 例句：你好，我是大山。")[0]
+    assert (entry.pinyin, entry.pos, entry.gloss, entry.example) == ("nǐ hǎo", "int.", "hello", "你好，我是大山。")
+
+    entry = parse_vocabulary("3. 书 n. book")[0]
+    assert (entry.pinyin, entry.pos, entry.gloss) == ("", "n.", "book")
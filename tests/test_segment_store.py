@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from db.segment_store import SegmentStore
+
+
+def _segment_files(store: SegmentStore, ext: str):
+    return sorted(os.path.join(store.segment_dir, name)
+                  for name in os.listdir(store.segment_dir) if name.endswith(ext))
+
+
+def test_put_get_delete_last_write_wins(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    a = store.put({"v": 1}, name="a.json")
+    b = store.put({"v": "二"})
+    assert a != b and len(store) == 2
+    assert store.get(a) == {"v": 1} and store.get(b) == {"v": "二"}
+
+    store.put({"v": 3}, record_id=a)
+    assert store.get(a) == {"v": 3} and len(store) == 2
+
+    assert store.delete(b)
+    assert not store.delete(b)
+    assert b not in store
+    with pytest.raises(KeyError):
+        store.get(b)
+    store.close()
+
+    # 重新打开后按写入顺序回放，结果一致
+    reopened = SegmentStore(str(tmp_path))
+    assert reopened.get(a) == {"v": 3} and b not in reopened and len(reopened) == 1
+    reopened.close()
+
+
+def test_scan_tail_recovers_records_missing_from_idx(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    ids = [store.put({"n": i}) for i in range(4)]
+    store.delete(ids[1])
+    store.close()
+
+    # 模拟崩溃：.idx 只写进了第一条，.jsonl 末尾还有一行没写完
+    idx_path = _segment_files(store, ".idx")[0]
+    with open(idx_path, "r", encoding="utf-8") as f:
+        first = f.readline()
+    with open(idx_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(first + ids[1] + "\t12")
+    seg_path = _segment_files(store, ".jsonl")[0]
+    with open(seg_path, "ab") as f:
+        f.write(b'{"id":"20990101_000000_000001_000099","data":{"n"')
+
+    reopened = SegmentStore(str(tmp_path))
+    assert [reopened.get(i) for i in (ids[0], ids[2], ids[3])] == [{"n": 0}, {"n": 2}, {"n": 3}]
+    assert ids[1] not in reopened and len(reopened) == 3
+
+    # 残缺行之后的写入进入新段，不受影响
+    new_id = reopened.put({"n": 4})
+    assert reopened.get(new_id) == {"n": 4}
+    reopened.close()
+
+
+def test_compact_keeps_live_records(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_bytes=200)
+    ids = [store.put({"n": i, "pad": "x" * 40}) for i in range(10)]
+    for i in ids[::3]:
+        store.delete(i)
+    store.put({"n": "new"}, record_id=ids[1])
+    live = {record_id: record for record_id, record in store.scan()}
+    before = store.stats()
+    assert before["segments"] > 1
+
+    result = store.compact()
+    assert result["records"] == len(live) == 6
+    assert result["bytes_after"] < result["bytes_before"]
+    assert dict(store.scan()) == live
+    assert store.get(ids[1]) == {"n": "new"}
+    store.close()
+
+    reopened = SegmentStore(str(tmp_path))
+    assert dict(reopened.scan()) == live
+    reopened.close()
+
+
+def test_export_renames_colliding_names(tmp_path):
+    store = SegmentStore(str(tmp_path / "db"))
+    store.put({"n": 1}, name="plan.json")
+    store.put({"n": 2}, name="plan.json")
+    anonymous = store.put({"n": 3})
+    dest = tmp_path / "out"
+    dest.mkdir()
+    (dest / "plan_2.json").write_text("{}", encoding="utf-8")
+
+    assert store.export(str(dest)) == 3
+    assert sorted(os.listdir(dest)) == sorted(["plan.json", "plan_2.json", "plan_3.json", f"{anonymous}.json"])
+    assert json.loads((dest / "plan.json").read_text(encoding="utf-8")) == {"n": 1}
+    assert json.loads((dest / "plan_3.json").read_text(encoding="utf-8")) == {"n": 2}
+    # 目录里原有的文件不被覆盖
+    assert (dest / "plan_2.json").read_text(encoding="utf-8") == "{}"
+    store.close()